@@ -5,7 +5,7 @@ from .models import ChatMessage
 
 @admin.register(ChatMessage)
 class ChatMessageAdmin(admin.ModelAdmin):
-    list_display = ("user_display", "short_message", "role", "created_at", "colored_role")
+    list_display = ("user_display", "short_message", "role", "ttft_ms", "created_at", "colored_role")
     list_filter = ("role", "created_at")
     search_fields = ("message", "user__username")
     ordering = ("-created_at",)
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assistant', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmessage',
+            name='ttft_ms',
+            field=models.PositiveIntegerField(blank=True, help_text='Respuestas en streaming: ms hasta el primer fragmento', null=True),
+        ),
+    ]
@@ -10,6 +10,9 @@ class ChatMessage(models.Model):
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     role = models.CharField(max_length=20, choices=ROLE_CHOICES)
     message = models.TextField()
+    ttft_ms = models.PositiveIntegerField(
+        null=True, blank=True, help_text="Respuestas en streaming: ms hasta el primer fragmento"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -1,11 +1,20 @@
 """
 Servicio de chat conectado a OpenAI (nueva API 2025).
-Usa el cliente moderno `OpenAI()` y el endpoint `responses.create`.
+Usa el cliente moderno `OpenAI()` y el endpoint `responses.create`
+(respuesta completa con ask() o en fragmentos con stream()).
+
+aask() / astream() son las versiones async (vistas async servidas por ASGI):
+usan `AsyncOpenAI` sobre un httpx.AsyncClient compartido (pool de conexiones
+con límite CHAT_MAX_CONEXIONES), uno por event loop, así esperar a OpenAI no
+ocupa un hilo del servidor. Cada cliente se cierra cuando termina su loop.
 """
 
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 from django.conf import settings
+import asyncio
+import httpx
 import logging
+import weakref
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +27,50 @@ class ChatService:
         # Crea cliente oficial con API key segura desde settings
         self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
         self.model = model
+        self._async_clients = weakref.WeakKeyDictionary()  # event loop → (AsyncOpenAI, tarea que lo cierra)
+
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        """
+        Cliente async del event loop actual (las conexiones de httpx no se pueden
+        compartir entre loops; con ASGI hay uno solo por proceso).
+        """
+        loop = asyncio.get_running_loop()
+        actual = self._async_clients.get(loop)
+        if actual is None:
+            max_conexiones = int(getattr(settings, "CHAT_MAX_CONEXIONES", 100))
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=max_conexiones, max_keepalive_connections=max_conexiones),
+                timeout=httpx.Timeout(float(getattr(settings, "CHAT_TIMEOUT_SEGUNDOS", 60)), connect=10.0),
+            )
+            client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY, http_client=http_client)
+            # la tarea se guarda con el cliente: el loop solo tiene referencias débiles a sus tareas
+            actual = self._async_clients[loop] = (client, loop.create_task(self._cerrar_con_el_loop(client)))
+        return actual[0]
+
+    @staticmethod
+    async def _cerrar_con_el_loop(client: AsyncOpenAI):
+        """
+        Espera hasta que se cancele y cierra el cliente (sus conexiones) en su propio loop.
+        asyncio.run() cancela las tareas pendientes antes de cerrar el loop: pasa al apagar
+        uvicorn y al final de cada async_to_sync (vistas async servidas por WSGI).
+        """
+        try:
+            await asyncio.get_running_loop().create_future()
+        finally:
+            await client.close()
+
+    def _input(self, message: str) -> list:
+        return [
+            {
+                "role": "system",
+                "content": (
+                    "Sos un asistente experto en gestión de facturas, productos y proveedores. "
+                    "Respondé siempre en español y de forma clara y breve."
+                ),
+            },
+            {"role": "user", "content": message},
+        ]
 
     def ask(self, message: str) -> str:
         """
@@ -26,16 +79,50 @@ class ChatService:
         try:
             response = self.client.responses.create(
                 model=self.model,
-                input=[
-                    {
-                        "role": "system",
-                        "content": (
-                            "Sos un asistente experto en gestión de facturas, productos y proveedores. "
-                            "Respondé siempre en español y de forma clara y breve."
-                        ),
-                    },
-                    {"role": "user", "content": message},
-                ],
+                input=self._input(message),
+                temperature=0.4,
+                max_output_tokens=400,
+            )
+
+            reply = response.output_text
+            logger.info(f"[CHAT] {message[:40]}... → {reply[:40]}...")
+            return reply
+
+        except Exception as ex:
+            logger.error(f"Error al consultar OpenAI: {ex}")
+            return f"⚠️ Error al comunicar con OpenAI: {ex}"
+
+    def stream(self, message: str):
+        """
+        Igual que ask(), pero va devolviendo los fragmentos de texto a medida que
+        el modelo los genera (Responses API con stream=True).
+        Lanza la excepción si OpenAI falla (la vista decide cómo informarla).
+        """
+        events = self.client.responses.create(
+            model=self.model,
+            input=self._input(message),
+            temperature=0.4,
+            max_output_tokens=400,
+            stream=True,
+        )
+        try:
+            for event in events:
+                if event.type == "response.output_text.delta":
+                    yield event.delta
+                elif event.type in ("response.failed", "error"):
+                    detalle = getattr(event, "message", None) or getattr(getattr(event, "response", None), "error", None)
+                    raise RuntimeError(f"OpenAI cortó la respuesta: {detalle}")
+        finally:
+            events.close()  # si el navegador se desconecta, se corta también la conexión con OpenAI
+
+    async def aask(self, message: str) -> str:
+        """
+        Versión async de ask().
+        """
+        try:
+            response = await self.async_client.responses.create(
+                model=self.model,
+                input=self._input(message),
                 temperature=0.4,
                 max_output_tokens=400,
             )
@@ -48,5 +135,26 @@ class ChatService:
             logger.error(f"Error al consultar OpenAI: {ex}")
             return f"⚠️ Error al comunicar con OpenAI: {ex}"
 
+    async def astream(self, message: str):
+        """
+        Versión async de stream().
+        """
+        events = await self.async_client.responses.create(
+            model=self.model,
+            input=self._input(message),
+            temperature=0.4,
+            max_output_tokens=400,
+            stream=True,
+        )
+        try:
+            async for event in events:
+                if event.type == "response.output_text.delta":
+                    yield event.delta
+                elif event.type in ("response.failed", "error"):
+                    detalle = getattr(event, "message", None) or getattr(getattr(event, "response", None), "error", None)
+                    raise RuntimeError(f"OpenAI cortó la respuesta: {detalle}")
+        finally:
+            await events.close()
+
 # Instancia global reutilizable
 chat_service = ChatService()
@@ -1,3 +1,182 @@
-from django.test import TestCase
+import asyncio
+import json
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import path
+
+from assistant.models import ChatMessage
+from assistant.services.chat_service import ChatService, chat_service
+from assistant.views import ChatAsyncAPIView, ChatAsyncStreamView, ChatStreamView
+
+# las vistas async se eligen en assistant/urls.py al cargar el proyecto: acá se prueban las dos
+urlpatterns = [
+    path("api/", ChatAsyncAPIView.as_view()),
+    path("api/stream/", ChatAsyncStreamView.as_view()),
+    path("sync/stream/", ChatStreamView.as_view()),
+]
+
+
+def _delta(texto):
+    return SimpleNamespace(type="response.output_text.delta", delta=texto)
+
+
+def _sse(cuerpo: bytes) -> list:
+    """Cuerpo SSE → [(evento, datos)], verificando el formato de cada bloque."""
+    eventos = []
+    for bloque in cuerpo.decode("utf-8").split("\n\n")[:-1]:
+        evento, datos = bloque.split("\n")
+        assert evento.startswith("event: ") and datos.startswith("data: "), bloque
+        eventos.append((evento[len("event: "):], json.loads(datos[len("data: "):])))
+    return eventos
+
+
+class _EventosAsync:
+    """Imita el stream async de la Responses API (una excepción en la lista se lanza)."""
+
+    def __init__(self, eventos):
+        self.eventos = eventos
+        self.cerrado = False
+
+    async def __aiter__(self):
+        for evento in self.eventos:
+            if isinstance(evento, Exception):
+                raise evento
+            yield evento
+
+    async def close(self):
+        self.cerrado = True
+
+
+def _cliente_async(**kwargs):
+    create = mock.AsyncMock(**kwargs)
+    cliente = SimpleNamespace(responses=SimpleNamespace(create=create))
+    return mock.patch.object(ChatService, "async_client", new_callable=mock.PropertyMock, return_value=cliente), create
+
+
+class ChatServiceAsyncTests(TestCase):
+    def test_aask(self):
+        patch, create = _cliente_async(return_value=SimpleNamespace(output_text="Hola"))
+        with patch:
+            self.assertEqual(asyncio.run(chat_service.aask("hola")), "Hola")
+
+        self.assertEqual(create.call_args.kwargs["input"][-1], {"role": "user", "content": "hola"})
+
+    def test_aask_devuelve_el_error_como_texto(self):
+        patch, _ = _cliente_async(side_effect=RuntimeError("sin red"))
+        with patch:
+            self.assertEqual(asyncio.run(chat_service.aask("hola")), "⚠️ Error al comunicar con OpenAI: sin red")
+
+    def test_astream(self):
+        eventos = _EventosAsync([_delta("Ho"), SimpleNamespace(type="response.created"), _delta("la")])
+        patch, create = _cliente_async(return_value=eventos)
+
+        async def leer():
+            return [d async for d in chat_service.astream("hola")]
+
+        with patch:
+            self.assertEqual(asyncio.run(leer()), ["Ho", "la"])
+        self.assertTrue(create.call_args.kwargs["stream"])
+        self.assertTrue(eventos.cerrado)
+
+    def test_astream_respuesta_fallida(self):
+        eventos = _EventosAsync([_delta("Ho"), SimpleNamespace(type="error", message="cuota agotada")])
+        patch, _ = _cliente_async(return_value=eventos)
+
+        async def leer():
+            return [d async for d in chat_service.astream("hola")]
+
+        with patch, self.assertRaisesMessage(RuntimeError, "cuota agotada"):
+            asyncio.run(leer())
+        self.assertTrue(eventos.cerrado)
+
+    def test_un_cliente_por_loop_que_se_cierra_con_el_loop(self):
+        servicio = ChatService()
+
+        async def clientes():
+            return servicio.async_client, servicio.async_client
+
+        primero, mismo = asyncio.run(clientes())
+        segundo, _ = asyncio.run(clientes())
+
+        self.assertIs(primero, mismo)
+        self.assertIsNot(primero, segundo)
+        self.assertTrue(primero._client.is_closed)
+        self.assertTrue(segundo._client.is_closed)
+
+
+@override_settings(ROOT_URLCONF="assistant.tests")
+class ChatVistasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("cajero", password="x")
+
+    def _historial(self):
+        return list(ChatMessage.objects.order_by("id").values_list("role", "message", "ttft_ms"))
+
+    def test_stream_sincronico(self):
+        self.client.force_login(self.user)
+        with mock.patch.object(chat_service, "stream", return_value=iter(["Ho", "la"])):
+            response = self.client.post("/sync/stream/", {"message": "hola"}, content_type="application/json")
+            eventos = _sse(b"".join(response.streaming_content))
+
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertEqual(response["Cache-Control"], "no-cache")
+        self.assertEqual([e for e, _ in eventos], ["delta", "delta", "done"])
+        self.assertEqual([d["text"] for e, d in eventos if e == "delta"], ["Ho", "la"])
+        ttft_ms = eventos[-1][1]["ttft_ms"]
+        self.assertEqual(self._historial(), [("user", "hola", None), ("assistant", "Hola", ttft_ms)])
+
+    async def test_api_async(self):
+        await self.async_client.aforce_login(self.user)
+        with mock.patch.object(chat_service, "aask", mock.AsyncMock(return_value="Hola")):
+            response = await self.async_client.post("/api/", {"message": "hola"}, content_type="application/json")
+            vacio = await self.async_client.post("/api/", {"message": " "}, content_type="application/json")
+        historial = await self.async_client.get("/api/")
+
+        self.assertEqual(response.json(), {"reply": "Hola"})
+        self.assertEqual(vacio.status_code, 400)
+        self.assertEqual([(m["role"], m["message"]) for m in historial.json()["messages"]],
+                         [("user", "hola"), ("assistant", "Hola")])
+
+    async def test_api_async_pide_login(self):
+        response = await self.async_client.post("/api/", {"message": "hola"}, content_type="application/json")
+
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(await ChatMessage.objects.aexists())
+
+    async def test_stream_async(self):
+        async def astream(text):
+            yield "Ho"
+            yield "la"
+
+        await self.async_client.aforce_login(self.user)
+        with mock.patch.object(chat_service, "astream", astream):
+            response = await self.async_client.post(
+                "/api/stream/", {"message": "hola"}, content_type="application/json",
+            )
+            eventos = _sse(b"".join([c async for c in response.streaming_content]))
+
+        self.assertEqual(response["X-Accel-Buffering"], "no")
+        self.assertEqual(eventos[:2], [("delta", {"text": "Ho"}), ("delta", {"text": "la"})])
+        self.assertEqual(eventos[-1][0], "done")
+        respuesta = await ChatMessage.objects.filter(role="assistant").aget()
+        self.assertEqual((respuesta.message, respuesta.ttft_ms), ("Hola", eventos[-1][1]["ttft_ms"]))
+
+    async def test_stream_async_con_error_guarda_lo_que_llego(self):
+        async def astream(text):
+            yield "Ho"
+            raise RuntimeError("OpenAI cortó la respuesta")
+
+        await self.async_client.aforce_login(self.user)
+        with mock.patch.object(chat_service, "astream", astream):
+            response = await self.async_client.post(
+                "/api/stream/", {"message": "hola"}, content_type="application/json",
+            )
+            eventos = _sse(b"".join([c async for c in response.streaming_content]))
+
+        self.assertEqual([e for e, _ in eventos], ["delta", "error", "done"])
+        self.assertIn("OpenAI cortó la respuesta", eventos[1][1]["error"])
+        self.assertEqual(await ChatMessage.objects.filter(role="assistant").values_list("message", flat=True).aget(), "Ho")
@@ -1,6 +1,12 @@
+from django.conf import settings
 from django.urls import path
-from .views import ChatAPIView
+from .views import ChatAPIView, ChatStreamView, ChatAsyncAPIView, ChatAsyncStreamView
+
+# CHAT_ASYNC: servir el chat con las vistas async (True por defecto con ASGI: barcontrol/asgi.py)
+if getattr(settings, "CHAT_ASYNC", False):
+    ChatAPIView, ChatStreamView = ChatAsyncAPIView, ChatAsyncStreamView
 
 urlpatterns = [
     path("api/", ChatAPIView.as_view(), name="chat_api"),
+    path("api/stream/", ChatStreamView.as_view(), name="chat_stream"),
 ]
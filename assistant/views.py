@@ -1,15 +1,20 @@
 from django.views import View
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.contrib import messages
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.models import AnonymousUser
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.auth.views import redirect_to_login
 import json
+import logging
+import time
 
 from assistant.services.chat_service import chat_service
 from assistant.models import ChatMessage
 
+logger = logging.getLogger(__name__)
+
 
 @method_decorator(csrf_exempt, name="dispatch")
 class ChatAPIView(LoginRequiredMixin, View):
@@ -57,3 +62,147 @@ class ChatAPIView(LoginRequiredMixin, View):
             for m in reversed(qs)
         ]
         return JsonResponse({"messages": data})
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class ChatStreamView(LoginRequiredMixin, View):
+    """
+    Igual que ChatAPIView.post, pero la respuesta llega en fragmentos como
+    Server-Sent Events (eventos "delta", y al final "done" o "error").
+    La respuesta completa se guarda en ChatMessage al terminar el stream,
+    junto con el tiempo hasta el primer fragmento (ttft_ms).
+    """
+
+    def post(self, request, *args, **kwargs):
+        try:
+            text = json.loads(request.body).get("message", "").strip()
+        except (ValueError, AttributeError):
+            text = ""
+        if not text:
+            return JsonResponse({"error": "Mensaje vacío."}, status=400)
+
+        user = None if isinstance(request.user, AnonymousUser) else request.user
+        ChatMessage.objects.create(user=user, role="user", message=text)
+
+        response = StreamingHttpResponse(self._eventos(user, text), content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"  # que nginx no junte los eventos
+        return response
+
+    def _eventos(self, user, text):
+        inicio = time.perf_counter()
+        partes, ttft_ms, error = [], None, None
+        try:
+            for delta in chat_service.stream(text):
+                if ttft_ms is None:
+                    ttft_ms = int((time.perf_counter() - inicio) * 1000)
+                partes.append(delta)
+                yield _sse("delta", {"text": delta})
+        except Exception as ex:
+            logger.error(f"Error al consultar OpenAI (stream): {ex}")
+            error = f"⚠️ Error al comunicar con OpenAI: {ex}"
+            yield _sse("error", {"error": error})
+        finally:
+            # también si el navegador cortó la conexión: se guarda lo que llegó
+            reply = "".join(partes) or error
+            if reply:
+                ChatMessage.objects.create(user=user, role="assistant", message=reply, ttft_ms=ttft_ms)
+                logger.info(f"[CHAT] stream {text[:40]}... → ttft={ttft_ms}ms, {len(reply)} caracteres")
+        yield _sse("done", {"ttft_ms": ttft_ms})
+
+
+# -----------------------------------------------------------
+# VERSIONES ASYNC (servidas por ASGI: barcontrol/asgi.py)
+# -----------------------------------------------------------
+# Mientras esperan a OpenAI no ocupan un hilo: muchos chats simultáneos
+# se atienden con pocos workers. Se activan con CHAT_ASYNC (ver urls.py).
+async def _ausuario(request):
+    """Usuario logueado (None si es anónimo), sin consultas sincrónicas."""
+    user = await request.auser()
+    return user if user.is_authenticated else None
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class ChatAsyncAPIView(View):
+    """
+    Versión async de ChatAPIView (mismo JSON de entrada y salida).
+    """
+
+    async def post(self, request, *args, **kwargs):
+        user = await _ausuario(request)
+        if user is None:
+            return redirect_to_login(request.get_full_path())
+        try:
+            text = json.loads(request.body).get("message", "").strip()
+            if not text:
+                return JsonResponse({"error": "Mensaje vacío."}, status=400)
+
+            await ChatMessage.objects.acreate(user=user, role="user", message=text)
+            reply = await chat_service.aask(text)
+            await ChatMessage.objects.acreate(user=user, role="assistant", message=reply)
+            return JsonResponse({"reply": reply})
+
+        except Exception as ex:
+            logger.error(f"Error en ChatAsyncAPIView: {ex}")
+            return JsonResponse({"error": str(ex)}, status=500)
+
+    async def get(self, request, *args, **kwargs):
+        user = await _ausuario(request)
+        if user is None:
+            return redirect_to_login(request.get_full_path())
+        qs = ChatMessage.objects.filter(user=user).order_by("-created_at")[:20]
+        data = [
+            {"role": m.role, "message": m.message, "created_at": m.created_at.isoformat()}
+            async for m in qs
+        ]
+        return JsonResponse({"messages": data[::-1]})
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class ChatAsyncStreamView(View):
+    """
+    Versión async de ChatStreamView (mismos eventos SSE).
+    """
+
+    async def post(self, request, *args, **kwargs):
+        user = await _ausuario(request)
+        if user is None:
+            return redirect_to_login(request.get_full_path())
+        try:
+            text = json.loads(request.body).get("message", "").strip()
+        except (ValueError, AttributeError):
+            text = ""
+        if not text:
+            return JsonResponse({"error": "Mensaje vacío."}, status=400)
+
+        await ChatMessage.objects.acreate(user=user, role="user", message=text)
+
+        response = StreamingHttpResponse(self._eventos(user, text), content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    async def _eventos(self, user, text):
+        inicio = time.perf_counter()
+        partes, ttft_ms, error = [], None, None
+        try:
+            async for delta in chat_service.astream(text):
+                if ttft_ms is None:
+                    ttft_ms = int((time.perf_counter() - inicio) * 1000)
+                partes.append(delta)
+                yield _sse("delta", {"text": delta})
+        except Exception as ex:
+            logger.error(f"Error al consultar OpenAI (stream): {ex}")
+            error = f"⚠️ Error al comunicar con OpenAI: {ex}"
+            yield _sse("error", {"error": error})
+        finally:
+            # también si el navegador cortó la conexión: se guarda lo que llegó
+            reply = "".join(partes) or error
+            if reply:
+                await ChatMessage.objects.acreate(user=user, role="assistant", message=reply, ttft_ms=ttft_ms)
+                logger.info(f"[CHAT] stream {text[:40]}... → ttft={ttft_ms}ms, {len(reply)} caracteres")
+        yield _sse("done", {"ttft_ms": ttft_ms})
@@ -3,6 +3,14 @@ ASGI config for barcontrol project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Servido por ASGI, el chat usa las vistas async (assistant/views.py), que no
+ocupan un hilo mientras esperan a OpenAI: este módulo marca BARCONTROL_ASGI y
+settings.CHAT_ASYNC queda en True salvo que se ponga CHAT_ASYNC=False. Las vistas
+sincrónicas bajo ASGI funcionan, pero el stream del chat (SSE) llega de una sola
+vez al final en lugar de en fragmentos. Por ejemplo:
+
+    uvicorn barcontrol.asgi:application --workers 4
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -12,5 +20,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'barcontrol.settings')
+os.environ.setdefault('BARCONTROL_ASGI', 'True')  # antes de cargar settings: elige las vistas async del chat
 
 application = get_asgi_application()
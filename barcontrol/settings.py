@@ -83,6 +83,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'barcontrol.wsgi.application'
+ASGI_APPLICATION = 'barcontrol.asgi.application'
 
 
 # Database
@@ -146,21 +147,122 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AZURE_STORAGE_ACCOUNT = os.getenv('AZURE_STORAGE_ACCOUNT')              # p.ej. riverodepositostorage
 AZURE_STORAGE_KEY = os.getenv('AZURE_STORAGE_KEY')                      # clave de cuenta
 AZURE_BLOB_CONTAINER = os.getenv('AZURE_BLOB_CONTAINER', 'invoices')    # contenedor
+# SAS de solo lectura: duración y margen antes del vencimiento para emitir uno nuevo
+AZURE_SAS_MINUTES = int(os.getenv('AZURE_SAS_MINUTES', '15'))
+AZURE_SAS_REFRESH_SECONDS = int(os.getenv('AZURE_SAS_REFRESH_SECONDS', '120'))
+BLOB_STREAM_CHUNK_BYTES = int(os.getenv('BLOB_STREAM_CHUNK_BYTES', str(1024 * 1024)))  # bloque al servir originales
+
+# Pool de conexiones HTTP compartido por los clientes de Azure (≈ concurrencia del worker)
+AZURE_HTTP_POOL_SIZE = int(os.getenv('AZURE_HTTP_POOL_SIZE', '10'))
+
+# Regulador de llamadas a Azure (invoices/services/governor.py): rate limit, máximo en vuelo
+# por proceso y reintentos con backoff exponencial + jitter (respeta Retry-After)
+DI_RATE_PER_SEC = float(os.getenv('DI_RATE_PER_SEC', '15'))
+DI_RATE_BURST = int(os.getenv('DI_RATE_BURST', '15'))
+DI_MAX_IN_FLIGHT = int(os.getenv('DI_MAX_IN_FLIGHT', '8'))
+BLOB_RATE_PER_SEC = float(os.getenv('BLOB_RATE_PER_SEC', '100'))
+BLOB_RATE_BURST = int(os.getenv('BLOB_RATE_BURST', '50'))
+BLOB_MAX_IN_FLIGHT = int(os.getenv('BLOB_MAX_IN_FLIGHT', '32'))
+AZURE_MAX_RETRIES = int(os.getenv('AZURE_MAX_RETRIES', '5'))
+AZURE_RETRY_BASE_SECONDS = float(os.getenv('AZURE_RETRY_BASE_SECONDS', '0.5'))
+AZURE_RETRY_MAX_SECONDS = float(os.getenv('AZURE_RETRY_MAX_SECONDS', '30'))
 
 # Document Intelligence
 AZ_DOCINT_ENDPOINT = os.getenv('AZ_DOCINT_ENDPOINT')                    # https://deposito.cognitiveservices.azure.com/
 AZ_DOCINT_KEY = os.getenv('AZ_DOCINT_KEY')                              # clave del recurso DI
 AZ_DOCINT_MODEL = os.getenv('AZ_DOCINT_MODEL', 'prebuilt-invoice')      # modelo a usar
 
+# Análisis asíncrono (azure_di_async): intervalo de polling, timeout por documento
+# y máximo de análisis en vuelo por event loop
+DI_POLL_INTERVAL_SECONDS = float(os.getenv('DI_POLL_INTERVAL_SECONDS', '1'))
+DI_ANALYZE_TIMEOUT_SECONDS = float(os.getenv('DI_ANALYZE_TIMEOUT_SECONDS', '120'))
+DI_ASYNC_MAX_CONCURRENCY = int(os.getenv('DI_ASYNC_MAX_CONCURRENCY', '16'))
+
 # Modo de análisis: 'auto' (recomendado), 'sas', 'bytes'
 DI_ANALYZE_MODE = os.getenv('DI_ANALYZE_MODE', 'auto')
 
 # Si 'auto': umbral para decidir bytes vs SAS por tamaño
 DI_INLINE_BYTES_MAX_MB = float(os.getenv('DI_INLINE_BYTES_MAX_MB', '5'))
 
+# PDFs largos: partir en rangos de páginas y analizarlos en paralelo
+DI_SPLIT_ENABLED = os.getenv('DI_SPLIT_ENABLED', 'False') == 'True'
+DI_SPLIT_MIN_PAGES = int(os.getenv('DI_SPLIT_MIN_PAGES', '8'))          # a partir de cuántas páginas se parte
+DI_SPLIT_PAGES_PER_CHUNK = int(os.getenv('DI_SPLIT_PAGES_PER_CHUNK', '4'))
+DI_SPLIT_MAX_WORKERS = int(os.getenv('DI_SPLIT_MAX_WORKERS', '4'))
+
+# Preprocesado antes de DI: reducir fotos grandes y quitar páginas en blanco de PDFs
+DI_PREPROCESS_ENABLED = os.getenv('DI_PREPROCESS_ENABLED', 'False') == 'True'
+DI_PREPROCESS_MAX_SIDE_PX = int(os.getenv('DI_PREPROCESS_MAX_SIDE_PX', '2500'))
+DI_PREPROCESS_JPEG_QUALITY = int(os.getenv('DI_PREPROCESS_JPEG_QUALITY', '85'))
+DI_PREPROCESS_MIN_BYTES = int(os.getenv('DI_PREPROCESS_MIN_BYTES', str(1024 * 1024)))  # imágenes más chicas no se tocan
+
+# Lectura local de PDFs con capa de texto (comprobantes electrónicos de ARCA) antes de DI.
+# Si la confianza es menor al mínimo se analiza con DI como siempre.
+PDF_TEXT_ENABLED = os.getenv('PDF_TEXT_ENABLED', 'True') == 'True'
+PDF_TEXT_MIN_CONFIDENCE = float(os.getenv('PDF_TEXT_MIN_CONFIDENCE', '0.85'))
+PDF_TEXT_MIN_CHARS = int(os.getenv('PDF_TEXT_MIN_CHARS', '200'))         # menos texto = escaneado
+
+# Reglas de clasificación de ítems (tabla ReglaClasificacion): cada cuánto se recargan
+# en cada proceso (los cambios en el mismo proceso se ven al instante)
+CLASIFICADOR_CACHE_SECONDS = int(os.getenv('CLASIFICADOR_CACHE_SECONDS', '300'))
+
+# Listado de facturas (paginación por cursor): hasta cuántas facturas se cuentan ("más de N")
+INVOICE_LIST_COUNT_CAP = int(os.getenv('INVOICE_LIST_COUNT_CAP', '1000'))
+
+# Listados de productos y proveedores (paginación por cursor): hasta cuántos se cuentan
+CATALOG_LIST_COUNT_CAP = int(os.getenv('CATALOG_LIST_COUNT_CAP', '1000'))
+
+# Exportación de facturas: filas que se leen de la base por bloque
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '2000'))
+
+# Historial de precios de compra (tabla EstadisticaPrecio) y alertas en la vista previa:
+# cuántos precios recientes se usan, desde cuántas muestras se alerta, desvío robusto
+# (|precio - mediana| / MAD escalado) y desvío relativo mínimo para marcar un precio
+PRECIO_VENTANA = int(os.getenv('PRECIO_VENTANA', '20'))
+PRECIO_ALERTA_MIN_MUESTRAS = int(os.getenv('PRECIO_ALERTA_MIN_MUESTRAS', '3'))
+PRECIO_ALERTA_Z = float(os.getenv('PRECIO_ALERTA_Z', '3.5'))
+PRECIO_ALERTA_MIN_DESVIO = float(os.getenv('PRECIO_ALERTA_MIN_DESVIO', '0.15'))   # 15 %
+
+# Detección de productos duplicados (por embeddings): similitud coseno mínima para
+# considerar dos productos el mismo, y memoria (MB) para cada bloque de similitudes
+DUPLICADOS_UMBRAL = float(os.getenv('DUPLICADOS_UMBRAL', '0.92'))
+DUPLICADOS_MEMORIA_MB = int(os.getenv('DUPLICADOS_MEMORIA_MB', '256'))
+# cuántos grupos se muestran como máximo en el reporte
+DUPLICADOS_MAX_GRUPOS = int(os.getenv('DUPLICADOS_MAX_GRUPOS', '200'))
+
+# Índice de códigos de producto en memoria (vista previa de facturas): cada cuántos
+# segundos se leen los productos modificados en otros procesos y cada cuánto se recarga todo
+CODIGOS_REFRESCO_SEGUNDOS = int(os.getenv('CODIGOS_REFRESCO_SEGUNDOS', '5'))
+CODIGOS_RECARGA_SEGUNDOS = int(os.getenv('CODIGOS_RECARGA_SEGUNDOS', '3600'))
+
+# Chat con IA: vistas async. Por defecto según el servidor: True con ASGI (barcontrol/asgi.py
+# marca BARCONTROL_ASGI), False con WSGI. No conviene forzarlo al revés: las vistas sync bajo
+# ASGI y las async bajo WSGI entregan el stream del chat entero al final, no en fragmentos.
+# También: conexiones simultáneas máximas hacia OpenAI por proceso y timeout de cada respuesta
+CHAT_ASYNC = os.getenv('CHAT_ASYNC', os.getenv('BARCONTROL_ASGI', 'False')) == 'True'
+CHAT_MAX_CONEXIONES = int(os.getenv('CHAT_MAX_CONEXIONES', '100'))
+CHAT_TIMEOUT_SEGUNDOS = float(os.getenv('CHAT_TIMEOUT_SEGUNDOS', '60'))
+
 # Modo simulación (no hace llamadas a Azure)
 # Si esta en True,  el sistema no se conecta con Azure y usa datos de prueba
 USE_AZURE_SIMULATION = True
 
+# Facturas sintéticas del modo simulación (ver invoices/services/di_simulator.py)
+DI_SIM_SEED = os.getenv('DI_SIM_SEED')                                  # vacío = aleatorio
+DI_SIM_LINES_MIN = int(os.getenv('DI_SIM_LINES_MIN', '3'))
+DI_SIM_LINES_MAX = int(os.getenv('DI_SIM_LINES_MAX', '40'))
+DI_SIM_SUPPLIERS = int(os.getenv('DI_SIM_SUPPLIERS', '20'))
+DI_SIM_CONFIDENCE_MIN = float(os.getenv('DI_SIM_CONFIDENCE_MIN', '0.6'))
+DI_SIM_CONFIDENCE_MAX = float(os.getenv('DI_SIM_CONFIDENCE_MAX', '0.99'))
+DI_SIM_LATENCY_MS = float(os.getenv('DI_SIM_LATENCY_MS', '0'))
+DI_SIM_LATENCY_JITTER_MS = float(os.getenv('DI_SIM_LATENCY_JITTER_MS', '0'))
+DI_SIM_ERROR_RATE = float(os.getenv('DI_SIM_ERROR_RATE', '0'))          # 0.05 = 5% de análisis fallan
+DI_SIM_ERROR_STATUS = os.getenv('DI_SIM_ERROR_STATUS', '429,503')
+
+# Dónde se guardan los originales: 'azure' (Blob Storage) o 'local' (disco, direccionado por contenido).
+# En simulación se usa el disco local para que "Ver original" funcione sin Azure.
+INVOICE_STORAGE_BACKEND = os.getenv('INVOICE_STORAGE_BACKEND', 'local' if USE_AZURE_SIMULATION else 'azure')
+LOCAL_STORAGE_ROOT = os.getenv('LOCAL_STORAGE_ROOT', str(BASE_DIR / 'media' / 'invoices'))
+
 # Cierra la sesión cuando el navegador se cierra
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True
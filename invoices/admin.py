@@ -1,7 +1,9 @@
 from django.contrib import admin
 
 # Register your models here.
-from invoices.models import Factura, ItemFactura
+from invoices.models import (
+    EstadisticaPrecio, Factura, ItemFactura, PlantillaFactura, ReglaClasificacion, ResumenProductoMes, ResumenProveedorMes,
+)
 
 @admin.register(Factura)
 class FacturaAdmin(admin.ModelAdmin):
@@ -12,4 +14,39 @@ class FacturaAdmin(admin.ModelAdmin):
 @admin.register(ItemFactura)
 class ItemFacturaAdmin(admin.ModelAdmin):
     list_display = ('factura', 'producto', 'cantidad', 'precio_unitario', 'importe')  
-    search_fields = ('factura', 'producto')
\ No newline at end of file
+    search_fields = ('factura', 'producto')
+
+
+@admin.register(PlantillaFactura)
+class PlantillaFacturaAdmin(admin.ModelAdmin):
+    list_display = ('nombre', 'cuit', 'formato_numeros', 'activo', 'updated_at')
+    list_filter = ('activo',)
+    search_fields = ('nombre', 'cuit')
+
+
+@admin.register(ReglaClasificacion)
+class ReglaClasificacionAdmin(admin.ModelAdmin):
+    list_display = ('patron', 'tipo_item', 'proveedor', 'prioridad', 'es_regex', 'activo')
+    list_filter = ('tipo_item', 'activo')
+    search_fields = ('patron', 'proveedor__nombre')
+
+
+@admin.register(ResumenProveedorMes)
+class ResumenProveedorMesAdmin(admin.ModelAdmin):
+    list_display = ('mes', 'proveedor', 'facturas', 'subtotal', 'total_impuestos', 'total')
+    list_filter = ('mes',)
+    search_fields = ('proveedor__nombre',)
+
+
+@admin.register(ResumenProductoMes)
+class ResumenProductoMesAdmin(admin.ModelAdmin):
+    list_display = ('mes', 'producto', 'facturas', 'lineas', 'cantidad', 'importe')
+    list_filter = ('mes',)
+    search_fields = ('producto__nombre',)
+
+
+@admin.register(EstadisticaPrecio)
+class EstadisticaPrecioAdmin(admin.ModelAdmin):
+    list_display = ('producto', 'ultimo_precio', 'ultima_fecha', 'ultimo_proveedor', 'mediana', 'mad', 'muestras')
+    search_fields = ('producto__nombre',)
+    readonly_fields = ('ventana', 'updated_at')
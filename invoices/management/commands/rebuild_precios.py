@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from invoices.services import precios
+
+class Command(BaseCommand):
+    help = "Recalcula el historial de precios de compra (mediana, MAD y último precio) de cada producto."
+
+    def handle(self, *args, **options):
+        n = precios.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Historial de precios recalculado para {n} productos."))
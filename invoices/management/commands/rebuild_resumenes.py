@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from invoices.services import rollups
+
+class Command(BaseCommand):
+    help = "Recalcula los resúmenes mensuales de gasto por proveedor y por producto."
+
+    def handle(self, *args, **options):
+        filas = rollups.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"Resúmenes recalculados: {filas['proveedor_mes']} proveedor/mes, {filas['producto_mes']} producto/mes."
+        ))
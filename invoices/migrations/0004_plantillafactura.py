@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-19 16:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0003_alter_factura_unique_together'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlantillaFactura',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100)),
+                ('cuit', models.CharField(db_index=True, help_text='Solo dígitos', max_length=11, verbose_name='CUIT del emisor')),
+                ('regex_item', models.TextField(help_text='Regex para una línea de ítem, con grupos (?P<description>...), (?P<quantity>...), (?P<unit_price>...), (?P<amount>...) y opcionales (?P<product_code>...), (?P<unit>...), (?P<tax>...)')),
+                ('inicio_items', models.CharField(blank=True, help_text='Regex de la línea que abre la tabla de ítems', max_length=255)),
+                ('fin_items', models.CharField(blank=True, help_text='Regex de la línea que cierra la tabla de ítems', max_length=255)),
+                ('campos', models.JSONField(blank=True, default=dict, help_text='Regex (con un grupo) por campo de cabecera, ej. invoice_total; reemplazan a las genéricas')),
+                ('formato_numeros', models.CharField(choices=[('ar', '1.234,56'), ('en', '1,234.56')], default='ar', max_length=2)),
+                ('activo', models.BooleanField(default=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Plantilla de factura',
+                'verbose_name_plural': 'Plantillas de factura',
+                'ordering': ['nombre'],
+            },
+        ),
+    ]
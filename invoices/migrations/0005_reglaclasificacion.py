@@ -0,0 +1,63 @@
+# Generated by Django 5.2.5 on 2026-10-19 16:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Mismas palabras que usaba calificar_item (ahora por palabra completa y sin acentos)
+REGLAS_INICIALES = [
+    ("iva", "impuesto", 10),
+    ("impuesto", "impuesto", 10),
+    ("impuestos", "impuesto", 10),
+    ("retencion", "impuesto", 10),
+    ("retenciones", "impuesto", 10),
+    ("percepcion", "impuesto", 10),
+    ("percepciones", "impuesto", 10),
+    ("subtotal", "resumen", 20),
+    ("total", "resumen", 20),
+    ("saldo", "resumen", 20),
+]
+
+
+def cargar_reglas(apps, schema_editor):
+    ReglaClasificacion = apps.get_model("invoices", "ReglaClasificacion")
+    ReglaClasificacion.objects.bulk_create([
+        ReglaClasificacion(patron=patron, tipo_item=tipo, prioridad=prioridad)
+        for patron, tipo, prioridad in REGLAS_INICIALES
+    ])
+
+
+def borrar_reglas(apps, schema_editor):
+    ReglaClasificacion = apps.get_model("invoices", "ReglaClasificacion")
+    ReglaClasificacion.objects.filter(
+        proveedor__isnull=True, patron__in=[p for p, _, _ in REGLAS_INICIALES]
+    ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0004_plantillafactura'),
+        ('proveedores', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReglaClasificacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('patron', models.CharField(help_text="Palabra o frase (o regex si 'es regex')", max_length=100)),
+                ('es_regex', models.BooleanField(default=False, help_text='Se aplica sobre el texto en minúsculas y sin acentos')),
+                ('tipo_item', models.CharField(choices=[('producto', 'producto/servicio'), ('impuesto', 'Impuesto/Retención'), ('resumen', 'Subtotal/Total')], max_length=20)),
+                ('prioridad', models.PositiveIntegerField(default=100, help_text='Menor número = se evalúa primero')),
+                ('activo', models.BooleanField(default=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('proveedor', models.ForeignKey(blank=True, help_text='Vacío = regla general', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='reglas_clasificacion', to='proveedores.proveedor')),
+            ],
+            options={
+                'verbose_name': 'Regla de clasificación',
+                'verbose_name_plural': 'Reglas de clasificación',
+                'ordering': ['proveedor_id', 'prioridad', 'id'],
+            },
+        ),
+        migrations.RunPython(cargar_reglas, borrar_reglas),
+    ]
@@ -0,0 +1,97 @@
+# Índice de texto completo sobre descripción y código de los ítems de factura.
+# Depende del motor: SQLite → tabla virtual FTS5 mantenida por triggers;
+# PostgreSQL → índices GIN de tsvector y de trigramas. Ver services/search.py.
+
+from django.db import migrations
+
+SQLITE_CREATE = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS invoices_itemfactura_fts USING fts5(
+        descripcion, codigo_producto,
+        content='invoices_itemfactura', content_rowid='id',
+        tokenize="unicode61 remove_diacritics 2"
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS invoices_itemfactura_fts_ai AFTER INSERT ON invoices_itemfactura BEGIN
+        INSERT INTO invoices_itemfactura_fts(rowid, descripcion, codigo_producto)
+        VALUES (new.id, new.descripcion, new.codigo_producto);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS invoices_itemfactura_fts_ad AFTER DELETE ON invoices_itemfactura BEGIN
+        INSERT INTO invoices_itemfactura_fts(invoices_itemfactura_fts, rowid, descripcion, codigo_producto)
+        VALUES ('delete', old.id, old.descripcion, old.codigo_producto);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS invoices_itemfactura_fts_au
+    AFTER UPDATE OF descripcion, codigo_producto ON invoices_itemfactura BEGIN
+        INSERT INTO invoices_itemfactura_fts(invoices_itemfactura_fts, rowid, descripcion, codigo_producto)
+        VALUES ('delete', old.id, old.descripcion, old.codigo_producto);
+        INSERT INTO invoices_itemfactura_fts(rowid, descripcion, codigo_producto)
+        VALUES (new.id, new.descripcion, new.codigo_producto);
+    END
+    """,
+    # indexa los ítems que ya existen
+    "INSERT INTO invoices_itemfactura_fts(invoices_itemfactura_fts) VALUES ('rebuild')",
+]
+
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS invoices_itemfactura_fts_ai",
+    "DROP TRIGGER IF EXISTS invoices_itemfactura_fts_ad",
+    "DROP TRIGGER IF EXISTS invoices_itemfactura_fts_au",
+    "DROP TABLE IF EXISTS invoices_itemfactura_fts",
+]
+
+# Misma expresión que usa services/search.py (tiene que coincidir para que se use el índice)
+POSTGRES_CREATE = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    CREATE INDEX IF NOT EXISTS invoices_itemfactura_tsv_idx ON invoices_itemfactura USING GIN (
+        to_tsvector('simple', coalesce(descripcion, '') || ' ' || coalesce(codigo_producto, ''))
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS invoices_itemfactura_desc_trgm_idx
+    ON invoices_itemfactura USING GIN (descripcion gin_trgm_ops)
+    """,
+]
+
+POSTGRES_DROP = [
+    "DROP INDEX IF EXISTS invoices_itemfactura_tsv_idx",
+    "DROP INDEX IF EXISTS invoices_itemfactura_desc_trgm_idx",
+]
+
+
+def _run(schema_editor, statements):
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def crear_indice(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        _run(schema_editor, SQLITE_CREATE)
+    elif vendor == "postgresql":
+        _run(schema_editor, POSTGRES_CREATE)
+    # otros motores: la búsqueda sigue con icontains
+
+
+def borrar_indice(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        _run(schema_editor, SQLITE_DROP)
+    elif vendor == "postgresql":
+        _run(schema_editor, POSTGRES_DROP)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0005_reglaclasificacion'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, borrar_indice),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0006_itemfactura_fts'),
+        ('productos', '0003_alter_productoembedding_vector'),
+        ('proveedores', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenProductoMes',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(help_text='Primer día del mes')),
+                ('facturas', models.PositiveIntegerField(default=0)),
+                ('lineas', models.PositiveIntegerField(default=0)),
+                ('cantidad', models.DecimalField(decimal_places=3, default=0, max_digits=16)),
+                ('importe', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_mes', to='productos.producto')),
+            ],
+            options={
+                'verbose_name': 'Resumen mensual por producto',
+                'verbose_name_plural': 'Resúmenes mensuales por producto',
+                'ordering': ['-mes', '-importe'],
+                'indexes': [models.Index(fields=['mes', 'importe'], name='invoices_re_mes_28b18c_idx')],
+                'constraints': [models.UniqueConstraint(fields=('producto', 'mes'), name='resumen_producto_mes_unico')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ResumenProveedorMes',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(help_text='Primer día del mes')),
+                ('facturas', models.PositiveIntegerField(default=0)),
+                ('subtotal', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_impuestos', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('proveedor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_mes', to='proveedores.proveedor')),
+            ],
+            options={
+                'verbose_name': 'Resumen mensual por proveedor',
+                'verbose_name_plural': 'Resúmenes mensuales por proveedor',
+                'ordering': ['-mes', '-total'],
+                'indexes': [models.Index(fields=['mes', 'total'], name='invoices_re_mes_936498_idx')],
+                'constraints': [models.UniqueConstraint(fields=('proveedor', 'mes'), name='resumen_proveedor_mes_unico')],
+            },
+        ),
+    ]
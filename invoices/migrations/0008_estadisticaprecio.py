@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0007_resumenes_mensuales'),
+        ('productos', '0003_alter_productoembedding_vector'),
+        ('proveedores', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadisticaPrecio',
+            fields=[
+                ('producto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='estadistica_precio', serialize=False, to='productos.producto')),
+                ('ultimo_precio', models.DecimalField(decimal_places=4, max_digits=12)),
+                ('ultima_fecha', models.DateField(blank=True, null=True)),
+                ('mediana', models.DecimalField(decimal_places=4, max_digits=12)),
+                ('mad', models.DecimalField(decimal_places=4, default=0, max_digits=12, verbose_name='Desvío absoluto mediano')),
+                ('muestras', models.PositiveIntegerField(default=0, help_text='Precios registrados en total')),
+                ('ventana', models.JSONField(default=list, help_text='Últimos precios (los que usan mediana y MAD)')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('ultimo_proveedor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='proveedores.proveedor')),
+            ],
+            options={
+                'verbose_name': 'Estadística de precio',
+                'verbose_name_plural': 'Estadísticas de precio',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0008_estadisticaprecio'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='factura',
+            name='url_blob',
+            field=models.CharField(blank=True, max_length=500, null=True),
+        ),
+    ]
@@ -1,3 +1,4 @@
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.contrib.auth import get_user_model
 from productos.models import Producto
@@ -87,7 +88,8 @@ class Factura(models.Model):
     servicio_hasta = models.DateField(null=True, blank=True)
     vencimiento = models.DateField(null=True, blank=True)
 
-    url_blob = models.URLField(null=True, blank=True)
+    # no es URLField: el almacenamiento local guarda "local://ab/cd/<sha256>.pdf"
+    url_blob = models.CharField(max_length=500, null=True, blank=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -150,3 +152,235 @@ class ItemFactura(models.Model):
 
     def __str__(self):
         return self.descripcion or "(ítem)"
+
+
+# -------------------------------------------------------------
+# PLANTILLAS DE LECTURA LOCAL (PDF con capa de texto)
+# -------------------------------------------------------------
+class PlantillaFactura(models.Model):
+    """
+    Cómo leer la tabla de ítems (y opcionalmente campos de cabecera) del PDF
+    de un proveedor sin pasar por Document Intelligence. Ver services/pdf_text.py.
+    """
+    FORMATO_CHOICES = [
+        ("ar", "1.234,56"),
+        ("en", "1,234.56"),
+    ]
+
+    nombre = models.CharField(max_length=100)
+    cuit = models.CharField("CUIT del emisor", max_length=11, db_index=True, help_text="Solo dígitos")
+    regex_item = models.TextField(
+        help_text="Regex para una línea de ítem, con grupos (?P<description>...), "
+                  "(?P<quantity>...), (?P<unit_price>...), (?P<amount>...) y opcionales "
+                  "(?P<product_code>...), (?P<unit>...), (?P<tax>...)"
+    )
+    inicio_items = models.CharField(max_length=255, blank=True, help_text="Regex de la línea que abre la tabla de ítems")
+    fin_items = models.CharField(max_length=255, blank=True, help_text="Regex de la línea que cierra la tabla de ítems")
+    campos = models.JSONField(
+        default=dict, blank=True,
+        help_text="Regex (con un grupo) por campo de cabecera, ej. invoice_total; reemplazan a las genéricas"
+    )
+    formato_numeros = models.CharField(max_length=2, choices=FORMATO_CHOICES, default="ar")
+    activo = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Plantilla de factura"
+        verbose_name_plural = "Plantillas de factura"
+        ordering = ["nombre"]
+
+    def __str__(self):
+        return f"{self.nombre} ({self.cuit})"
+
+    def clean(self):
+        # una regex rota haría fallar la lectura local de todas las facturas del proveedor
+        from invoices.services.pdf_text import validar_plantilla
+
+        errores = validar_plantilla(
+            self.regex_item, self.inicio_items, self.fin_items, self.campos, self.formato_numeros
+        )
+        if errores:
+            raise ValidationError(errores)
+
+
+# -------------------------------------------------------------
+# REGLAS DE CLASIFICACIÓN DE ÍTEMS (producto / impuesto / resumen)
+# -------------------------------------------------------------
+class ReglaClasificacion(models.Model):
+    """
+    Palabra o frase que clasifica una línea de factura. Se compara por palabra
+    completa, sin mayúsculas ni acentos. Las reglas de un proveedor se evalúan
+    antes que las generales (sirven para excepciones, ej. "total" → producto).
+    Ver services/clasificador.py.
+    """
+    patron = models.CharField(max_length=100, help_text="Palabra o frase (o regex si 'es regex')")
+    es_regex = models.BooleanField(default=False, help_text="Se aplica sobre el texto en minúsculas y sin acentos")
+    tipo_item = models.CharField(max_length=20, choices=ItemFactura.TIPO_CHOICES)
+    proveedor = models.ForeignKey(
+        Proveedor, null=True, blank=True, on_delete=models.CASCADE, related_name="reglas_clasificacion",
+        help_text="Vacío = regla general"
+    )
+    prioridad = models.PositiveIntegerField(default=100, help_text="Menor número = se evalúa primero")
+    activo = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Regla de clasificación"
+        verbose_name_plural = "Reglas de clasificación"
+        ordering = ["proveedor_id", "prioridad", "id"]
+
+    def __str__(self):
+        alcance = self.proveedor.nombre if self.proveedor_id else "general"
+        return f"{self.patron} → {self.tipo_item} ({alcance})"
+
+    def clean(self):
+        from invoices.services.clasificador import validar_regla
+
+        error = validar_regla(self.patron, self.es_regex)
+        if error:
+            raise ValidationError({"patron": error})
+
+
+
+# -------------------------------------------------------------
+# RESÚMENES MENSUALES (gasto por proveedor y por producto)
+# -------------------------------------------------------------
+# Se actualizan de a una factura al confirmarla (services/rollups.py) y se
+# pueden recalcular completos con: python manage.py rebuild_resumenes
+class ResumenProveedorMes(models.Model):
+    proveedor = models.ForeignKey(Proveedor, on_delete=models.CASCADE, related_name="resumenes_mes")
+    mes = models.DateField(help_text="Primer día del mes")
+
+    facturas = models.PositiveIntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_impuestos = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = "Resumen mensual por proveedor"
+        verbose_name_plural = "Resúmenes mensuales por proveedor"
+        ordering = ["-mes", "-total"]
+        constraints = [
+            models.UniqueConstraint(fields=["proveedor", "mes"], name="resumen_proveedor_mes_unico"),
+        ]
+        indexes = [
+            models.Index(fields=["mes", "total"]),
+        ]
+
+    def __str__(self):
+        return f"{self.proveedor.nombre} {self.mes:%Y-%m}: {self.total}"
+
+
+class ResumenProductoMes(models.Model):
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name="resumenes_mes")
+    mes = models.DateField(help_text="Primer día del mes")
+
+    facturas = models.PositiveIntegerField(default=0)
+    lineas = models.PositiveIntegerField(default=0)
+    cantidad = models.DecimalField(max_digits=16, decimal_places=3, default=0)
+    importe = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = "Resumen mensual por producto"
+        verbose_name_plural = "Resúmenes mensuales por producto"
+        ordering = ["-mes", "-importe"]
+        constraints = [
+            models.UniqueConstraint(fields=["producto", "mes"], name="resumen_producto_mes_unico"),
+        ]
+        indexes = [
+            models.Index(fields=["mes", "importe"]),
+        ]
+
+    @property
+    def precio_promedio(self):
+        """Precio unitario promedio ponderado por cantidad."""
+        return (self.importe / self.cantidad) if self.cantidad else None
+
+    def __str__(self):
+        return f"{self.producto.nombre} {self.mes:%Y-%m}: {self.importe}"
+
+# -------------------------------------------------------------
+# HISTORIAL DE PRECIOS DE COMPRA (una fila por producto)
+# -------------------------------------------------------------
+# Se actualiza al confirmar cada factura (services/precios.py); en la vista
+# previa se compara el precio unitario nuevo contra la mediana y el MAD.
+# Recalcular completo: python manage.py rebuild_precios
+class EstadisticaPrecio(models.Model):
+    producto = models.OneToOneField(
+        Producto, on_delete=models.CASCADE, primary_key=True, related_name="estadistica_precio"
+    )
+
+    ultimo_precio = models.DecimalField(max_digits=12, decimal_places=4)
+    ultima_fecha = models.DateField(null=True, blank=True)
+    ultimo_proveedor = models.ForeignKey(Proveedor, null=True, blank=True, on_delete=models.SET_NULL)
+
+    mediana = models.DecimalField(max_digits=12, decimal_places=4)
+    mad = models.DecimalField("Desvío absoluto mediano", max_digits=12, decimal_places=4, default=0)
+    muestras = models.PositiveIntegerField(default=0, help_text="Precios registrados en total")
+    ventana = models.JSONField(default=list, help_text="Últimos precios (los que usan mediana y MAD)")
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Estadística de precio"
+        verbose_name_plural = "Estadísticas de precio"
+
+    def __str__(self):
+        return f"{self.producto.nombre}: {self.ultimo_precio} (mediana {self.mediana})"
+
+# --- SEÑALES ---
+# (cualquier cambio en las reglas invalida el clasificador compilado del proceso)
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+
+@receiver([post_save, post_delete], sender=ReglaClasificacion)
+def invalidar_clasificador(sender, **kwargs):
+    from invoices.services.clasificador import invalidate_cache
+
+    invalidate_cache()
+
+
+@receiver(pre_delete, sender=Factura)
+def descontar_de_resumenes(sender, instance, **kwargs):
+    # antes del borrado (los ítems todavía existen) y dentro de su transacción;
+    # cubre el admin y el borrado en cascada desde el proveedor
+    from invoices.services.rollups import descontar_factura
+
+    descontar_factura(instance)
+
+
+@receiver(pre_save, sender=Factura)
+@receiver(pre_save, sender=ItemFactura)
+def leer_estado_anterior(sender, instance, **kwargs):
+    # lo que sumaba antes de la edición: post_save recalcula esas filas y las nuevas
+    from invoices.services.rollups import suspendidos
+
+    if suspendidos():
+        return
+    qs = sender.objects.select_related("factura") if sender is ItemFactura else sender.objects
+    instance._anterior = qs.filter(pk=instance.pk).first() if instance.pk is not None else None
+
+
+@receiver(post_save, sender=Factura)
+@receiver(post_save, sender=ItemFactura)
+def recalcular_resumenes(sender, instance, **kwargs):
+    # altas y ediciones fuera de confirm_invoice (admin, shell)
+    from invoices.services.rollups import recalcular_edicion, suspendidos
+
+    if suspendidos() or not hasattr(instance, "_anterior"):
+        return
+    anterior = instance._anterior
+    del instance._anterior
+    recalcular_edicion(anterior, instance)
+
+
+@receiver(post_delete, sender=ItemFactura)
+def recalcular_al_borrar_item(sender, instance, origin=None, **kwargs):
+    # solo ítems borrados sueltos: en cascada desde la factura (o su proveedor),
+    # descontar_de_resumenes ya restó la factura entera
+    from invoices.services.rollups import recalcular_edicion, suspendidos
+
+    if suspendidos() or not (isinstance(origin, ItemFactura) or getattr(origin, "model", None) is ItemFactura):
+        return
+    recalcular_edicion(instance)
@@ -1,15 +1,29 @@
 import uuid 
-from datetime import datetime, timedelta
+import threading
+from datetime import datetime, timedelta, timezone
 
 from django.conf import settings
+from azure.core.exceptions import HttpResponseError, ResourceExistsError
 from azure.storage.blob import (
     BlobServiceClient, ContentSettings,
-    generate_blob_sas, BlobSasPermissions, BlobClient
+    generate_blob_sas, BlobSasPermissions
 )
 
 import re
 import unicodedata
 
+from .azure_http import shared_transport
+from .governor import get_governor
+
+# Cliente único por proceso + contenedores ya verificados
+_svc_instance = None
+_containers_ready = set()
+_lock = threading.Lock()
+
+# SAS ya emitidos: (container, blob_name) -> (url, vencimiento)
+_sas_cache = {}
+_sas_lock = threading.Lock()
+
 def normalize_filename(filename: str) -> str:
     """
     Normaliza el nombre de archivo para usarlo en Azure Blob:
@@ -50,54 +64,101 @@ def normalize_filename(filename: str) -> str:
 
     return safe_name
 
+def stream_chunk_size() -> int:
+    return int(getattr(settings, "BLOB_STREAM_CHUNK_BYTES", 4 * 1024 * 1024))
+
 def _svc() -> BlobServiceClient:
     """
-    Crea un BlobServiceClient usando account_url + account_key.
+    Devuelve el BlobServiceClient global (account_url + account_key).
+    Se crea una sola vez y comparte el pool HTTP de azure_http.
     """
-    account = settings.AZURE_STORAGE_ACCOUNT
-    key = settings.AZURE_STORAGE_KEY
-    if not account or not key:
-        raise RuntimeError("Faltan AZURE_STORAGE_ACCOUNT o AZURE_STORAGE_KEY")
-    account_url = f"https://{account}.blob.core.windows.net"
-    return BlobServiceClient(account_url=account_url, credential=key)
+    global _svc_instance
+    if _svc_instance is None:
+        with _lock:
+            if _svc_instance is None:
+                account = settings.AZURE_STORAGE_ACCOUNT
+                key = settings.AZURE_STORAGE_KEY
+                if not account or not key:
+                    raise RuntimeError("Faltan AZURE_STORAGE_ACCOUNT o AZURE_STORAGE_KEY")
+                account_url = f"https://{account}.blob.core.windows.net"
+                chunk = stream_chunk_size()
+                _svc_instance = BlobServiceClient(
+                    account_url=account_url,
+                    credential=key,
+                    transport=shared_transport(),
+                    retry_total=0,  # los reintentos los maneja el regulador (governor)
+                    # las descargas se leen en bloques de este tamaño (también el primero)
+                    max_single_get_size=chunk,
+                    max_chunk_get_size=chunk,
+                )
+    return _svc_instance
 
 def ensure_container(name: str):
-    svc = _svc()
+    """
+    Crea el contenedor si no existe. Se verifica una sola vez por proceso
+    (solo si quedó confirmado: un error transitorio se reintenta en la próxima llamada).
+    """
+    if name in _containers_ready:
+        return
     try:
-        svc.create_container(name)
-    except Exception:
-        # ya existe o no tenemos permiso para crear (ignorar en MVP)
+        get_governor("blob").call(_svc().create_container, name)
+    except ResourceExistsError:
         pass
-
-def upload_bytes(container: str, content: bytes, filename: str, content_type: str) -> str:
-    
-    #--- SIMULACIÓN ---
-    if getattr(settings, "USE_AZURE_SIMULATION", False):
-        print("MODO SIMULACIÓN ACTIVADO - Azure Blob no está siendo usado.")
-        blob_name = f"{uuid.uuid4()}-{filename}"
-        # Genera una URL ficticia que imita el formato de Azure
-        return f"https://simulacion.blob.core.windows.net/{container}/{blob_name}"
-    #--- FIN SIMULACIÓN ---
-    
+    except HttpResponseError as ex:
+        print(f"⚠️ No se pudo verificar el contenedor '{name}': {ex.status_code}")
+        if ex.status_code != 403:
+            return  # 503, throttling, etc.: no se memoriza
+        # sin permiso para crear: asumimos que ya existe (el upload fallará si no)
+    _containers_ready.add(name)
+
+def upload_bytes(container: str, content, filename: str, content_type: str) -> str:
+    """
+    Sube el contenido (bytes o archivo abierto, que se envía en bloques) y devuelve la URL del blob.
+    En modo simulación no se llama: storage.get_storage() usa el backend local.
+    """
     ensure_container(container)
     svc = _svc()
     blob_name = f"{uuid.uuid4()}-{filename}"
     blob = svc.get_blob_client(container=container, blob=blob_name)
-    blob.upload_blob(
-        content,
-        overwrite=True,
-        content_settings=ContentSettings(content_type=content_type or "application/octet-stream")
-    )
+
+    def _upload():
+        if hasattr(content, "seek"):
+            content.seek(0)  # en un reintento el stream ya fue leído
+        blob.upload_blob(
+            content,
+            overwrite=True,
+            content_settings=ContentSettings(content_type=content_type or "application/octet-stream")
+        )
+
+    get_governor("blob").call(_upload)
     return blob.url  # sin SAS
 
-def make_sas_url(container: str, blob_name: str, minutes: int = 15) -> str | None:
+def sas_minutes() -> int:
+    return int(getattr(settings, "AZURE_SAS_MINUTES", 15))
+
+def _sas_refresh_margin() -> timedelta:
+    return timedelta(seconds=int(getattr(settings, "AZURE_SAS_REFRESH_SECONDS", 120)))
+
+def get_sas(container: str, blob_name: str) -> tuple[str, datetime] | None:
+    """
+    Devuelve (url_sas, vencimiento) de solo lectura para el blob.
+    Reutiliza el último SAS emitido hasta AZURE_SAS_REFRESH_SECONDS antes de que venza,
+    así la URL es estable y el navegador puede cachear el documento.
+    """
     account = settings.AZURE_STORAGE_ACCOUNT
     key = settings.AZURE_STORAGE_KEY
     if not account or not key:
         # sin credenciales no se puede firmar
         return None
 
-    expiry = datetime.utcnow() + timedelta(minutes=minutes)
+    now = datetime.now(timezone.utc)
+    cache_key = (container, blob_name)
+    cached = _sas_cache.get(cache_key)
+    if cached and cached[1] - _sas_refresh_margin() > now:
+        return cached
+
+    minutes = sas_minutes()
+    expiry = now + timedelta(minutes=minutes)
 
     sas = generate_blob_sas(
         account_name=account,
@@ -107,8 +168,31 @@ def make_sas_url(container: str, blob_name: str, minutes: int = 15) -> str | Non
         expiry=expiry,
         # 👇 **ESTO ES CLAVE**: pasar la access key explícitamente
         account_key=key,
+        # el blob nunca cambia (nombre con uuid): que el navegador lo cachee mientras dure el SAS
+        cache_control=f"private, max-age={minutes * 60}",
     )
-    return f"https://{account}.blob.core.windows.net/{container}/{blob_name}?{sas}"
+    entry = (f"https://{account}.blob.core.windows.net/{container}/{blob_name}?{sas}", expiry)
+
+    with _sas_lock:
+        if len(_sas_cache) >= int(getattr(settings, "AZURE_SAS_CACHE_MAX", 2000)):
+            _prune_sas_cache(now)
+        _sas_cache[cache_key] = entry
+    return entry
+
+def _prune_sas_cache(now: datetime):
+    """
+    Quita los SAS vencidos; si sigue lleno, descarta la mitad más vieja.
+    """
+    for k in [k for k, (_, exp) in _sas_cache.items() if exp <= now]:
+        del _sas_cache[k]
+    max_size = int(getattr(settings, "AZURE_SAS_CACHE_MAX", 2000))
+    if len(_sas_cache) >= max_size:
+        for k in list(_sas_cache)[: max_size // 2]:
+            del _sas_cache[k]
+
+def make_sas_url(container: str, blob_name: str) -> str | None:
+    entry = get_sas(container, blob_name)
+    return entry[0] if entry else None
 
 def to_blob_name_from_url(url: str) -> str:
     return url.split('/')[-1].split('?')[0]
@@ -117,8 +201,33 @@ def download_bytes(container: str, blob_name: str) -> bytes:
     """
     Descarga el blob (útil como fallback).
     """
-    account = settings.AZURE_STORAGE_ACCOUNT
-    key = settings.AZURE_STORAGE_KEY
-    account_url = f"https://{account}.blob.core.windows.net"
-    bc = BlobClient(account_url=account_url, container_name=container, blob_name=blob_name, credential=key)
-    return bc.download_blob().readall()
+    bc = _svc().get_blob_client(container=container, blob=blob_name)
+    return get_governor("blob").call(lambda: bc.download_blob().readall())
+
+def get_blob_properties(container: str, blob_name: str):
+    """
+    Devuelve las propiedades del blob (size, etag, content_settings) sin descargarlo.
+    """
+    bc = _svc().get_blob_client(container=container, blob=blob_name)
+    return get_governor("blob").call(bc.get_blob_properties)
+
+def iter_blob_chunks(container: str, blob_name: str, offset: int = 0, length: int | None = None):
+    """
+    Descarga el blob (o el rango offset/length) en bloques de BLOB_STREAM_CHUNK_BYTES.
+    Nunca tiene más de un bloque en memoria. La descarga arranca al llamar
+    (los errores de Azure saltan acá, no a mitad de la respuesta).
+    """
+    bc = _svc().get_blob_client(container=container, blob=blob_name)
+    # retry_total aplica a los bloques siguientes, que se piden mientras se envía la respuesta
+    downloader = get_governor("blob").call(
+        bc.download_blob, offset=offset, length=length, max_concurrency=1, retry_total=3
+    )
+    return downloader.chunks()
+
+def blob_exists(container: str, blob_name: str) -> bool:
+    bc = _svc().get_blob_client(container=container, blob=blob_name)
+    return get_governor("blob").call(bc.exists)
+
+def delete_blob(container: str, blob_name: str):
+    bc = _svc().get_blob_client(container=container, blob=blob_name)
+    get_governor("blob").call(bc.delete_blob)
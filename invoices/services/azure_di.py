@@ -1,44 +1,71 @@
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
 from django.conf import settings
 
 from azure.core.credentials import AzureKeyCredential
 from azure.ai.documentintelligence import DocumentIntelligenceClient
 from azure.ai.documentintelligence.models import AnalyzeDocumentRequest
-from .azure_blob import to_blob_name_from_url, make_sas_url
+from . import di_simulator
+from .azure_http import shared_transport
+from .governor import get_governor
+from .storage import storage_for_url
 
+try:
+    import pypdf
+except ImportError:  # pragma: no cover - dependencia opcional
+    pypdf = None
 
-def _di_client() -> DocumentIntelligenceClient:
-    if not settings.AZ_DOCINT_ENDPOINT or not settings.AZ_DOCINT_KEY:
-        raise RuntimeError("Faltan AZ_DOCINT_ENDPOINT o AZ_DOCINT_KEY")
-    return DocumentIntelligenceClient(
-        endpoint=settings.AZ_DOCINT_ENDPOINT,
-        credential=AzureKeyCredential(settings.AZ_DOCINT_KEY)
-    )
+_di_client_instance = None
+_lock = threading.Lock()
 
-def analyze_invoice_from_url(file_url: str):
+
+def _di_client() -> DocumentIntelligenceClient:
     """
-    Ejecuta prebuilt-invoice pasando una URL (idealmente con SAS).
-    Devuelve el objeto 'result' del poller.
+    Devuelve el cliente de DI global del proceso (se crea una sola vez
+    y reutiliza las conexiones del pool compartido).
     """
+    global _di_client_instance
+    if _di_client_instance is None:
+        with _lock:
+            if _di_client_instance is None:
+                if not settings.AZ_DOCINT_ENDPOINT or not settings.AZ_DOCINT_KEY:
+                    raise RuntimeError("Faltan AZ_DOCINT_ENDPOINT o AZ_DOCINT_KEY")
+                _di_client_instance = DocumentIntelligenceClient(
+                    endpoint=settings.AZ_DOCINT_ENDPOINT,
+                    credential=AzureKeyCredential(settings.AZ_DOCINT_KEY),
+                    transport=shared_transport(),
+                    retry_total=0,  # los reintentos los maneja el regulador (governor)
+                )
+    return _di_client_instance
+
+def _analyze(body):
     client = _di_client()
     model_id = settings.AZ_DOCINT_MODEL or "prebuilt-invoice"
-    poller = client.begin_analyze_document(model_id, AnalyzeDocumentRequest(url_source=file_url))
+    poller = client.begin_analyze_document(model_id, body)
     return poller.result()
 
+def analyze_invoice_from_url(file_url: str):
+    """
+    Ejecuta prebuilt-invoice pasando una URL (idealmente con SAS).
+    Devuelve el objeto 'result' del poller (con rate limit y reintentos del regulador).
+    """
+    return get_governor("di").call(_analyze, AnalyzeDocumentRequest(url_source=file_url))
+
 def analyze_invoice_from_bytes(data: bytes):
     """
     Ejecuta prebuilt-invoice enviando bytes (no necesita SAS).
     content_type se ignora para DI; solo es útil para tu control.
     """
-    client = _di_client()
-    model_id = settings.AZ_DOCINT_MODEL or "prebuilt-invoice"
-    poller = client.begin_analyze_document(model_id, data)
-    return poller.result()
+    return get_governor("di").call(_analyze, data)
 
 
 def analyze_invoice_auto(data: bytes, blob_url: str):
     """
     Política:
-    - Si USE_AZURE_SIMULATION está activo, devuelve datos simulados.
+    - Si USE_AZURE_SIMULATION está activo, devuelve una factura sintética (di_simulator).
     - Si no, se conecta normalmente a Azure:
         - DI_ANALYZE_MODE = 'sas': intenta SAS -> fallback bytes
         - DI_ANALYZE_MODE = 'bytes': bytes directo
@@ -48,125 +75,27 @@ def analyze_invoice_auto(data: bytes, blob_url: str):
     """
     
     # -------------------------------------------------------------
-    # MODO SIMULACIÓN
+    # MODO SIMULACIÓN (facturas sintéticas configurables, ver di_simulator)
     # -------------------------------------------------------------
-    # --- MODO SIMULACIÓN (actualizado con campos argentinos) ---
     if getattr(settings, "USE_AZURE_SIMULATION", False):
         print("⚙️  MODO SIMULACIÓN ACTIVADO - Azure DI no está siendo usado.")
-        from types import SimpleNamespace
-        import datetime
-
-        class FakeField:
-            def __init__(
-                self,
-                value_string=None,
-                value_number=None,
-                value_currency=None,
-                value_date=None,
-                value_address=None,
-            ):
-                self.value_string = value_string
-                self.value_number = float(value_number) if value_number is not None else None
-                self.value_currency = (
-                    SimpleNamespace(amount=float(value_currency))
-                    if value_currency is not None
-                    else None
-                )
-                self.value_date = value_date
-                self.value_address = value_address
-                self.confidence = 0.99
-
-        # --- Ítems simulados (sin IVA) ---
-        fake_items = [
-            SimpleNamespace(
-                value_object={
-                    "Description": FakeField(value_string="Aceite Natura 1L"),
-                    "Quantity": FakeField(value_number=6),
-                    "UnitPrice": FakeField(value_currency=1300.0),
-                    "Amount": FakeField(value_currency=7800.0),
-                }
-            ),
-            SimpleNamespace(
-                value_object={
-                    "Description": FakeField(value_string="Yerba M. Playadito 1kg"),
-                    "Quantity": FakeField(value_number=3),
-                    "UnitPrice": FakeField(value_currency=2100.0),
-                    "Amount": FakeField(value_currency=6300.0),
-                }
-            ),
-            SimpleNamespace(
-                value_object={
-                    "Description": FakeField(value_string="Harina Pureza 000"),
-                    "Quantity": FakeField(value_number=10),
-                    "UnitPrice": FakeField(value_currency=950.0),
-                    "Amount": FakeField(value_currency=9500.0),
-                }
-            ),
-            SimpleNamespace(
-                value_object={
-                    "Description": FakeField(value_string="Spaghetti Lucchetti 500g"),
-                    "Quantity": FakeField(value_number=12),
-                    "UnitPrice": FakeField(value_currency=750.0),
-                    "Amount": FakeField(value_currency=9000.0),
-                }
-            ),
-            SimpleNamespace(
-                value_object={
-                    "Description": FakeField(value_string="Coca Cola 1.5L"),
-                    "Quantity": FakeField(value_number=8),
-                    "UnitPrice": FakeField(value_currency=1800.0),
-                    "Amount": FakeField(value_currency=14400.0),
-                }
-            ),
-        ]
-
-        # --- Totales coherentes ---
-        subtotal = sum(it.value_object["Amount"].value_currency.amount for it in fake_items)
-        total_tax = round(subtotal * 0.21, 2)
-        total = subtotal + total_tax
-
-        # --- Campos principales simulados ---
-        fake_fields = {
-            "VendorName": FakeField(value_string="Distribuidora Río Cuarto SRL"),
-            "VendorTaxId": FakeField(value_string="30-87654321-0"),
-            "VendorAddress": FakeField(value_address="Av. Italia 950"),
-            "InvoiceId": FakeField(value_string="000456"),
-            "InvoiceDate": FakeField(value_date=datetime.date(2025, 10, 12)),
-            "SubTotal": FakeField(value_currency=subtotal),
-            "TotalTax": FakeField(value_currency=total_tax),
-            "InvoiceTotal": FakeField(value_currency=total),
-            "PaymentTerm": FakeField(value_string="Cuenta Corriente 30 días"),
-
-            # --- Campos argentinos / fiscales ---
-            "InvoiceType": FakeField(value_string="B"),  # tipo comprobante
-            "PointOfSale": FakeField(value_string="0002"),
-            "CAE": FakeField(value_string="67891234567891"),
-            "CAEDueDate": FakeField(value_date=datetime.date(2025, 11, 12)),
-            "Currency": FakeField(value_string="ARS"),
-            "ExchangeRate": FakeField(value_currency=1.0),
-
-            "Items": SimpleNamespace(value_array=fake_items),
-        }
-
-        fake_doc = SimpleNamespace(
-            documents=[SimpleNamespace(fields=fake_fields)]
-        )
-
-        return fake_doc
-
+        # pasa por el regulador igual que Azure (para probar throttling simulado)
+        return get_governor("di").call(di_simulator.analyze, data)
 
     # --- FIN SIMULACIÓN ---
 
     # --- FLUJO NORMAL CON AZURE ---
-    
-    mode = getattr(settings, "DI_ANALYZE_MODE", "auto")
-    mb = len(data) / (1024 * 1024)
-    threshold = float(getattr(settings, "DI_INLINE_BYTES_MAX_MB", 5.0))
+
+    # PDFs largos: se parten en rangos de páginas y se analizan en paralelo
+    chunks = split_pdf_pages(data)
+    if chunks:
+        with ThreadPoolExecutor(max_workers=_split_max_workers()) as pool:
+            results = list(pool.map(analyze_invoice_from_bytes, chunks))
+        return merge_di_results(results)
 
     def _try_sas_then_bytes():
         try:
-            blob_name = to_blob_name_from_url(blob_url)
-            sas_url = make_sas_url(settings.AZURE_BLOB_CONTAINER, blob_name, minutes=15)
+            sas_url = _sas_url_for(blob_url)
             if sas_url:
                 return analyze_invoice_from_url(sas_url)
         except Exception:
@@ -174,17 +103,108 @@ def analyze_invoice_auto(data: bytes, blob_url: str):
         # fallback
         return analyze_invoice_from_bytes(data)
 
-    if mode == "bytes":
-        return analyze_invoice_from_bytes(data)
-    if mode == "sas":
-        return _try_sas_then_bytes()
-    # auto
-    if mb <= threshold:
-        # pequeño → bytes
+    if _analyze_path(data) == "bytes":
         return analyze_invoice_from_bytes(data)
-    # grande → SAS preferente
     return _try_sas_then_bytes()
 
+
+def _sas_url_for(blob_url: str) -> str | None:
+    """
+    URL firmada para que DI lea el original directo del storage
+    (None si el backend no la soporta, p. ej. disco local, o si se analiza
+    un contenido distinto del original archivado).
+    """
+    if not blob_url:
+        return None
+    backend = storage_for_url(blob_url)
+    signed = backend.signed_url(backend.name_from_url(blob_url))
+    return signed[0] if signed else None
+
+
+def _analyze_path(data: bytes) -> str:
+    """
+    Decide cómo enviar el documento a DI según DI_ANALYZE_MODE:
+    'bytes' (directo) o 'sas' (URL firmada con fallback a bytes).
+    """
+    mode = getattr(settings, "DI_ANALYZE_MODE", "auto")
+    if mode in ("bytes", "sas"):
+        return mode
+    # auto: pequeño → bytes, grande → SAS preferente
+    mb = len(data) / (1024 * 1024)
+    threshold = float(getattr(settings, "DI_INLINE_BYTES_MAX_MB", 5.0))
+    return "bytes" if mb <= threshold else "sas"
+
+
+# -------------------------------------------------------------
+# PDFs LARGOS: ANÁLISIS POR RANGOS DE PÁGINAS
+# -------------------------------------------------------------
+def _split_max_workers() -> int:
+    return max(1, int(getattr(settings, "DI_SPLIT_MAX_WORKERS", 4)))
+
+
+def split_pdf_pages(data: bytes) -> list[bytes] | None:
+    """
+    Si DI_SPLIT_ENABLED y el PDF tiene al menos DI_SPLIT_MIN_PAGES páginas,
+    lo parte en PDFs de DI_SPLIT_PAGES_PER_CHUNK páginas (en orden).
+    Devuelve None si no corresponde partir o si pypdf no puede leerlo
+    (encriptado, mal formado): en ese caso DI analiza el documento entero.
+    """
+    if not getattr(settings, "DI_SPLIT_ENABLED", False) or pypdf is None:
+        return None
+    if data[:5] != b"%PDF-":
+        return None
+
+    try:
+        reader = pypdf.PdfReader(io.BytesIO(data))
+        n_pages = len(reader.pages)
+        if n_pages < int(getattr(settings, "DI_SPLIT_MIN_PAGES", 8)):
+            return None
+
+        per_chunk = max(1, int(getattr(settings, "DI_SPLIT_PAGES_PER_CHUNK", 4)))
+        chunks = []
+        for start in range(0, n_pages, per_chunk):
+            writer = pypdf.PdfWriter()
+            for page in reader.pages[start:start + per_chunk]:
+                writer.add_page(page)
+            out = io.BytesIO()
+            writer.write(out)
+            chunks.append(out.getvalue())
+    except Exception as ex:  # pypdf lanza errores propios y también KeyError/ValueError
+        print(f"⚠️ No se pudo partir el PDF ({ex}); se analiza completo")
+        return None
+    print(f"📄 PDF de {n_pages} páginas partido en {len(chunks)} rangos para DI")
+    return chunks
+
+
+def merge_di_results(results):
+    """
+    Une los resultados de DI de cada rango de páginas en uno solo:
+    - la cabecera sale del primer rango (los campos que falten se toman de los siguientes,
+      p. ej. totales que solo aparecen en la última página)
+    - los Items de todos los rangos se concatenan en orden, con la menor confianza
+      entre los rangos
+    Devuelve un objeto con la misma forma que lee map_invoice_result.
+    """
+    fields = {}
+    items = []
+    confianzas = []
+    for res in results:
+        if not res or not res.documents:
+            continue
+        for key, field in (res.documents[0].fields or {}).items():
+            if key == "Items":
+                items.extend(getattr(field, "value_array", None) or [])
+                if getattr(field, "confidence", None) is not None:
+                    confianzas.append(field.confidence)
+            elif key not in fields:
+                fields[key] = field
+    # se lee como cualquier otro campo (debug_invoice_fields, confianza en la vista previa)
+    fields["Items"] = SimpleNamespace(
+        value_array=items, value_string=None, confidence=min(confianzas, default=None),
+    )
+    return SimpleNamespace(documents=[SimpleNamespace(fields=fields)])
+
+
 def debug_invoice_fields(di_result):
     if not di_result or not di_result.documents:
         print("⚠️ No hay documentos en el resultado")
@@ -0,0 +1,173 @@
+"""
+azure_di_async.py
+----------------------------------------
+Variante asíncrona (asyncio) del análisis con Document Intelligence.
+
+A diferencia de `azure_di`, acá el polling de la operación larga no bloquea un
+thread: cada análisis es una corrutina, y muchos documentos en vuelo comparten
+un único event loop (vistas async bajo ASGI o un worker de ingesta).
+
+Uso típico desde un worker:
+
+    results = asyncio.run(analyze_many_async([(data, blob_url), ...]))
+"""
+
+import asyncio
+import threading
+import weakref
+
+import aiohttp
+from django.conf import settings
+
+from azure.core.credentials import AzureKeyCredential
+from azure.core.pipeline.transport import AioHttpTransport
+from azure.ai.documentintelligence.aio import DocumentIntelligenceClient
+from azure.ai.documentintelligence.models import AnalyzeDocumentRequest
+
+from . import di_simulator
+from .azure_di import _analyze_path, _sas_url_for, merge_di_results, split_pdf_pages
+from .governor import get_governor
+
+# Un cliente por event loop (las sesiones aiohttp no se pueden compartir entre loops)
+_clients = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def _poll_interval() -> float:
+    return float(getattr(settings, "DI_POLL_INTERVAL_SECONDS", 1.0))
+
+
+def _timeout() -> float | None:
+    t = float(getattr(settings, "DI_ANALYZE_TIMEOUT_SECONDS", 120))
+    return t if t > 0 else None
+
+
+def _max_concurrency() -> int:
+    return max(1, int(getattr(settings, "DI_ASYNC_MAX_CONCURRENCY", 16)))
+
+
+async def _di_client_async() -> DocumentIntelligenceClient:
+    """
+    Devuelve el cliente async de DI asociado al event loop actual.
+    Se crea una vez por loop, con una sesión aiohttp propia y pool limitado.
+    """
+    loop = asyncio.get_running_loop()
+    entry = _clients.get(loop)
+    if entry is not None:
+        return entry[0]
+
+    if not settings.AZ_DOCINT_ENDPOINT or not settings.AZ_DOCINT_KEY:
+        raise RuntimeError("Faltan AZ_DOCINT_ENDPOINT o AZ_DOCINT_KEY")
+
+    with _lock:
+        entry = _clients.get(loop)
+        if entry is None:
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=_max_concurrency())
+            )
+            client = DocumentIntelligenceClient(
+                endpoint=settings.AZ_DOCINT_ENDPOINT,
+                credential=AzureKeyCredential(settings.AZ_DOCINT_KEY),
+                transport=AioHttpTransport(session=session, session_owner=False),
+                retry_total=0,  # los reintentos los maneja el regulador (governor)
+            )
+            entry = (client, session)
+            _clients[loop] = entry
+    return entry[0]
+
+
+async def close_async_clients():
+    """
+    Cierra el cliente (y su sesión aiohttp) del loop actual.
+    Llamar al apagar el worker para no dejar conexiones abiertas.
+    """
+    entry = _clients.pop(asyncio.get_running_loop(), None)
+    if entry is None:
+        return
+    client, session = entry
+    await client.close()
+    await session.close()
+
+
+async def _analyze_async(body, polling_interval: float | None, timeout: float | None):
+    """
+    Envía el documento y espera el resultado de la operación larga sin bloquear el loop.
+    Si la tarea se cancela o vence el timeout, se deja de consultar a DI
+    (la operación en Azure no se puede abortar, solo se abandona).
+    """
+    client = await _di_client_async()
+    model_id = settings.AZ_DOCINT_MODEL or "prebuilt-invoice"
+
+    async def _wait():
+        poller = await client.begin_analyze_document(
+            model_id,
+            body,
+            polling_interval=polling_interval or _poll_interval(),
+        )
+        return await poller.result()
+
+    return await asyncio.wait_for(_wait(), timeout=timeout if timeout is not None else _timeout())
+
+
+async def analyze_invoice_from_url_async(file_url: str, *, polling_interval: float | None = None,
+                                         timeout: float | None = None):
+    """
+    Igual que analyze_invoice_from_url pero asíncrono.
+    """
+    return await get_governor("di").acall(
+        _analyze_async, AnalyzeDocumentRequest(url_source=file_url), polling_interval, timeout
+    )
+
+
+async def analyze_invoice_from_bytes_async(data: bytes, *, polling_interval: float | None = None,
+                                           timeout: float | None = None):
+    """
+    Igual que analyze_invoice_from_bytes pero asíncrono.
+    """
+    return await get_governor("di").acall(_analyze_async, data, polling_interval, timeout)
+
+
+async def analyze_invoice_auto_async(data: bytes, blob_url: str, **kwargs):
+    """
+    Misma política que analyze_invoice_auto (simulación, 'sas', 'bytes', 'auto'),
+    en versión asíncrona. kwargs: polling_interval, timeout.
+    """
+    if getattr(settings, "USE_AZURE_SIMULATION", False):
+        return await get_governor("di").acall(di_simulator.analyze_async, data)
+
+    chunks = await asyncio.to_thread(split_pdf_pages, data)
+    if chunks:
+        results = await asyncio.gather(
+            *(analyze_invoice_from_bytes_async(chunk, **kwargs) for chunk in chunks)
+        )
+        return merge_di_results(results)
+
+    if _analyze_path(data) == "bytes":
+        return await analyze_invoice_from_bytes_async(data, **kwargs)
+
+    try:
+        sas_url = _sas_url_for(blob_url)
+        if sas_url:
+            return await analyze_invoice_from_url_async(sas_url, **kwargs)
+    except (asyncio.CancelledError, asyncio.TimeoutError):
+        raise
+    except Exception:
+        pass
+    # fallback
+    return await analyze_invoice_from_bytes_async(data, **kwargs)
+
+
+async def analyze_many_async(documents, *, concurrency: int | None = None, **kwargs):
+    """
+    Analiza muchos documentos [(data, blob_url), ...] en paralelo sobre el mismo loop.
+    Devuelve una lista en el mismo orden: el resultado de DI o la excepción
+    de ese documento (un error no cancela al resto).
+    """
+    sem = asyncio.Semaphore(concurrency or _max_concurrency())
+
+    async def _one(data, blob_url):
+        async with sem:
+            return await analyze_invoice_auto_async(data, blob_url, **kwargs)
+
+    tasks = [_one(data, blob_url) for data, blob_url in documents]
+    return await asyncio.gather(*tasks, return_exceptions=True)
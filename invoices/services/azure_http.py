@@ -0,0 +1,54 @@
+"""
+azure_http.py
+----------------------------------------
+Transporte HTTP compartido para los clientes de Azure (Blob y Document Intelligence).
+
+Todos los clientes usan la misma `requests.Session`, así las conexiones TLS
+se reutilizan entre llamadas en lugar de abrir un handshake nuevo cada vez.
+El tamaño del pool se ajusta con AZURE_HTTP_POOL_SIZE (≈ concurrencia del worker).
+"""
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from azure.core.pipeline.transport import RequestsTransport
+from django.conf import settings
+
+_session = None
+_lock = threading.Lock()
+
+
+def pool_size() -> int:
+    return max(1, int(getattr(settings, "AZURE_HTTP_POOL_SIZE", 10)))
+
+
+def shared_session() -> requests.Session:
+    """
+    Devuelve la sesión HTTP global del proceso, creándola una sola vez.
+    Los reintentos quedan desactivados en urllib3: los maneja el pipeline de Azure.
+    """
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                size = pool_size()
+                adapter = HTTPAdapter(
+                    pool_connections=size,
+                    pool_maxsize=size,
+                    max_retries=Retry(total=False, redirect=False, raise_on_status=False),
+                )
+                session = requests.Session()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def shared_transport() -> RequestsTransport:
+    """
+    Transporte de Azure montado sobre la sesión compartida.
+    session_owner=False evita que cerrar un cliente cierre el pool de todos.
+    """
+    return RequestsTransport(session=shared_session(), session_owner=False)
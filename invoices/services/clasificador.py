@@ -0,0 +1,203 @@
+"""
+clasificador.py
+----------------------------------------
+Clasifica las líneas de una factura en producto / impuesto / resumen a partir
+de las reglas de la tabla ReglaClasificacion (editables desde el admin).
+
+- Cada regla es una palabra o frase que se busca como palabra completa, sin
+  mayúsculas ni acentos ("total" no matchea "Totalmente", "retencion" matchea "Retención").
+- Todas las reglas se compilan en UNA sola regex por proveedor (reglas del
+  proveedor primero, después las generales, cada grupo por prioridad): la
+  primera alternativa que aparece en la descripción decide el tipo. La unión no
+  es más barata en orden (el motor prueba las alternativas una tras otra), pero
+  recorre todas las reglas en C en lugar de un bucle de Python por regla.
+  Si una regla no puede ir en la unión (grupos con nombre o referencias como
+  \\1, que dentro de la unión cambian de sentido) o la unión no compila, ese
+  proveedor se evalúa regla por regla, en el mismo orden.
+- Lo compilado se guarda en memoria del proceso; se invalida al guardar o borrar
+  una regla (señal) y cada CLASIFICADOR_CACHE_SECONDS para ver cambios hechos
+  desde otros procesos.
+
+Sin reglas que apliquen, la línea es "producto".
+"""
+
+import re
+import threading
+import time
+import unicodedata
+
+from django.conf import settings
+from django.db import DatabaseError
+
+DEFAULT_TIPO = "producto"
+
+# Se usan si la tabla todavía no existe (ej. antes de migrar); son las reglas iniciales
+_REGLAS_BASE = [
+    # (patron, tipo_item, prioridad)
+    ("iva", "impuesto", 10),
+    ("impuesto", "impuesto", 10),
+    ("impuestos", "impuesto", 10),
+    ("retencion", "impuesto", 10),
+    ("retenciones", "impuesto", 10),
+    ("percepcion", "impuesto", 10),
+    ("percepciones", "impuesto", 10),
+    ("subtotal", "resumen", 20),
+    ("total", "resumen", 20),
+    ("saldo", "resumen", 20),
+]
+
+# referencia a un grupo (\1 o (?P=nombre)) que no esté escapada
+_BACKREF_RE = re.compile(r"(?<!\\)(?:\\\\)*\\[1-9]|\(\?P=")
+
+_lock = threading.Lock()
+_state = {"loaded_at": 0.0, "general": [], "por_proveedor": {}, "cuits": {}, "compiled": {}}
+
+
+def fold(text: str) -> str:
+    """
+    Minúsculas, sin acentos y con espacios simples (forma en la que se comparan las reglas).
+    """
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(text.lower().split())
+
+
+def validar_regla(patron: str, es_regex: bool) -> str | None:
+    """
+    Motivo por el que la regla no sirve (o no puede ir en la regex unión); None si está bien.
+    """
+    if not es_regex:
+        return None if fold(patron) else "La regla no tiene ninguna palabra"
+    try:
+        compiled = re.compile(patron)
+    except re.error as ex:
+        return f"Regex inválida: {ex}"
+    if compiled.groupindex:
+        return "La regex no puede tener grupos con nombre (?P<...>)"
+    if _BACKREF_RE.search(patron):
+        return "La regex no puede tener referencias a grupos (\\1, (?P=...))"
+    return None
+
+
+def _rule_regex(patron: str, es_regex: bool) -> str | None:
+    if es_regex:
+        pattern = patron
+    else:
+        words = fold(patron).split()
+        if not words:
+            return None
+        pattern = r"\b" + r"\s+".join(re.escape(w) for w in words) + r"\b"
+    try:
+        re.compile(pattern)
+    except re.error as ex:
+        print(f"⚠️ Regla de clasificación inválida '{patron}': {ex}")
+        return None
+    return pattern
+
+
+def invalidate_cache():
+    with _lock:
+        _state["loaded_at"] = 0.0
+        _state["compiled"] = {}
+
+
+def _load():
+    """
+    Lee las reglas activas (una consulta) y el CUIT de los proveedores que tienen reglas propias.
+    """
+    from invoices.models import ReglaClasificacion
+
+    general, por_proveedor, cuits = [], {}, {}
+    try:
+        rows = (
+            ReglaClasificacion.objects.filter(activo=True)
+            .order_by("prioridad", "id")
+            .values_list("patron", "es_regex", "tipo_item", "proveedor_id", "proveedor__id_fiscal")
+        )
+        for patron, es_regex, tipo, proveedor_id, id_fiscal in rows:
+            pattern = _rule_regex(patron, es_regex)
+            if pattern is None:
+                continue
+            if proveedor_id is None:
+                general.append((pattern, tipo))
+            else:
+                por_proveedor.setdefault(proveedor_id, []).append((pattern, tipo))
+                if id_fiscal:
+                    cuits[re.sub(r"\D", "", id_fiscal)] = proveedor_id
+    except DatabaseError as ex:
+        print(f"⚠️ No se pudieron leer las reglas de clasificación ({ex}); se usan las reglas base")
+        general = [(_rule_regex(p, False), t) for p, t, _ in _REGLAS_BASE]
+
+    _state.update(loaded_at=time.monotonic(), general=general, por_proveedor=por_proveedor,
+                  cuits=cuits, compiled={})
+
+
+def _compile(rules):
+    """
+    ^(?:.*?(?P<r0>regla0)|.*?(?P<r1>regla1)|...): las alternativas se prueban en
+    orden, así que gana la regla de mayor prioridad que aparezca en el texto, aunque
+    otra aparezca antes. Es secuencial: sin match, cada alternativa recorre el texto
+    entero (O(reglas × largo), igual que de_a_una). Un union.search sin ".*?" sería
+    una sola pasada, pero ganaría la regla que aparece primero y no la de mayor prioridad.
+    Devuelve una función texto → tipo (o None si ninguna regla aplica).
+    """
+    if not rules:
+        return None
+    tipos = [tipo for _, tipo in rules]
+
+    if not any(validar_regla(pattern, True) for pattern, _ in rules):
+        alternatives = "|".join(f".*?(?P<r{i}>{pattern})" for i, (pattern, _) in enumerate(rules))
+        try:
+            union = re.compile(f"^(?:{alternatives})", re.S)
+        except re.error as ex:
+            print(f"⚠️ No se pudo compilar la unión de {len(rules)} reglas ({ex}); se evalúan de a una")
+        else:
+            def por_union(texto):
+                m = union.match(texto)
+                return tipos[int(m.lastgroup[1:])] if m else None
+            return por_union
+
+    # misma semántica: la primera regla (en orden) que aparece en el texto
+    regexes = [re.compile(pattern, re.S) for pattern, _ in rules]
+
+    def de_a_una(texto):
+        return next((tipo for regex, tipo in zip(regexes, tipos) if regex.search(texto)), None)
+    return de_a_una
+
+
+def _matcher(proveedor_id):
+    ttl = float(getattr(settings, "CLASIFICADOR_CACHE_SECONDS", 300))
+    with _lock:
+        if not _state["loaded_at"] or time.monotonic() - _state["loaded_at"] > ttl:
+            _load()
+        key = proveedor_id if proveedor_id in _state["por_proveedor"] else None
+        if key not in _state["compiled"]:
+            rules = _state["por_proveedor"].get(key, []) + _state["general"]
+            _state["compiled"][key] = _compile(rules)
+        return _state["compiled"][key]
+
+
+def proveedor_id_for_cuit(cuit: str | None):
+    """
+    Id del proveedor con reglas propias para ese CUIT (None si no tiene).
+    """
+    if not cuit:
+        return None
+    _matcher(None)  # asegura las reglas cargadas
+    return _state["cuits"].get(re.sub(r"\D", "", cuit))
+
+
+def clasificar_items(descripciones, proveedor_id=None, cuit: str | None = None) -> list[str]:
+    """
+    Clasifica todas las descripciones de una factura de una vez.
+    Se puede indicar el proveedor por id o por CUIT (para aplicar sus excepciones).
+    """
+    if proveedor_id is None and cuit:
+        proveedor_id = proveedor_id_for_cuit(cuit)
+    clasificar = _matcher(proveedor_id)
+
+    result = []
+    for desc in descripciones:
+        tipo = clasificar(fold(desc)) if clasificar is not None and desc else None
+        result.append(tipo or DEFAULT_TIPO)
+    return result
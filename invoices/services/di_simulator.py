@@ -0,0 +1,244 @@
+"""
+di_simulator.py
+----------------------------------------
+Reemplazo local de Document Intelligence para USE_AZURE_SIMULATION.
+
+Genera facturas aleatorias con la misma forma que el resultado de DI
+(documents[0].fields con value_string / value_currency / ...), para poder
+probar mapeo, reconocimiento de productos, duplicados y confirmación a escala.
+
+Todo se configura desde settings (DI_SIM_*):
+    - DI_SIM_SEED: semilla; con la misma semilla se repite la misma secuencia de facturas
+    - DI_SIM_LINES_MIN / DI_SIM_LINES_MAX: cantidad de ítems por factura
+    - DI_SIM_SUPPLIERS: cantidad de proveedores distintos
+    - DI_SIM_CONFIDENCE_MIN / DI_SIM_CONFIDENCE_MAX: rango de confianza de los campos
+    - DI_SIM_LATENCY_MS / DI_SIM_LATENCY_JITTER_MS: demora artificial por análisis
+    - DI_SIM_ERROR_RATE / DI_SIM_ERROR_STATUS: fracción de análisis que fallan y con qué códigos
+"""
+
+import asyncio
+import datetime
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+from azure.core.exceptions import HttpResponseError
+from django.conf import settings
+
+
+class SimulatedDIError(HttpResponseError):
+    """
+    Error simulado con la forma de un error HTTP de Azure (status_code, retry_after).
+    """
+
+    def __init__(self, status_code: int, retry_after: float | None = None):
+        super().__init__(message=f"Error simulado de Document Intelligence ({status_code})")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class FakeField:
+    def __init__(
+        self,
+        value_string=None,
+        value_number=None,
+        value_currency=None,
+        value_date=None,
+        value_address=None,
+        confidence=0.99,
+    ):
+        self.value_string = value_string
+        self.value_number = float(value_number) if value_number is not None else None
+        self.value_currency = (
+            SimpleNamespace(amount=float(value_currency))
+            if value_currency is not None
+            else None
+        )
+        self.value_date = value_date
+        self.value_address = value_address
+        self.confidence = confidence
+
+
+# --- Catálogo base para armar ítems y proveedores ---
+_PRODUCTOS = [
+    ("Aceite Natura", ["900ml", "1L", "1.5L"], (1100, 2600)),
+    ("Yerba M. Playadito", ["500g", "1kg"], (1200, 2600)),
+    ("Harina Pureza 000", ["1kg"], (700, 1200)),
+    ("Harina Blancaflor leudante", ["1kg"], (900, 1500)),
+    ("Spaghetti Lucchetti", ["500g"], (600, 950)),
+    ("Fideos Matarazzo tirabuzón", ["500g"], (700, 1100)),
+    ("Coca Cola", ["500ml", "1.5L", "2.25L"], (900, 2800)),
+    ("Sprite", ["1.5L", "2.25L"], (1200, 2500)),
+    ("Agua Villavicencio", ["500ml", "1.5L"], (500, 1200)),
+    ("Cerveza Quilmes", ["473ml", "1L"], (900, 2100)),
+    ("Cerveza Stella Artois", ["473ml", "975ml"], (1300, 3000)),
+    ("Fernet Branca", ["750ml", "1L"], (9000, 14000)),
+    ("Vino Malbec Alamos", ["750ml"], (5500, 8000)),
+    ("Azúcar Ledesma", ["1kg"], (900, 1400)),
+    ("Leche La Serenísima", ["1L"], (1000, 1500)),
+    ("Queso cremoso Sancor", ["1kg"], (6500, 9000)),
+    ("Papas fritas Lays", ["85g", "250g"], (900, 3000)),
+    ("Café La Virginia", ["500g"], (4500, 7000)),
+    ("Servilletas Elite", ["x100"], (700, 1300)),
+    ("Detergente Magistral", ["500ml", "750ml"], (1500, 2600)),
+    ("Lavandina Ayudín", ["1L", "2L"], (800, 1700)),
+    ("Mayonesa Hellmann's", ["250g", "500g"], (1100, 2300)),
+    ("Arroz Gallo Oro", ["1kg"], (1300, 2000)),
+    ("Limones", ["x kg"], (800, 1800)),
+]
+
+_RUBROS = ["Distribuidora", "Mayorista", "Comercial", "Logística", "Bebidas", "Alimentos"]
+_LUGARES = ["Río Cuarto", "del Sur", "Córdoba", "Central", "Norte", "Pampa", "Andina", "Litoral"]
+_SOCIEDADES = ["SRL", "SA", "SAS"]
+_CALLES = ["Av. Italia", "San Martín", "Belgrano", "Sobremonte", "Constitución", "Av. España"]
+_PAGOS = ["Contado", "Cuenta Corriente 15 días", "Cuenta Corriente 30 días", "Transferencia"]
+
+_rng = None
+_rng_lock = threading.Lock()
+
+
+def _cfg(name: str, default):
+    return getattr(settings, name, default)
+
+
+def _next_seed() -> int:
+    """
+    Semilla para el próximo documento. Con DI_SIM_SEED la secuencia es reproducible;
+    sin semilla cada factura es distinta.
+    """
+    global _rng
+    with _rng_lock:
+        if _rng is None:
+            seed = _cfg("DI_SIM_SEED", None)
+            _rng = random.Random(int(seed)) if seed not in (None, "") else random.Random()
+        return _rng.getrandbits(64)
+
+
+def _supplier(index: int):
+    """
+    Proveedor sintético estable para un índice (mismo nombre y CUIT siempre).
+    """
+    r = random.Random(f"proveedor-{index}")
+    nombre = f"{r.choice(_RUBROS)} {r.choice(_LUGARES)} {r.choice(_SOCIEDADES)}"
+    if index >= len(_RUBROS) * len(_LUGARES):
+        nombre = f"{nombre} {index}"
+    cuit = f"30-{r.randint(10000000, 99999999)}-{r.randint(0, 9)}"
+    direccion = f"{r.choice(_CALLES)} {r.randint(100, 3000)}"
+    puntos_venta = [f"{r.randint(1, 20):04d}" for _ in range(2)]
+    return nombre, cuit, direccion, puntos_venta
+
+
+def build_invoice(seed: int):
+    """
+    Arma una factura simulada (mismo formato que el resultado de DI) a partir de una semilla.
+    """
+    r = random.Random(seed)
+    conf_min = float(_cfg("DI_SIM_CONFIDENCE_MIN", 0.6))
+    conf_max = float(_cfg("DI_SIM_CONFIDENCE_MAX", 0.99))
+
+    def conf():
+        return round(r.uniform(conf_min, conf_max), 3)
+
+    def field(**kwargs):
+        return FakeField(confidence=conf(), **kwargs)
+
+    # --- Ítems ---
+    n_lines = r.randint(int(_cfg("DI_SIM_LINES_MIN", 3)), int(_cfg("DI_SIM_LINES_MAX", 40)))
+    items = []
+    subtotal = 0.0
+    for _ in range(n_lines):
+        nombre, presentaciones, (pmin, pmax) = r.choice(_PRODUCTOS)
+        desc = f"{nombre} {r.choice(presentaciones)}"
+        qty = r.randint(1, 24)
+        unit_price = round(r.uniform(pmin, pmax), 2)
+        amount = round(qty * unit_price, 2)
+        subtotal += amount
+        obj = {
+            "Description": field(value_string=desc),
+            "Quantity": field(value_number=qty),
+            "UnitPrice": field(value_currency=unit_price),
+            "Amount": field(value_currency=amount),
+        }
+        if r.random() < 0.5:
+            obj["ProductCode"] = field(value_string=f"{r.randint(1, 99999):05d}")
+        items.append(SimpleNamespace(value_object=obj))
+
+    subtotal = round(subtotal, 2)
+    total_tax = round(subtotal * 0.21, 2)
+    total = round(subtotal + total_tax, 2)
+
+    # algunas facturas traen renglones de impuesto / resumen mezclados con los ítems
+    if r.random() < 0.2:
+        items.append(SimpleNamespace(value_object={
+            "Description": field(value_string="IVA 21%"),
+            "Amount": field(value_currency=total_tax),
+        }))
+    if r.random() < 0.1:
+        items.append(SimpleNamespace(value_object={
+            "Description": field(value_string="Subtotal"),
+            "Amount": field(value_currency=subtotal),
+        }))
+
+    # --- Cabecera ---
+    nombre, cuit, direccion, puntos_venta = _supplier(r.randrange(int(_cfg("DI_SIM_SUPPLIERS", 20))))
+    fecha = datetime.date.today() - datetime.timedelta(days=r.randint(0, 90))
+
+    fields = {
+        "VendorName": field(value_string=nombre),
+        "VendorTaxId": field(value_string=cuit),
+        "VendorAddress": field(value_address=direccion),
+        "InvoiceId": field(value_string=f"{r.randint(1, 99999999):08d}"),
+        "InvoiceDate": field(value_date=fecha),
+        "SubTotal": field(value_currency=subtotal),
+        "TotalTax": field(value_currency=total_tax),
+        "InvoiceTotal": field(value_currency=total),
+        "PaymentTerm": field(value_string=r.choice(_PAGOS)),
+
+        # --- Campos argentinos / fiscales ---
+        "InvoiceType": field(value_string=r.choice(["A", "A", "B"])),
+        "PointOfSale": field(value_string=r.choice(puntos_venta)),
+        "CAE": field(value_string=str(r.randint(10**13, 10**14 - 1))),
+        "CAEDueDate": field(value_date=fecha + datetime.timedelta(days=10)),
+        "Currency": field(value_string="ARS"),
+        "ExchangeRate": field(value_currency=1.0),
+
+        "Items": SimpleNamespace(value_array=items),
+    }
+
+    return SimpleNamespace(documents=[SimpleNamespace(fields=fields)])
+
+
+def _latency_seconds(r: random.Random) -> float:
+    mean = float(_cfg("DI_SIM_LATENCY_MS", 0))
+    jitter = float(_cfg("DI_SIM_LATENCY_JITTER_MS", 0))
+    return max(0.0, r.uniform(mean - jitter, mean + jitter)) / 1000
+
+
+def _maybe_fail(r: random.Random):
+    if r.random() < float(_cfg("DI_SIM_ERROR_RATE", 0.0)):
+        codes = [int(c) for c in str(_cfg("DI_SIM_ERROR_STATUS", "429,503")).split(",") if c.strip()]
+        status = r.choice(codes or [503])
+        raise SimulatedDIError(status, retry_after=1.0 if status == 429 else None)
+
+
+def analyze(data: bytes = b""):
+    """
+    Equivalente simulado de analyze_invoice_auto (bloquea durante la latencia configurada).
+    """
+    seed = _next_seed()
+    r = random.Random(seed ^ 0x5EED)
+    time.sleep(_latency_seconds(r))
+    _maybe_fail(r)
+    return build_invoice(seed)
+
+
+async def analyze_async(data: bytes = b""):
+    """
+    Igual que analyze() pero la latencia no bloquea el event loop.
+    """
+    seed = _next_seed()
+    r = random.Random(seed ^ 0x5EED)
+    await asyncio.sleep(_latency_seconds(r))
+    _maybe_fail(r)
+    return build_invoice(seed)
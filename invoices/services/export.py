@@ -0,0 +1,129 @@
+"""
+export.py
+----------------------------------------
+Exportación de facturas (solo cabecera, o cabecera + ítems) a CSV o XLSX
+sin cargar todo en memoria:
+
+- Las filas se leen con values_list().iterator(chunk_size=EXPORT_CHUNK_SIZE)
+  (en PostgreSQL usa un cursor del lado del servidor).
+- CSV: se genera de a bloques y se envía con StreamingHttpResponse.
+- XLSX: xlsxwriter en modo constant_memory (escribe cada fila al disco y la
+  descarta) sobre un archivo temporal que después se envía con FileResponse.
+  Si se pasa el máximo de filas de Excel, sigue en una hoja nueva.
+"""
+
+import csv
+import io
+import tempfile
+
+from django.conf import settings
+
+from invoices.models import ItemFactura
+
+try:
+    import xlsxwriter
+except ImportError:  # pragma: no cover - dependencia opcional
+    xlsxwriter = None
+
+# (título, campo) — el campo es relativo a Factura
+HEADER_COLUMNS = [
+    ("Id", "id"),
+    ("Proveedor", "proveedor__nombre"),
+    ("CUIT", "proveedor__id_fiscal"),
+    ("Tipo", "tipo_comprobante__codigo"),
+    ("Punto de venta", "punto_venta"),
+    ("Número", "numero"),
+    ("Fecha", "fecha"),
+    ("Moneda", "moneda"),
+    ("Subtotal", "subtotal"),
+    ("Impuestos", "total_impuestos"),
+    ("Total", "total"),
+]
+
+# columnas propias de cada ítem (relativas a ItemFactura)
+ITEM_COLUMNS = [
+    ("Tipo ítem", "tipo_item"),
+    ("Código", "codigo_producto"),
+    ("Descripción", "descripcion"),
+    ("Producto", "producto__nombre"),
+    ("Cantidad", "cantidad"),
+    ("Unidad", "unidad"),
+    ("Precio unitario", "precio_unitario"),
+    ("Importe", "importe"),
+]
+
+XLSX_MAX_ROWS = 1_048_576  # límite de Excel por hoja (incluye el encabezado)
+CSV_BLOCK_ROWS = 500
+
+
+def _chunk_size() -> int:
+    return int(getattr(settings, "EXPORT_CHUNK_SIZE", 2000))
+
+
+def export_rows(facturas, detalle: bool = False):
+    """
+    (títulos, iterador de tuplas) para el queryset de facturas ya filtrado.
+    detalle=True: una fila por ítem, con los datos de su factura repetidos.
+    """
+    if not detalle:
+        qs = facturas.order_by("-fecha", "-id").values_list(*[f for _, f in HEADER_COLUMNS])
+        titles = [t for t, _ in HEADER_COLUMNS]
+    else:
+        qs = (
+            ItemFactura.objects
+            .filter(factura__in=facturas.order_by().values("pk"))
+            .order_by("-factura__fecha", "-factura_id", "id")
+            .values_list(*[f"factura__{f}" for _, f in HEADER_COLUMNS], *[f for _, f in ITEM_COLUMNS])
+        )
+        titles = [t for t, _ in HEADER_COLUMNS] + [t for t, _ in ITEM_COLUMNS]
+    return titles, qs.iterator(chunk_size=_chunk_size())
+
+
+def stream_csv(titles, rows):
+    """
+    Genera el CSV de a bloques (UTF-8 con BOM para que Excel respete los acentos).
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write("\ufeff")
+    writer.writerow(titles)
+    for n, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if n % CSV_BLOCK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def xlsx_available() -> bool:
+    return xlsxwriter is not None
+
+
+def write_xlsx(titles, rows):
+    """
+    Escribe el XLSX en un archivo temporal anónimo (se borra solo al cerrarlo)
+    y lo devuelve posicionado al principio, listo para enviar.
+    """
+    fh = tempfile.TemporaryFile(suffix=".xlsx")
+    workbook = xlsxwriter.Workbook(fh, {
+        "constant_memory": True,
+        "default_date_format": "dd/mm/yyyy",
+    })
+    bold = workbook.add_format({"bold": True})
+
+    def new_sheet():
+        ws = workbook.add_worksheet()
+        ws.write_row(0, 0, titles, bold)
+        ws.freeze_panes(1, 0)
+        return ws
+
+    sheet, r = new_sheet(), 1
+    for row in rows:
+        if r >= XLSX_MAX_ROWS:
+            sheet, r = new_sheet(), 1
+        sheet.write_row(r, 0, row)
+        r += 1
+    workbook.close()
+    fh.seek(0)
+    return fh
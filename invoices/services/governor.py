@@ -0,0 +1,210 @@
+"""
+governor.py
+----------------------------------------
+Regulador compartido para las llamadas a Azure (Document Intelligence y Blob).
+
+Cada regulador combina:
+- token bucket: como máximo N llamadas por segundo (con ráfaga)
+- máximo de llamadas en vuelo por proceso
+- reintentos con backoff exponencial + jitter ante 429/5xx y errores de red,
+  respetando Retry-After cuando Azure lo manda
+- contadores (llamadas, throttling, reintentos, fallos) para monitoreo
+
+Los clientes de Azure se crean con retry_total=0: el reintento lo hace el regulador.
+
+Uso:
+    get_governor("di").call(fn, *args)            # fn se reintenta entera
+    await get_governor("di").acall(coro_fn, *args)
+"""
+
+import asyncio
+import email.utils
+import random
+import threading
+import time
+import weakref
+
+from azure.core.exceptions import HttpResponseError, ServiceRequestError, ServiceResponseError
+from django.conf import settings
+
+RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+THROTTLE_STATUS = {429, 503}
+
+
+def _retry_after_seconds(ex) -> float | None:
+    """
+    Lee Retry-After (segundos o fecha HTTP) / retry-after-ms de la respuesta de Azure.
+    Un valor que no se entiende se ignora (None → backoff normal): esto corre
+    mientras se maneja el error de Azure y no tiene que taparlo.
+    """
+    retry_after = getattr(ex, "retry_after", None)
+    if retry_after is not None:
+        try:
+            return max(0.0, float(retry_after))
+        except (TypeError, ValueError):
+            pass
+    response = getattr(ex, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    for name in ("retry-after-ms", "x-ms-retry-after-ms"):
+        if headers.get(name):
+            try:
+                return max(0.0, float(headers[name]) / 1000)
+            except (TypeError, ValueError):
+                pass
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, parsed.timestamp() - time.time()) if parsed else None
+
+
+def _is_retryable(ex) -> bool:
+    if isinstance(ex, (ServiceRequestError, ServiceResponseError)):
+        return True
+    if isinstance(ex, HttpResponseError):
+        return getattr(ex, "status_code", None) in RETRY_STATUS
+    return False
+
+
+class CallGovernor:
+
+    def __init__(self, name: str, rate_per_sec: float, burst: int, max_in_flight: int,
+                 max_retries: int, base_delay: float, max_delay: float):
+        self.name = name
+        self.rate = float(rate_per_sec)
+        self.burst = max(1, int(burst))
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.max_retries = max(0, int(max_retries))
+        self.base_delay = float(base_delay)
+        self.max_delay = float(max_delay)
+
+        self._lock = threading.Lock()
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._slots = threading.BoundedSemaphore(self.max_in_flight)
+        self._async_slots = weakref.WeakKeyDictionary()  # loop -> asyncio.Semaphore
+        self._counters = {"calls": 0, "throttled": 0, "retries": 0, "failures": 0}
+
+    # --- token bucket ---
+    def _reserve(self) -> float:
+        """
+        Toma un token y devuelve cuánto hay que esperar antes de usarlo.
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    # --- reintentos ---
+    def _backoff(self, attempt: int, ex) -> float:
+        retry_after = _retry_after_seconds(ex)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        # full jitter: uniforme entre 0 y base * 2^intento
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _count(self, key: str):
+        with self._lock:
+            self._counters[key] += 1
+
+    def _on_error(self, attempt: int, ex) -> float | None:
+        """
+        Registra el error y devuelve la espera antes de reintentar (None = no reintentar).
+        """
+        if getattr(ex, "status_code", None) in THROTTLE_STATUS:
+            self._count("throttled")
+        if attempt >= self.max_retries or not _is_retryable(ex):
+            self._count("failures")
+            return None
+        self._count("retries")
+        delay = self._backoff(attempt, ex)
+        print(f"🔁 [{self.name}] {type(ex).__name__} ({getattr(ex, 'status_code', '-')}), "
+              f"reintento {attempt + 1}/{self.max_retries} en {delay:.1f}s")
+        return delay
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Ejecuta fn(*args, **kwargs) respetando el rate limit y el máximo en vuelo,
+        reintentando errores transitorios.
+        """
+        self._count("calls")
+        attempt = 0
+        while True:
+            time.sleep(self._reserve())
+            with self._slots:
+                try:
+                    return fn(*args, **kwargs)
+                except Exception as ex:
+                    delay = self._on_error(attempt, ex)
+                    if delay is None:
+                        raise
+            # se espera fuera del semáforo para no ocupar un lugar en vuelo
+            time.sleep(delay)
+            attempt += 1
+
+    async def acall(self, fn, *args, **kwargs):
+        """
+        Igual que call() para corrutinas: fn(*args, **kwargs) debe devolver un awaitable.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            slots = self._async_slots.get(loop)
+            if slots is None:
+                slots = self._async_slots[loop] = asyncio.Semaphore(self.max_in_flight)
+
+        self._count("calls")
+        attempt = 0
+        while True:
+            await asyncio.sleep(self._reserve())
+            async with slots:
+                try:
+                    return await fn(*args, **kwargs)
+                except Exception as ex:
+                    delay = self._on_error(attempt, ex)
+                    if delay is None:
+                        raise
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counters)
+
+
+_governors = {}
+_governors_lock = threading.Lock()
+
+
+def get_governor(kind: str) -> CallGovernor:
+    """
+    Regulador del proceso para 'di' o 'blob' (configurado desde settings).
+    """
+    if kind not in _governors:
+        with _governors_lock:
+            if kind not in _governors:
+                prefix = kind.upper()
+                _governors[kind] = CallGovernor(
+                    name=kind,
+                    rate_per_sec=getattr(settings, f"{prefix}_RATE_PER_SEC", 10),
+                    burst=getattr(settings, f"{prefix}_RATE_BURST", 10),
+                    max_in_flight=getattr(settings, f"{prefix}_MAX_IN_FLIGHT", 8),
+                    max_retries=getattr(settings, "AZURE_MAX_RETRIES", 5),
+                    base_delay=getattr(settings, "AZURE_RETRY_BASE_SECONDS", 0.5),
+                    max_delay=getattr(settings, "AZURE_RETRY_MAX_SECONDS", 30),
+                )
+    return _governors[kind]
+
+
+def governor_stats() -> dict:
+    return {kind: gov.stats() for kind, gov in _governors.items()}
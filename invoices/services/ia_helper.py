@@ -12,6 +12,7 @@ import numpy as np
 from sentence_transformers import SentenceTransformer
 from productos.models import Producto
 import re
+import threading
 
 def normalize_text(text: str) -> str:
     """
@@ -41,6 +42,7 @@ class IAHelper:
             .select_related("embedding")
         )
 
+        self._lock = threading.Lock()
         self.productos = []
         self.embeddings = []
 
@@ -60,6 +62,42 @@ class IAHelper:
 
         print(f"✅ {len(self.productos)} embeddings cargados en memoria.")
 
+    # -----------------------------------------------------------
+    # ACTUALIZACIÓN INCREMENTAL (sin recargar todo desde la base)
+    # -----------------------------------------------------------
+    def actualizar(self, cambios):
+        """
+        cambios: [(producto, vector | None)]. Los productos activos se agregan o
+        reemplazan (vector None = el que ya tiene guardado); los inactivos se quitan.
+        Arma la matriz una sola vez para todo el lote.
+        """
+        from productos.models import ProductoEmbedding
+
+        sin_vector = [p.id for p, vec in cambios if p.activo and vec is None]
+        guardados = dict(
+            ProductoEmbedding.objects.filter(producto_id__in=sin_vector).values_list("producto_id", "vector")
+        ) if sin_vector else {}
+
+        nuevos = {}
+        for p, vec in cambios:
+            if p.activo:
+                vec = vec if vec is not None else guardados.get(p.id)
+                nuevos[p.id] = (p, None if vec is None else np.asarray(vec, dtype=float))
+            else:
+                nuevos[p.id] = (p, None)
+
+        with self._lock:
+            productos, vectores = [], []
+            for p, vec in zip(self.productos, self.embeddings):
+                if p.id not in nuevos:
+                    productos.append(p)
+                    vectores.append(vec)
+            for p, vec in nuevos.values():
+                if vec is not None:
+                    productos.append(p)
+                    vectores.append(vec)
+            self.productos = productos
+            self.embeddings = np.vstack(vectores) if vectores else np.empty((0, 384))
 
     # -----------------------------------------------------------
     # CÁLCULO DE SIMILITUD SEMÁNTICA
@@ -73,7 +111,11 @@ class IAHelper:
         if not description:
             return None
 
-        if not self.embeddings.size:
+        # lista y matriz del mismo momento (actualizar() puede reemplazarlas)
+        with self._lock:
+            productos, embeddings = self.productos, self.embeddings
+
+        if not embeddings.size:
             print("⚠️ No hay embeddings cargados en memoria para comparar.")
             return None
 
@@ -81,15 +123,15 @@ class IAHelper:
         desc_emb = self.model.encode([desc])[0]
 
         # Calcular similitud por producto (coseno)
-        sims = np.dot(self.embeddings, desc_emb) / (
-            np.linalg.norm(self.embeddings, axis=1) * np.linalg.norm(desc_emb)
+        sims = np.dot(embeddings, desc_emb) / (
+            np.linalg.norm(embeddings, axis=1) * np.linalg.norm(desc_emb)
         )
 
         best_idx = np.argmax(sims)
         best_score = sims[best_idx]
 
         if best_score >= threshold:
-            prod = self.productos[best_idx]
+            prod = productos[best_idx]
             print(f"✅ Coincidencia encontrada: {prod.nombre} (similitud={best_score:.2f})")
             return prod, float(best_score)
 
@@ -121,3 +163,12 @@ def get_ia_helper():
     return _ia_helper_instance
     
     #instancia global (singleton) para que el helper no inicialice en cada llamada a preview_invoice (en la view importo get_ia_helper y result = get_ia_helper.find_best_product(desc))
+
+
+def actualizar_en_buscador(cambios):
+    """
+    Aplica cambios de productos al buscador en memoria, si ya está cargado
+    (si no, se cargará completo desde la base la primera vez que se use).
+    """
+    if _ia_helper_instance is not None and cambios:
+        _ia_helper_instance.actualizar(cambios)
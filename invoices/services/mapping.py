@@ -1,5 +1,110 @@
-from typing import Any, Dict, List
+from dataclasses import dataclass, field, fields as dc_fields
 from datetime import date, datetime
+from decimal import Decimal
+
+from .clasificador import clasificar_items
+
+
+# --- Representación tipada de una factura mapeada ---
+# Se guarda en sesión entre upload → preview → confirm. Con slots ocupa menos
+# memoria que los dicts anidados, y to_session() la serializa como listas
+# posicionales (sin repetir los nombres de campo en cada ítem).
+@dataclass(slots=True)
+class MappedHeader:
+    vendor_name: str | None = None
+    vendor_name_confidence: float | None = None
+    vendor_tax_id: str | None = None
+    vendor_address: str | None = None
+    vendor_address_recipient: str | None = None
+    customer_name: str | None = None
+    customer_tax_id: str | None = None
+    customer_address: str | None = None
+    customer_address_recipient: str | None = None
+    invoice_id: str | None = None
+    invoice_date: str | None = None          # ISO (YYYY-MM-DD)
+    due_date: str | None = None
+    subtotal: float | None = None
+    total_tax: float | None = None
+    invoice_total: float | None = None
+    invoice_total_confidence: float | None = None
+    payment_term: str | None = None
+    service_start_date: str | None = None
+    service_end_date: str | None = None
+    tipo_comprobante: str | None = None
+    punto_venta: str | None = None
+    cae: str | None = None
+    vto_cae: str | None = None
+    moneda: str | None = None
+    tipo_cambio: float | None = None
+
+    @property
+    def punto_venta_normalizado(self) -> str:
+        return (self.punto_venta or "").zfill(4)
+
+    @property
+    def cuit_normalizado(self) -> str:
+        return (self.vendor_tax_id or "").replace("-", "").strip()
+
+
+@dataclass(slots=True)
+class MappedItem:
+    description: str | None = None
+    quantity: float | None = None
+    unit: str | None = None
+    unit_price: float | None = None
+    amount: float | None = None
+    product_code: str | None = None
+    date: str | None = None
+    tax: str | None = None
+    tipo_item: str = "producto"
+    confidence: float | None = None
+
+
+@dataclass(slots=True)
+class MappedInvoice:
+    header: MappedHeader = field(default_factory=MappedHeader)
+    items: list = field(default_factory=list)  # list[MappedItem]
+    source: str = "di"                         # 'di' | 'pdf_text'
+    confidence: float | None = None
+
+    def to_session(self) -> dict:
+        """
+        Forma compacta y JSON-safe para request.session.
+        """
+        return {
+            "v": _SESSION_VERSION,
+            "h": [_json_value(getattr(self.header, n)) for n in _HEADER_FIELDS],
+            "i": [[_json_value(getattr(it, n)) for n in _ITEM_FIELDS] for it in self.items],
+            "s": self.source,
+            "c": self.confidence,
+        }
+
+    @classmethod
+    def from_session(cls, data):
+        """
+        Inversa de to_session(). Devuelve None si no hay datos (o son de otra versión).
+        """
+        if not data or data.get("v") != _SESSION_VERSION:
+            return None
+        return cls(
+            header=MappedHeader(*data["h"]),
+            items=[MappedItem(*row) for row in data["i"]],
+            source=data.get("s", "di"),
+            confidence=data.get("c"),
+        )
+
+
+_SESSION_VERSION = 1
+_HEADER_FIELDS = tuple(f.name for f in dc_fields(MappedHeader))
+_ITEM_FIELDS = tuple(f.name for f in dc_fields(MappedItem))
+
+
+def _json_value(v):
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, (date, datetime)):
+        return v.isoformat()
+    return v
 
 
 # --- Funciones auxiliares ---
@@ -41,59 +146,57 @@ def _field_value(fields: dict, name: str, kind: str):
 
 
 # --- Calificador de tipo de ítem ---
-def calificar_item(descripcion: str) -> str:
+def calificar_item(descripcion: str, proveedor_id=None) -> str:
     """
     Detecta si el ítem es un producto, impuesto o subtotal/total
+    (reglas de ReglaClasificacion; para una factura entera usar clasificar_items).
     """
-    if not descripcion:
-        return "producto"
-    desc = descripcion.lower()
-    if any(p in desc for p in ["iva", "impuesto", "retención", "retencion", "percepción", "percepcion"]):
-        return "impuesto"
-    if any(p in desc for p in ["subtotal", "total", "saldo"]):
-        return "resumen"
-    return "producto"
+    return clasificar_items([descripcion], proveedor_id=proveedor_id)[0]
 
 
 # --- Mapeo general ---
-def map_invoice_result(di_result) -> Dict[str, Any]:
+def map_invoice_result(di_result) -> MappedInvoice:
     if not di_result or not di_result.documents:
-        return {"header": {}, "items": []}
+        return MappedInvoice()
 
     inv = di_result.documents[0]
     fields = inv.fields or {}
 
     # --- CABECERA ---
     vendor_name, vendor_name_c = _field_value(fields, "VendorName", "value_string")
-    vendor_tax_id, _ = _field_value(fields, "VendorTaxId", "value_string")
-    vendor_address, _ = _field_value(fields, "VendorAddress", "value_address")
-    vendor_address_recipient, _ = _field_value(fields, "VendorAddressRecipient", "value_string")
-
-    customer_name, _ = _field_value(fields, "CustomerName", "value_string")
-    customer_tax_id, _ = _field_value(fields, "CustomerTaxId", "value_string")
-    customer_address, _ = _field_value(fields, "CustomerAddress", "value_address")
-    customer_address_recipient, _ = _field_value(fields, "CustomerAddressRecipient", "value_string")
-
-    invoice_id, _ = _field_value(fields, "InvoiceId", "value_string")
-    invoice_date, _ = _field_value(fields, "InvoiceDate", "value_date")
-    due_date, _ = _field_value(fields, "DueDate", "value_date")
-    subtotal, _ = _field_value(fields, "SubTotal", "value_currency")
-    total_tax, _ = _field_value(fields, "TotalTax", "value_currency")
     invoice_total, invoice_total_c = _field_value(fields, "InvoiceTotal", "value_currency")
-    payment_term, _ = _field_value(fields, "PaymentTerm", "value_string")
-    service_start_date, _ = _field_value(fields, "ServiceStartDate", "value_date")
-    service_end_date, _ = _field_value(fields, "ServiceEndDate", "value_date")
-
-    # --- CAMPOS ESPECÍFICOS (si los encuentra) ---
-    tipo_comprobante, _ = _field_value(fields, "InvoiceType", "value_string")
-    punto_venta, _ = _field_value(fields, "PointOfSale", "value_string")
-    cae, _ = _field_value(fields, "CAE", "value_string")
-    vto_cae, _ = _field_value(fields, "CAEDueDate", "value_date")
-    moneda, _ = _field_value(fields, "Currency", "value_string")
-    tipo_cambio, _ = _field_value(fields, "ExchangeRate", "value_currency")
+
+    header = MappedHeader(
+        vendor_name=vendor_name,
+        vendor_name_confidence=vendor_name_c,
+        vendor_tax_id=_field_value(fields, "VendorTaxId", "value_string")[0],
+        vendor_address=_field_value(fields, "VendorAddress", "value_address")[0],
+        vendor_address_recipient=_field_value(fields, "VendorAddressRecipient", "value_string")[0],
+        customer_name=_field_value(fields, "CustomerName", "value_string")[0],
+        customer_tax_id=_field_value(fields, "CustomerTaxId", "value_string")[0],
+        customer_address=_field_value(fields, "CustomerAddress", "value_address")[0],
+        customer_address_recipient=_field_value(fields, "CustomerAddressRecipient", "value_string")[0],
+        invoice_id=_field_value(fields, "InvoiceId", "value_string")[0],
+        invoice_date=_field_value(fields, "InvoiceDate", "value_date")[0],
+        due_date=_field_value(fields, "DueDate", "value_date")[0],
+        subtotal=_field_value(fields, "SubTotal", "value_currency")[0],
+        total_tax=_field_value(fields, "TotalTax", "value_currency")[0],
+        invoice_total=invoice_total,
+        invoice_total_confidence=invoice_total_c,
+        payment_term=_field_value(fields, "PaymentTerm", "value_string")[0],
+        service_start_date=_field_value(fields, "ServiceStartDate", "value_date")[0],
+        service_end_date=_field_value(fields, "ServiceEndDate", "value_date")[0],
+        # --- CAMPOS ESPECÍFICOS (si los encuentra) ---
+        tipo_comprobante=_field_value(fields, "InvoiceType", "value_string")[0],
+        punto_venta=_field_value(fields, "PointOfSale", "value_string")[0],
+        cae=_field_value(fields, "CAE", "value_string")[0],
+        vto_cae=_field_value(fields, "CAEDueDate", "value_date")[0],
+        moneda=_field_value(fields, "Currency", "value_string")[0],
+        tipo_cambio=_field_value(fields, "ExchangeRate", "value_currency")[0],
+    )
 
     # --- ITEMS ---
-    items_list: List[Dict[str, Any]] = []
+    items_list: list[MappedItem] = []
     items_field = fields.get("Items")
     if items_field and getattr(items_field, "value_array", None):
         for it in items_field.value_array:
@@ -113,50 +216,22 @@ def map_invoice_result(di_result) -> Dict[str, Any]:
                 except Exception:
                     return None
 
-            desc = gv("Description", "value_string")
-            tipo_item = calificar_item(desc)
-
-            items_list.append({
-                "description": desc,
-                "quantity": gv("Quantity", "value_number"),
-                "unit": gv("Unit", "value_string") or gv("Unit", "value_number"),
-                "unit_price": gv("UnitPrice", "value_currency"),
-                "amount": gv("Amount", "value_currency"),
-                "product_code": gv("ProductCode", "value_string"),
-                "date": gv("Date", "value_date"),
-                "tax": gv("Tax", "value_string"),
-                "tipo_item": tipo_item,
-            })
-
-    # --- RETORNO FINAL ---
-    return {
-        "header": {
-            "vendor_name": vendor_name,
-            "vendor_name_confidence": vendor_name_c,
-            "vendor_tax_id": vendor_tax_id,
-            "vendor_address": vendor_address,
-            "vendor_address_recipient": vendor_address_recipient,
-            "customer_name": customer_name,
-            "customer_tax_id": customer_tax_id,
-            "customer_address": customer_address,
-            "customer_address_recipient": customer_address_recipient,
-            "invoice_id": invoice_id,
-            "invoice_date": invoice_date,
-            "due_date": due_date,
-            "subtotal": subtotal,
-            "total_tax": total_tax,
-            "invoice_total": invoice_total,
-            "invoice_total_confidence": invoice_total_c,
-            "payment_term": payment_term,
-            "service_start_date": service_start_date,
-            "service_end_date": service_end_date,
-            # Nuevos campos
-            "tipo_comprobante": tipo_comprobante,
-            "punto_venta": punto_venta,
-            "cae": cae,
-            "vto_cae": vto_cae,
-            "moneda": moneda,
-            "tipo_cambio": tipo_cambio,
-        },
-        "items": items_list,
-    }
+            desc_field = obj.get("Description")
+            items_list.append(MappedItem(
+                description=gv("Description", "value_string"),
+                quantity=gv("Quantity", "value_number"),
+                unit=gv("Unit", "value_string") or gv("Unit", "value_number"),
+                unit_price=gv("UnitPrice", "value_currency"),
+                amount=gv("Amount", "value_currency"),
+                product_code=gv("ProductCode", "value_string"),
+                date=gv("Date", "value_date"),
+                tax=gv("Tax", "value_string"),
+                confidence=getattr(desc_field, "confidence", None),
+            ))
+
+    # clasificación de todas las líneas de una vez (con las excepciones del proveedor)
+    tipos = clasificar_items([it.description for it in items_list], cuit=header.vendor_tax_id)
+    for it, tipo in zip(items_list, tipos):
+        it.tipo_item = tipo
+
+    return MappedInvoice(header=header, items=items_list, source="di")
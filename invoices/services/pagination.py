@@ -0,0 +1,218 @@
+"""
+pagination.py
+----------------------------------------
+Paginación por cursor (keyset) para listados grandes.
+
+En vez de OFFSET (que recorre y descarta todas las filas anteriores) cada
+página pide "las N filas que siguen a la última que se mostró", comparando
+por las columnas del orden. El costo de una página no depende de qué tan
+lejos esté, y no hace falta un COUNT(*) completo: el total se cuenta solo
+hasta un tope (ej. "más de 1000").
+
+Los cursores son opacos (base64 de los valores de la última/primera fila),
+así que un link a una página sigue funcionando aunque entren facturas nuevas.
+
+    keys = [OrderKey("fecha", descending=True, nullable=True), OrderKey("id", descending=True)]
+    page = paginate_keyset(qs, keys, cursor=request.GET.get("cursor"), per_page=15)
+
+Los NULL van siempre al final (en cualquier motor).
+Para vistas genéricas (ListView con paginate_by) está KeysetListMixin.
+"""
+
+import base64
+import json
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import F, Q
+from django.utils.http import urlencode
+
+
+@dataclass(frozen=True)
+class OrderKey:
+    name: str
+    descending: bool = False
+    nullable: bool = False
+
+
+@dataclass
+class KeysetPage:
+    object_list: list
+    has_next: bool
+    has_previous: bool
+    next_cursor: str | None
+    previous_cursor: str | None
+    count: int | None = None       # cantidad total (hasta count_cap)
+    count_capped: bool = False     # True = hay más de count_cap
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+# -----------------------------------------------------------
+# CURSORES
+# -----------------------------------------------------------
+def _json_value(v):
+    if isinstance(v, (date, datetime)):
+        return v.isoformat()
+    if isinstance(v, Decimal):
+        return str(v)
+    return v
+
+
+def encode_cursor(values: list, backwards: bool = False) -> str:
+    payload = {"v": [_json_value(v) for v in values], "b": int(backwards)}
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, qs, keys) -> tuple[list, bool] | None:
+    """
+    (valores, hacia_atrás) o None si el cursor no es válido (→ primera página).
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        values = payload["v"]
+        if len(values) != len(keys):
+            return None
+        return [_to_python(qs, key, v) for key, v in zip(keys, values)], bool(payload.get("b"))
+    except (ValueError, KeyError, TypeError, ValidationError):
+        return None
+
+
+def _to_python(qs, key: OrderKey, value):
+    if value is None:
+        return None
+    try:
+        return qs.model._meta.get_field(key.name).to_python(value)
+    except FieldDoesNotExist:
+        return value  # anotación (ej. ranking numérico)
+
+
+# -----------------------------------------------------------
+# CONDICIONES
+# -----------------------------------------------------------
+def _after(key: OrderKey, value, backwards: bool) -> Q:
+    """
+    Filas estrictamente posteriores a value en esta columna (anteriores si backwards).
+    """
+    nothing = Q(pk__in=[])
+    if value is None:
+        # NULL es lo último: nada viene después; antes vienen todos los no nulos
+        return Q(**{f"{key.name}__isnull": False}) if backwards else nothing
+    lookup = "lt" if key.descending != backwards else "gt"
+    cond = Q(**{f"{key.name}__{lookup}": value})
+    if key.nullable and not backwards:
+        cond |= Q(**{f"{key.name}__isnull": True})
+    return cond
+
+
+def _equal(key: OrderKey, value) -> Q:
+    if value is None:
+        return Q(**{f"{key.name}__isnull": True})
+    return Q(**{key.name: value})
+
+
+def _seek(keys, values, backwards: bool) -> Q:
+    """
+    Comparación lexicográfica: k0 > v0 OR (k0 = v0 AND (k1 > v1 OR (...))).
+    """
+    cond = None
+    for key, value in reversed(list(zip(keys, values))):
+        after = _after(key, value, backwards)
+        cond = after if cond is None else after | (_equal(key, value) & cond)
+    return cond
+
+
+def _ordering(keys, backwards: bool):
+    order = []
+    for key in keys:
+        descending = key.descending != backwards
+        # NULL al final en el sentido normal (al principio cuando se recorre al revés)
+        nulls = ({"nulls_first": True} if backwards else {"nulls_last": True}) if key.nullable else {}
+        expr = F(key.name)
+        order.append(expr.desc(**nulls) if descending else expr.asc(**nulls))
+    return order
+
+
+# -----------------------------------------------------------
+# PAGINADO
+# -----------------------------------------------------------
+def paginate_keyset(qs, keys, cursor: str | None = None, per_page: int = 15,
+                    count_cap: int | None = 1000) -> KeysetPage:
+    """
+    Devuelve la página que corresponde al cursor (o la primera).
+    keys debe terminar en una columna única (ej. id) para que el orden sea total.
+    count_cap: hasta cuántas filas contar (None = no contar).
+    """
+    decoded = decode_cursor(cursor, qs, keys) if cursor else None
+    values, backwards = decoded if decoded else (None, False)
+
+    page_qs = qs.order_by(*_ordering(keys, backwards))
+    if values is not None:
+        page_qs = page_qs.filter(_seek(keys, values, backwards))
+    rows = list(page_qs[:per_page + 1])
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    def cursor_for(obj, back):
+        return encode_cursor([getattr(obj, k.name) for k in keys], backwards=back)
+
+    if backwards:
+        has_next, has_previous = True, has_more
+    else:
+        has_next, has_previous = has_more, values is not None
+
+    count, capped = None, False
+    if count_cap:
+        # COUNT sobre un subquery con LIMIT: nunca recorre más de count_cap + 1 filas
+        # (solo pk: las anotaciones del listado no se calculan para contar)
+        count = qs.order_by().values("pk")[:count_cap + 1].count()
+        capped = count > count_cap
+        count = min(count, count_cap)
+
+    return KeysetPage(
+        object_list=rows,
+        has_next=has_next and bool(rows),
+        has_previous=has_previous and bool(rows),
+        next_cursor=cursor_for(rows[-1], False) if rows else None,
+        previous_cursor=cursor_for(rows[0], True) if rows else None,
+        count=count,
+        count_capped=capped,
+    )
+
+
+class KeysetListMixin:
+    """
+    Para ListView: reemplaza Paginator (OFFSET + COUNT) por paginate_keyset.
+    paginate_by = filas por página; keyset_keys = orden (terminando en una columna única).
+    En el contexto quedan page_obj (KeysetPage) y base_qs (parámetros sin el cursor).
+    """
+    keyset_keys = [OrderKey("id")]
+    count_cap = 1000
+
+    def paginate_queryset(self, queryset, page_size):
+        page = paginate_keyset(
+            queryset, self.keyset_keys,
+            cursor=self.request.GET.get("cursor"),
+            per_page=page_size,
+            count_cap=self.count_cap,
+        )
+        return None, page, page.object_list, page.has_next or page.has_previous
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        params = self.request.GET.dict()
+        params.pop("cursor", None)
+        base_qs = urlencode(params)
+        context["base_qs"] = f"&{base_qs}" if base_qs else ""
+        context["q"] = (self.request.GET.get("q") or "").strip()
+        return context
@@ -0,0 +1,395 @@
+"""
+pdf_text.py
+----------------------------------------
+Lectura local de facturas PDF que ya traen capa de texto (comprobantes
+electrónicos de ARCA generados por sistema, con CAE), sin pasar por
+Document Intelligence.
+
+- La cabecera (CUIT, tipo, punto de venta, número, CAE, fechas, totales) se
+  lee con expresiones regulares sobre el formato estándar de ARCA.
+- Los ítems se leen con la plantilla del proveedor (PlantillaFactura, por CUIT
+  del emisor); si no tiene, con una plantilla genérica del formato de ARCA.
+- Devuelve lo mismo que map_invoice_result (MappedInvoice) más una confianza.
+  Si la confianza es menor a PDF_TEXT_MIN_CONFIDENCE se usa DI como siempre.
+
+Fotos y PDFs escaneados (sin texto) no pasan por acá: analyze_local devuelve None.
+"""
+
+import io
+import re
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from django.conf import settings
+
+from .clasificador import clasificar_items
+from .mapping import MappedHeader, MappedInvoice, MappedItem
+
+try:
+    import pypdf
+except ImportError:  # pragma: no cover - dependencia opcional
+    pypdf = None
+
+
+# Números en formato argentino (1.234,56 / 1234,56) o inglés (1,234.56)
+_NUM = {
+    "ar": r"-?(?:\d{1,3}(?:\.\d{3})+|\d+)(?:,\d+)?",
+    "en": r"-?(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d+)?",
+}
+_DATE = r"\d{2}/\d{2}/\d{4}"
+_END = r"(?:\s{2,}|$)"  # fin de valor: dos o más espacios (otra columna) o fin de línea
+
+# Cabecera del formato de ARCA. {num} se reemplaza por el patrón de números.
+_HEADER_PATTERNS = {
+    "vendor_name": rf"(?<!/)(?<!/ )Raz[oó]n Social:?\s*(.+?){_END}",
+    "vendor_address": rf"Domicilio Comercial:?\s*(.+?){_END}",
+    "customer_name": rf"Apellido y Nombre\s*/\s*Raz[oó]n Social:?\s*(.+?){_END}",
+    "customer_address": rf"\bDomicilio:\s*(.+?){_END}",
+    "punto_venta": r"Punto de Venta:?\s*(\d{1,5})",
+    "invoice_id": r"Comp\.?\s*Nro:?\s*(\d{1,8})",
+    "invoice_date": rf"Fecha de Emisi[oó]n:?\s*({_DATE})",
+    "cae": r"CAE\s*N?[°ºo]?\.?:?\s*(\d{14})",
+    "vto_cae": rf"Vto\.?\s*de\s*CAE:?\s*({_DATE})",
+    "service_start_date": rf"Desde:?\s*({_DATE})",
+    "service_end_date": rf"Hasta:?\s*({_DATE})",
+    "due_date": rf"Vto\.?\s*para el pago:?\s*({_DATE})",
+    "subtotal": r"(?:Importe Neto Gravado|Subtotal):?\s*\$?\s*({num})",
+    "invoice_total": r"Importe Total:?\s*\$?\s*({num})",
+    "payment_term": rf"Condici[oó]n de venta:?\s*(.+?){_END}",
+}
+_DATE_FIELDS = {"invoice_date", "vto_cae", "service_start_date", "service_end_date", "due_date"}
+_NUMBER_FIELDS = {"subtotal", "total_tax", "invoice_total"}
+
+_CUIT_RE = re.compile(r"CUIT:?\s*(\d{2}-?\d{8}-?\d)", re.I)
+_IVA_RE = r"IVA\s*\d+(?:[.,]\d+)?\s*%:?\s*\$?\s*({num})"
+_TIPO_COD_RE = re.compile(r"C[oó]d(?:igo)?\.?\s*N?[°º]?\s*0*(\d{1,3})\b", re.I)
+_TIPO_LETRA_RE = re.compile(r"^\s*([ABCM])\s*$", re.M)
+_COPIA_RE = re.compile(r"^\s*(DUPLICADO|TRIPLICADO)\s*$", re.M)
+
+# Códigos de comprobante de ARCA → TipoComprobante.codigo
+_TIPOS_ARCA = {
+    1: "A", 6: "B", 11: "C", 51: "M",
+    2: "ND", 7: "ND", 12: "ND", 52: "ND",
+    3: "NC", 8: "NC", 13: "NC", 53: "NC",
+}
+
+# Tabla de ítems del comprobante en línea de ARCA:
+# Código | Producto/Servicio | Cantidad | U. medida | Precio unit. | % Bonif | Subtotal | Alícuota IVA | Subtotal c/IVA
+_GENERIC_ITEM = (
+    r"^\s*(?P<description>\S.*?)\s+(?P<quantity>{num})\s+(?P<unit>[A-Za-zñÑ.]+(?: [a-zñ]+)?)\s+"
+    r"(?P<unit_price>{num})\s+(?:{num}\s+)?(?P<amount>{num})"
+    r"(?:\s+(?P<tax>\d+(?:,\d+)?\s?%)\s+{num})?\s*$"
+)
+_GENERIC_INICIO = r"Producto\s*/\s*Servicio"
+_GENERIC_FIN = r"Importe Neto|Subtotal:|Importe Otros Tributos|Importe Total"
+
+# Peso de cada campo de cabecera en la confianza
+_HEADER_WEIGHTS = {
+    "vendor_tax_id": 0.2,
+    "invoice_total": 0.2,
+    "invoice_id": 0.15,
+    "cae": 0.15,
+    "punto_venta": 0.1,
+    "tipo_comprobante": 0.1,
+    "invoice_date": 0.1,
+}
+
+
+@dataclass
+class LocalResult:
+    mapped: MappedInvoice
+    confidence: float
+    plantilla: str
+    motivos: list = field(default_factory=list)
+
+
+@dataclass
+class _Layout:
+    nombre: str
+    regex_item: str
+    inicio_items: str = ""
+    fin_items: str = ""
+    campos: dict = field(default_factory=dict)
+    formato_numeros: str = "ar"
+
+
+_GENERIC_LAYOUT = _Layout("ARCA genérica", _GENERIC_ITEM, _GENERIC_INICIO, _GENERIC_FIN)
+
+# grupos que parse_items necesita en la regex de ítem de una plantilla
+_GRUPOS_ITEM = ("description", "quantity", "unit_price", "amount")
+
+
+def _cfg(name: str, default):
+    return getattr(settings, name, default)
+
+
+def _compile(pattern: str, layout: _Layout, flags=re.I | re.M):
+    return re.compile(pattern.replace("{num}", _NUM[layout.formato_numeros]), flags)
+
+
+def _to_number(s, fmt: str):
+    if s is None:
+        return None
+    s = s.replace(" ", "")
+    s = s.replace(".", "").replace(",", ".") if fmt == "ar" else s.replace(",", "")
+    try:
+        return float(s)
+    except ValueError:
+        return None
+
+
+def _to_iso_date(s):
+    try:
+        return datetime.strptime(s, "%d/%m/%Y").date().isoformat()
+    except (TypeError, ValueError):
+        return None
+
+
+# -----------------------------------------------------------
+# TEXTO
+# -----------------------------------------------------------
+def extract_text(data: bytes) -> str | None:
+    """
+    Texto de las páginas originales del PDF (se descartan las copias
+    DUPLICADO/TRIPLICADO). None si no es PDF o no tiene capa de texto.
+    """
+    if pypdf is None or data[:5] != b"%PDF-":
+        return None
+    try:
+        reader = pypdf.PdfReader(io.BytesIO(data))
+        pages = [p.extract_text(extraction_mode="layout") or "" for p in reader.pages]
+    except Exception as ex:
+        print(f"⚠️ No se pudo leer el texto del PDF: {ex}")
+        return None
+
+    originales = [t for t in pages if not _COPIA_RE.search(t)]
+    text = "\n".join(originales or pages)
+    if len(text.strip()) < int(_cfg("PDF_TEXT_MIN_CHARS", 200)):
+        return None
+    return text
+
+
+def _layout_for(cuit: str | None) -> _Layout:
+    from invoices.models import PlantillaFactura
+
+    if cuit:
+        plantilla = PlantillaFactura.objects.filter(cuit=cuit, activo=True).order_by("-updated_at").first()
+        if plantilla:
+            return _Layout(
+                nombre=plantilla.nombre,
+                regex_item=plantilla.regex_item,
+                inicio_items=plantilla.inicio_items,
+                fin_items=plantilla.fin_items,
+                campos=plantilla.campos or {},
+                formato_numeros=plantilla.formato_numeros,
+            )
+    return _GENERIC_LAYOUT
+
+
+def validar_plantilla(regex_item: str, inicio_items: str = "", fin_items: str = "",
+                      campos: dict | None = None, formato_numeros: str = "ar") -> dict:
+    """
+    Errores de una plantilla por campo ({campo: mensaje}); vacío si todas las
+    regex compilan (con {num} ya reemplazado) y tienen los grupos que se leen.
+    """
+    layout = _Layout("", regex_item, formato_numeros=formato_numeros if formato_numeros in _NUM else "ar")
+    errores = {}
+
+    def compilar(campo, pattern):
+        try:
+            return _compile(pattern, layout)
+        except (re.error, TypeError, AttributeError) as ex:
+            errores[campo] = f"Regex inválida: {ex}"
+            return None
+
+    item_re = compilar("regex_item", regex_item or "")
+    if item_re is not None:
+        faltan = [g for g in _GRUPOS_ITEM if g not in item_re.groupindex]
+        if faltan:
+            errores["regex_item"] = f"Faltan los grupos: {', '.join(f'(?P<{g}>...)' for g in faltan)}"
+    for campo, pattern in (("inicio_items", inicio_items), ("fin_items", fin_items)):
+        if pattern:
+            compilar(campo, pattern)
+
+    if campos is not None and not isinstance(campos, dict):
+        errores["campos"] = "Debe ser un objeto {campo: regex}"
+    elif campos:
+        malos = []
+        for name, pattern in campos.items():
+            if str(name).endswith("_confidence"):
+                malos.append(f"{name}: la confianza la calcula el sistema, no se lee del PDF")
+                continue
+            try:
+                if _compile(pattern, layout).groups < 1:
+                    malos.append(f"{name}: sin grupo")
+            except (re.error, TypeError, AttributeError) as ex:
+                malos.append(f"{name}: {ex}")
+        if malos:
+            errores["campos"] = "Regex inválidas: " + "; ".join(malos)
+    return errores
+
+
+# -----------------------------------------------------------
+# CABECERA
+# -----------------------------------------------------------
+def parse_header(text: str, layout: _Layout = _GENERIC_LAYOUT) -> dict:
+    fmt = layout.formato_numeros
+    header = {}
+
+    cuits = [re.sub(r"\D", "", c) for c in _CUIT_RE.findall(text)]
+    header["vendor_tax_id"] = cuits[0] if cuits else None
+    header["customer_tax_id"] = cuits[1] if len(cuits) > 1 else None
+
+    for name, pattern in {**_HEADER_PATTERNS, **layout.campos}.items():
+        m = _compile(pattern, layout).search(text)
+        value = m.group(1).strip() if m else None
+        if name in _DATE_FIELDS:
+            value = _to_iso_date(value)
+        elif name in _NUMBER_FIELDS:
+            value = _to_number(value, fmt)
+        header[name] = value
+
+    if header.get("total_tax") is None:
+        ivas = [_to_number(v, fmt) for v in _compile(_IVA_RE, layout).findall(text)]
+        ivas = [v for v in ivas if v]
+        header["total_tax"] = round(sum(ivas), 2) if ivas else None
+
+    tipo = header.get("tipo_comprobante")
+    if not tipo:
+        m = _TIPO_COD_RE.search(text)
+        if m:
+            tipo = _TIPOS_ARCA.get(int(m.group(1)))
+        if not tipo:
+            m = _TIPO_LETRA_RE.search(text)
+            tipo = m.group(1) if m else None
+    header["tipo_comprobante"] = tipo
+
+    if header.get("punto_venta"):
+        header["punto_venta"] = str(int(header["punto_venta"])).zfill(4)  # ARCA imprime 5 dígitos
+    if header.get("invoice_id"):
+        header["invoice_id"] = str(int(header["invoice_id"])).zfill(8)
+    return header
+
+
+# -----------------------------------------------------------
+# ÍTEMS
+# -----------------------------------------------------------
+def parse_items(text: str, layout: _Layout = _GENERIC_LAYOUT, cuit: str | None = None) -> list[MappedItem]:
+    """
+    Lee las líneas de ítems. Con inicio/fin solo se miran las líneas dentro
+    de la tabla (puede repetirse en cada página). cuit: emisor, para sus reglas de clasificación.
+    """
+    fmt = layout.formato_numeros
+    item_re = _compile(layout.regex_item, layout)
+    inicio = _compile(layout.inicio_items, layout) if layout.inicio_items else None
+    fin = _compile(layout.fin_items, layout) if layout.fin_items else None
+
+    items = []
+    in_table = inicio is None
+    for line in text.splitlines():
+        if inicio and inicio.search(line):
+            in_table = True
+            continue
+        if fin and fin.search(line):
+            in_table = inicio is None
+            continue
+        if not in_table:
+            continue
+        m = item_re.search(line)
+        if not m:
+            continue
+        g = m.groupdict()
+        desc = (g.get("description") or "").strip() or None
+        items.append(MappedItem(
+            description=desc,
+            quantity=_to_number(g.get("quantity"), fmt),
+            unit=(g.get("unit") or "").strip() or None,
+            unit_price=_to_number(g.get("unit_price"), fmt),
+            amount=_to_number(g.get("amount"), fmt),
+            product_code=(g.get("product_code") or "").strip() or None,
+            tax=(g.get("tax") or "").strip() or None,
+        ))
+
+    tipos = clasificar_items([it.description for it in items], cuit=cuit)
+    for it, tipo in zip(items, tipos):
+        it.tipo_item = tipo
+    return items
+
+
+# -----------------------------------------------------------
+# CONFIANZA
+# -----------------------------------------------------------
+def _close(a, b, tolerance=0.01) -> bool:
+    return a is not None and b is not None and abs(a - b) <= max(0.02, abs(b) * tolerance)
+
+
+def score(header: dict, items: list) -> tuple[float, list]:
+    """
+    Confianza 0..1: mitad por campos de cabecera encontrados, mitad por ítems
+    que cierran (cantidad × precio = importe y suma de importes = neto o total).
+    """
+    motivos = []
+    header_score = sum(w for name, w in _HEADER_WEIGHTS.items() if header.get(name))
+    faltan = [name for name in _HEADER_WEIGHTS if not header.get(name)]
+    if faltan:
+        motivos.append(f"faltan {', '.join(faltan)}")
+
+    productos = [it for it in items if it.tipo_item == "producto"]
+    if not productos:
+        motivos.append("sin ítems")
+        return round(0.5 * header_score, 3), motivos
+
+    consistentes = sum(
+        1 for it in productos
+        if it.quantity is not None and it.unit_price is not None
+        and _close(it.quantity * it.unit_price, it.amount, tolerance=0.02)
+    )
+    lines_score = consistentes / len(productos)
+    if lines_score < 1:
+        motivos.append(f"{len(productos) - consistentes} ítem(s) no cierran cantidad × precio")
+
+    suma = sum(it.amount or 0 for it in productos)
+    if _close(suma, header.get("subtotal")) or _close(suma, header.get("invoice_total")):
+        total_score = 1.0
+    else:
+        total_score = 0.0
+        motivos.append(f"la suma de ítems ({suma:.2f}) no coincide con subtotal/total")
+
+    items_score = 0.5 * lines_score + 0.5 * total_score
+    return round(0.5 * header_score + 0.5 * items_score, 3), motivos
+
+
+# -----------------------------------------------------------
+# ENTRADA PRINCIPAL
+# -----------------------------------------------------------
+def analyze_local(data: bytes) -> LocalResult | None:
+    """
+    Intenta leer la factura desde la capa de texto del PDF.
+    Devuelve None si no hay texto; si lo hay, el resultado con su confianza
+    (quien llama decide si alcanza o hay que ir a DI).
+    """
+    text = extract_text(data)
+    if text is None:
+        return None
+
+    cuits = _CUIT_RE.findall(text)
+    cuit = re.sub(r"\D", "", cuits[0]) if cuits else None
+    layout = _layout_for(cuit)
+    header = parse_header(text, layout)
+    items = parse_items(text, layout, cuit=cuit)
+    confidence, motivos = score(header, items)
+
+    for it in items:
+        it.confidence = confidence
+    # la confianza es la calculada (plantillas guardadas antes de validar "*_confidence" pueden traerla)
+    known = {
+        k: v for k, v in header.items()
+        if k in MappedHeader.__dataclass_fields__ and not k.endswith("_confidence")
+    }
+    mapped = MappedInvoice(
+        header=MappedHeader(**known, vendor_name_confidence=confidence, invoice_total_confidence=confidence),
+        items=items,
+        source="pdf_text",
+        confidence=confidence,
+    )
+    return LocalResult(mapped=mapped, confidence=confidence, plantilla=layout.nombre, motivos=motivos)
@@ -0,0 +1,195 @@
+"""
+precios.py
+----------------------------------------
+Historial de precios de compra por producto (tabla EstadisticaPrecio):
+último precio / fecha / proveedor y mediana + MAD de los últimos
+PRECIO_VENTANA precios unitarios.
+
+- registrar_factura(): al confirmar una factura actualiza las filas de sus
+  productos (una lectura con bloqueo, un bulk_update y un bulk_create).
+- evaluar(): en la vista previa marca los ítems cuyo precio se aleja de lo
+  habitual, con UNA consulta por factura.
+- rebuild(): recalcula todo (o algunos productos) desde ItemFactura.
+
+Un precio se marca cuando hay suficientes muestras, se aparta de la mediana al
+menos PRECIO_ALERTA_MIN_DESVIO (relativo) y además el desvío robusto
+0.6745·|precio − mediana| / MAD supera PRECIO_ALERTA_Z (si MAD = 0, alcanza
+con el desvío relativo).
+"""
+
+from collections import defaultdict, deque
+from decimal import Decimal, InvalidOperation
+from statistics import median
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from invoices.models import EstadisticaPrecio, ItemFactura
+
+CUATRO = Decimal("0.0001")
+
+
+def _ventana() -> int:
+    return int(getattr(settings, "PRECIO_VENTANA", 20))
+
+
+def _dec(v) -> Decimal | None:
+    try:
+        d = Decimal(str(v))
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+    return d if d > 0 else None
+
+
+def _mediana_mad(precios: list[Decimal]) -> tuple[Decimal, Decimal]:
+    med = median(precios)
+    mad = median(abs(p - med) for p in precios)
+    return Decimal(med).quantize(CUATRO), Decimal(mad).quantize(CUATRO)
+
+
+def _aplicar(stat: EstadisticaPrecio, observaciones, n_max: int):
+    """
+    Agrega (fecha, precio, proveedor_id) a la ventana y recalcula la fila.
+    """
+    ventana = [Decimal(p) for p in stat.ventana]
+    for fecha, precio, proveedor_id in observaciones:
+        ventana.append(precio)
+        stat.muestras += 1
+        if stat.ultima_fecha is None or fecha is None or fecha >= stat.ultima_fecha:
+            stat.ultimo_precio = precio
+            stat.ultima_fecha = fecha or stat.ultima_fecha
+            stat.ultimo_proveedor_id = proveedor_id
+    ventana = ventana[-n_max:]
+    stat.mediana, stat.mad = _mediana_mad(ventana)
+    stat.ventana = [str(p.quantize(CUATRO)) for p in ventana]
+
+
+def _observaciones(factura, items) -> dict:
+    fecha = factura.fecha or factura.created_at.date()
+    obs = defaultdict(list)
+    for it in items:
+        precio = _dec(it.precio_unitario)
+        if it.tipo_item == "producto" and it.producto_id and precio:
+            obs[it.producto_id].append((fecha, precio, factura.proveedor_id))
+    return obs
+
+
+def registrar_factura(factura, items=None):
+    """
+    Suma los precios unitarios de la factura al historial de cada producto.
+    Se llama dentro de la transacción de confirm_invoice.
+    """
+    if items is None:
+        items = factura.items.all()
+    obs = _observaciones(factura, items)
+    if not obs:
+        return
+    n_max = _ventana()
+
+    for intento in range(2):
+        existentes = EstadisticaPrecio.objects.select_for_update().in_bulk(list(obs))
+        nuevos = []
+        for producto_id, observaciones in obs.items():
+            stat = existentes.get(producto_id)
+            if stat is None:
+                stat = EstadisticaPrecio(producto_id=producto_id, ventana=[], muestras=0)
+                nuevos.append(stat)
+            _aplicar(stat, observaciones, n_max)
+        try:
+            with transaction.atomic():
+                EstadisticaPrecio.objects.bulk_create(nuevos)
+        except IntegrityError:
+            # otra confirmación creó alguna fila en el medio: se relee con bloqueo
+            if intento:
+                raise
+            continue
+        EstadisticaPrecio.objects.bulk_update(
+            existentes.values(),
+            ["ultimo_precio", "ultima_fecha", "ultimo_proveedor", "mediana", "mad", "muestras", "ventana"],
+        )
+        return
+
+
+def evaluar(items, producto_ids) -> list[dict | None]:
+    """
+    Para cada ítem (MappedItem) con su producto asignado, un dict con la alerta
+    de precio o None. Una sola consulta para toda la factura.
+    """
+    ids = {pid for pid in producto_ids if pid}
+    stats = (
+        EstadisticaPrecio.objects.select_related("ultimo_proveedor").in_bulk(list(ids))
+        if ids else {}
+    )
+    min_muestras = int(getattr(settings, "PRECIO_ALERTA_MIN_MUESTRAS", 3))
+    z_max = Decimal(str(getattr(settings, "PRECIO_ALERTA_Z", 3.5)))
+    min_desvio = Decimal(str(getattr(settings, "PRECIO_ALERTA_MIN_DESVIO", 0.15)))
+
+    alertas = []
+    for it, pid in zip(items, producto_ids):
+        stat = stats.get(pid) if pid else None
+        precio = _dec(it.unit_price)
+        if stat is None or precio is None or stat.muestras < min_muestras or not stat.mediana:
+            alertas.append(None)
+            continue
+        desvio = (precio - stat.mediana) / stat.mediana
+        robusto = Decimal("0.6745") * abs(precio - stat.mediana) / stat.mad if stat.mad else None
+        if abs(desvio) < min_desvio or (robusto is not None and robusto < z_max):
+            alertas.append(None)
+            continue
+        alertas.append({
+            "desvio_pct": round(desvio * 100, 1),
+            "mediana": stat.mediana,
+            "ultimo_precio": stat.ultimo_precio,
+            "ultima_fecha": stat.ultima_fecha,
+            "ultimo_proveedor": stat.ultimo_proveedor.nombre if stat.ultimo_proveedor else None,
+        })
+    return alertas
+
+
+@transaction.atomic
+def rebuild(batch_size: int = 1000, producto_ids=None) -> int:
+    """
+    Recalcula el historial recorriendo los ítems por producto y fecha (en bloques).
+    producto_ids: recalcular solo esos productos (por defecto, todos).
+    Devuelve la cantidad de productos con historial.
+    """
+    stats, items = EstadisticaPrecio.objects.all(), ItemFactura.objects.all()
+    if producto_ids is not None:
+        stats = stats.filter(producto_id__in=producto_ids)
+        items = items.filter(producto_id__in=producto_ids)
+    stats.delete()
+    n_max = _ventana()
+    rows = (
+        items
+        .filter(tipo_item="producto", producto__isnull=False, precio_unitario__gt=0)
+        .order_by("producto_id", "factura__fecha", "factura_id", "id")
+        .values_list("producto_id", "factura__fecha", "factura__created_at", "precio_unitario",
+                     "factura__proveedor_id")
+        .iterator(chunk_size=batch_size)
+    )
+
+    pendientes, total = [], 0
+    actual, observaciones, cantidad = None, deque(maxlen=n_max), 0
+
+    def cerrar():
+        # solo hacen falta los últimos n_max precios; el resto solo suma a "muestras"
+        stat = EstadisticaPrecio(producto_id=actual, ventana=[], muestras=cantidad - len(observaciones))
+        _aplicar(stat, observaciones, n_max)
+        pendientes.append(stat)
+
+    for producto_id, fecha, created_at, precio, proveedor_id in rows:
+        if producto_id != actual:
+            if actual is not None:
+                cerrar()
+            actual, cantidad = producto_id, 0
+            observaciones.clear()
+        observaciones.append((fecha or created_at.date(), Decimal(precio), proveedor_id))
+        cantidad += 1
+        if len(pendientes) >= batch_size:
+            EstadisticaPrecio.objects.bulk_create(pendientes)
+            total += len(pendientes)
+            pendientes = []
+    if actual is not None:
+        cerrar()
+    EstadisticaPrecio.objects.bulk_create(pendientes)
+    return total + len(pendientes)
@@ -0,0 +1,188 @@
+"""
+preprocess.py
+----------------------------------------
+Optimización opcional del archivo ANTES de mandarlo a Document Intelligence.
+
+- Imágenes (fotos de celular): se corrige la orientación EXIF, se reducen a
+  DI_PREPROCESS_MAX_SIDE_PX de lado mayor y se recomprimen en JPEG sin metadatos.
+- PDFs: se quitan las páginas en blanco (requiere pypdf; si no está instalado
+  el PDF se manda tal cual).
+
+El original se archiva sin tocar; esto solo cambia lo que se analiza.
+Se activa con DI_PREPROCESS_ENABLED.
+"""
+
+import io
+import threading
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from PIL import Image, ImageOps, ImageStat, UnidentifiedImageError
+
+try:
+    import pypdf
+except ImportError:  # pragma: no cover - dependencia opcional
+    pypdf = None
+
+
+@dataclass
+class PreprocessResult:
+    data: bytes
+    content_type: str
+    original_bytes: int
+    pages_dropped: int = 0
+    actions: list = field(default_factory=list)
+
+    @property
+    def final_bytes(self) -> int:
+        return len(self.data)
+
+    @property
+    def saved_bytes(self) -> int:
+        return self.original_bytes - self.final_bytes
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.actions)
+
+
+def _cfg(name: str, default):
+    return getattr(settings, name, default)
+
+
+def _is_pdf(data: bytes, content_type: str) -> bool:
+    return data[:5] == b"%PDF-" or (content_type or "").endswith("/pdf")
+
+
+def optimize_for_analysis(data: bytes, content_type: str) -> PreprocessResult:
+    """
+    Devuelve el contenido a analizar. Si no hay nada que ganar, devuelve el original.
+    """
+    result = PreprocessResult(data=data, content_type=content_type, original_bytes=len(data))
+    try:
+        if _is_pdf(data, content_type):
+            _drop_blank_pages(result)
+        else:
+            _shrink_image(result)
+    except Exception as ex:
+        # cualquier problema → se analiza el original
+        print(f"⚠️ Preprocesado omitido: {ex}")
+        return PreprocessResult(data=data, content_type=content_type, original_bytes=len(data))
+    return result
+
+
+# -----------------------------------------------------------
+# IMÁGENES
+# -----------------------------------------------------------
+def _shrink_image(result: PreprocessResult):
+    max_side = int(_cfg("DI_PREPROCESS_MAX_SIDE_PX", 2500))
+    min_bytes = int(_cfg("DI_PREPROCESS_MIN_BYTES", 1024 * 1024))
+
+    try:
+        img = Image.open(io.BytesIO(result.data))
+    except UnidentifiedImageError:
+        return
+    if len(result.data) < min_bytes and max(img.size) <= max_side:
+        return
+
+    img = ImageOps.exif_transpose(img)
+    if max(img.size) > max_side:
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+    if img.mode in ("RGBA", "LA", "P"):
+        # transparencias sobre fondo blanco (JPEG no tiene canal alfa)
+        img = img.convert("RGBA")
+        bg = Image.new("RGB", img.size, (255, 255, 255))
+        bg.paste(img, mask=img.getchannel("A"))
+        img = bg
+    elif img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+
+    out = io.BytesIO()
+    # sin exif= → no se copian metadatos
+    img.save(out, format="JPEG", quality=int(_cfg("DI_PREPROCESS_JPEG_QUALITY", 85)), optimize=True)
+    optimized = out.getvalue()
+    if len(optimized) < len(result.data):
+        result.data = optimized
+        result.content_type = "image/jpeg"
+        result.actions.append(f"imagen {img.size[0]}x{img.size[1]} JPEG")
+
+
+# -----------------------------------------------------------
+# PDF
+# -----------------------------------------------------------
+def _image_is_blank(img) -> bool:
+    gray = img.convert("L")
+    gray.thumbnail((256, 256))
+    stat = ImageStat.Stat(gray)
+    return stat.mean[0] > 235 and stat.stddev[0] < 6
+
+
+def _page_is_blank(page) -> bool:
+    if (page.extract_text() or "").strip():
+        return False
+    images = list(page.images)
+    if images:
+        return all(_image_is_blank(im.image) for im in images)
+    # sin texto ni imágenes: en blanco salvo que tenga bastante dibujo vectorial
+    contents = page.get_contents()
+    return contents is None or len(contents.get_data()) < 200
+
+
+def _drop_blank_pages(result: PreprocessResult):
+    if pypdf is None:
+        return
+    reader = pypdf.PdfReader(io.BytesIO(result.data))
+    keep = [p for p in reader.pages if not _page_is_blank(p)]
+    dropped = len(reader.pages) - len(keep)
+    if not dropped or not keep:
+        return
+
+    writer = pypdf.PdfWriter()
+    for page in keep:
+        writer.add_page(page)
+    writer.compress_identical_objects(remove_identicals=True, remove_orphans=True)
+    out = io.BytesIO()
+    writer.write(out)
+
+    result.data = out.getvalue()
+    result.pages_dropped = dropped
+    result.actions.append(f"{dropped} página(s) en blanco quitadas")
+
+
+# -----------------------------------------------------------
+# ESTADÍSTICAS (bytes ahorrados y latencia de DI)
+# -----------------------------------------------------------
+_stats = {
+    "optimizados": {"docs": 0, "bytes_ahorrados": 0, "segundos_di": 0.0},
+    "sin_cambios": {"docs": 0, "bytes_ahorrados": 0, "segundos_di": 0.0},
+}
+_stats_lock = threading.Lock()
+
+
+def record_analysis(result: PreprocessResult, di_seconds: float):
+    """
+    Registra un análisis y muestra en consola el ahorro y la latencia promedio de DI
+    para documentos optimizados vs. sin cambios.
+    """
+    group = "optimizados" if result.changed else "sin_cambios"
+    with _stats_lock:
+        s = _stats[group]
+        s["docs"] += 1
+        s["bytes_ahorrados"] += result.saved_bytes
+        s["segundos_di"] += di_seconds
+        opt, raw = _stats["optimizados"], _stats["sin_cambios"]
+        avg_opt = opt["segundos_di"] / opt["docs"] if opt["docs"] else 0.0
+        avg_raw = raw["segundos_di"] / raw["docs"] if raw["docs"] else 0.0
+
+    if result.changed:
+        pct = 100 * result.saved_bytes / result.original_bytes if result.original_bytes else 0
+        print(
+            f"🗜️ Preprocesado: {result.original_bytes / 1e6:.2f} MB → {result.final_bytes / 1e6:.2f} MB "
+            f"(-{pct:.0f}%; {', '.join(result.actions)})"
+        )
+    print(f"⏱️ DI {di_seconds:.2f}s (promedio optimizados={avg_opt:.2f}s, sin cambios={avg_raw:.2f}s)")
+
+
+def stats() -> dict:
+    with _stats_lock:
+        return {k: dict(v) for k, v in _stats.items()}
@@ -0,0 +1,295 @@
+"""
+rollups.py
+----------------------------------------
+Mantenimiento de los resúmenes mensuales de gasto:
+    - ResumenProveedorMes: (proveedor, mes) → facturas, subtotal, impuestos, total
+    - ResumenProductoMes: (producto, mes) → facturas, líneas, cantidad, importe
+
+aplicar_factura() suma (o resta, con signo=-1) UNA factura con UPDATE ... SET x = x + n
+(F expressions): no relee nada y dos confirmaciones simultáneas no se pisan.
+Se llama dentro de la transacción de confirm_invoice, así que si la factura
+no se guarda, el resumen tampoco cambia. Al borrar una factura (también en
+cascada, ej. al borrar su proveedor) la señal pre_delete la descuenta dentro
+de la transacción del borrado.
+
+Editar una factura o un ítem ya sumados (admin, shell) o agregar/borrar un ítem
+suelto recalcula solo las filas afectadas, antes y después del cambio
+(recalcular_edicion, desde las señales de models.py). confirm_invoice crea la
+factura dentro de resumenes_suspendidos() y la suma de una vez.
+
+rebuild() recalcula todo desde Factura/ItemFactura (carga inicial o corrección);
+recalcular_productos() hace lo mismo solo para algunos productos.
+El mes de una factura es su fecha; si no tiene, la fecha de carga.
+"""
+
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import date
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DateField, F, Sum
+from django.db.models.functions import Cast, Coalesce, TruncMonth
+
+from invoices.models import Factura, ItemFactura, ResumenProductoMes, ResumenProveedorMes
+
+ZERO = Decimal("0")
+
+# campos que cambian los resúmenes: editar otros (número, descripción, ...) no recalcula nada
+CAMPOS_FACTURA = ("proveedor_id", "fecha", "subtotal", "total_impuestos", "total")
+CAMPOS_ITEM = ("factura_id", "producto_id", "tipo_item", "cantidad", "importe")
+
+_senal = threading.local()
+
+
+@contextmanager
+def resumenes_suspendidos():
+    """
+    Dentro del bloque, guardar facturas o ítems NO toca los resúmenes (ej. confirm_invoice,
+    que después suma la factura entera con aplicar_factura).
+    """
+    anterior = getattr(_senal, "suspendida", False)
+    _senal.suspendida = True
+    try:
+        yield
+    finally:
+        _senal.suspendida = anterior
+
+
+def suspendidos() -> bool:
+    return getattr(_senal, "suspendida", False)
+
+
+def mes_de(factura) -> date:
+    d = factura.fecha or factura.created_at.date()
+    return d.replace(day=1)
+
+
+def _dec(v) -> Decimal:
+    return Decimal(str(v)) if v is not None else ZERO
+
+
+def _increment(model, lookup: dict, deltas: dict, crear: bool = True):
+    """
+    UPDATE con F() sobre la fila (lookup); si no existe, la crea (si crear).
+    Si otra transacción la creó entre medio, se reintenta el UPDATE.
+    """
+    updates = {name: F(name) + value for name, value in deltas.items()}
+    if model.objects.filter(**lookup).update(**updates) or not crear:
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **deltas)
+    except IntegrityError:
+        model.objects.filter(**lookup).update(**updates)
+
+
+def aplicar_factura(factura, items=None, signo: int = 1):
+    """
+    Suma la factura (y sus ítems de tipo producto con producto asignado) a los resúmenes.
+    items: los ItemFactura ya creados (si no se pasan se leen de la base).
+    signo=-1 la descuenta (ej. al borrar una factura, ver descontar_factura).
+    """
+    mes = mes_de(factura)
+    _increment(
+        ResumenProveedorMes,
+        {"proveedor_id": factura.proveedor_id, "mes": mes},
+        {
+            "facturas": signo,
+            "subtotal": signo * _dec(factura.subtotal),
+            "total_impuestos": signo * _dec(factura.total_impuestos),
+            "total": signo * _dec(factura.total),
+        },
+        crear=signo > 0,  # al descontar, si no hay fila no hay nada que restar
+    )
+
+    if items is None:
+        items = factura.items.all()
+    por_producto = defaultdict(lambda: {"lineas": 0, "cantidad": ZERO, "importe": ZERO})
+    for it in items:
+        if it.tipo_item != "producto" or not it.producto_id:
+            continue
+        acc = por_producto[it.producto_id]
+        acc["lineas"] += 1
+        acc["cantidad"] += _dec(it.cantidad)
+        acc["importe"] += _dec(it.importe)
+
+    for producto_id, acc in por_producto.items():
+        _increment(
+            ResumenProductoMes,
+            {"producto_id": producto_id, "mes": mes},
+            {
+                "facturas": signo,  # una factura cuenta una vez aunque repita el producto
+                "lineas": signo * acc["lineas"],
+                "cantidad": signo * acc["cantidad"],
+                "importe": signo * acc["importe"],
+            },
+            crear=signo > 0,
+        )
+
+
+def descontar_factura(factura, items=None):
+    """
+    Resta la factura de los resúmenes (al borrarla). Si los resúmenes no estaban al
+    día y algún contador quedaría negativo, no se frena el borrado: se avisa que
+    hay que recalcular.
+    """
+    try:
+        with transaction.atomic():
+            aplicar_factura(factura, items, signo=-1)
+    except IntegrityError as ex:
+        print(f"⚠️ No se pudo descontar la factura {factura.pk} de los resúmenes ({ex}); "
+              "correr: python manage.py rebuild_resumenes")
+
+
+def claves(obj) -> tuple[set, set]:
+    """
+    Filas a las que suma una factura o un ítem: ({(proveedor_id, mes)}, {(producto_id, mes)}).
+    """
+    if isinstance(obj, Factura):
+        mes = mes_de(obj)
+        productos = (
+            obj.items.filter(tipo_item="producto", producto__isnull=False)
+            .values_list("producto_id", flat=True).distinct()
+        )
+        return {(obj.proveedor_id, mes)}, {(producto_id, mes) for producto_id in productos}
+    if obj.tipo_item != "producto" or not obj.producto_id:
+        return set(), set()
+    return set(), {(obj.producto_id, mes_de(obj.factura))}
+
+
+def recalcular_edicion(anterior, actual=None):
+    """
+    Factura o ítem editado: recalcula las filas a las que sumaba (anterior, leído de la
+    base antes de guardar; None si es nuevo) y a las que suma ahora (actual; None si se
+    borró). Si no cambió ningún campo de CAMPOS_FACTURA / CAMPOS_ITEM no hace nada.
+    """
+    obj = actual if actual is not None else anterior
+    campos = CAMPOS_FACTURA if isinstance(obj, Factura) else CAMPOS_ITEM
+    if anterior is not None and actual is not None and all(
+        getattr(anterior, c) == getattr(actual, c) for c in campos
+    ):
+        return
+    proveedores, productos = set(), set()
+    for o in (anterior, actual):
+        if o is not None:
+            prov, prod = claves(o)
+            proveedores |= prov
+            productos |= prod
+    recalcular(proveedores, productos)
+
+
+@transaction.atomic
+def recalcular(proveedores=(), productos=()):
+    """
+    Recalcula desde Factura/ItemFactura solo esas filas: (proveedor_id, mes) y (producto_id, mes).
+    Una fila que se queda sin facturas se borra (como en rebuild).
+    """
+    for proveedor_id, mes in proveedores:
+        fila = (
+            Factura.objects.filter(proveedor_id=proveedor_id)
+            .annotate(m=_mes_expr("fecha", "created_at")).filter(m=mes)
+            .aggregate(
+                facturas=Count("id"), subtotal=Sum("subtotal"),
+                total_impuestos=Sum("total_impuestos"), total=Sum("total"),
+            )
+        )
+        _reemplazar(ResumenProveedorMes, {"proveedor_id": proveedor_id, "mes": mes}, fila)
+
+    for producto_id, mes in productos:
+        fila = (
+            ItemFactura.objects.filter(producto_id=producto_id, tipo_item="producto")
+            .annotate(m=_mes_expr("factura__fecha", "factura__created_at")).filter(m=mes)
+            .aggregate(
+                facturas=Count("factura_id", distinct=True), lineas=Count("id"),
+                cantidad=Sum("cantidad"), importe=Sum("importe"),
+            )
+        )
+        _reemplazar(ResumenProductoMes, {"producto_id": producto_id, "mes": mes}, fila)
+
+
+def _reemplazar(model, lookup: dict, fila: dict):
+    if not fila["facturas"]:
+        model.objects.filter(**lookup).delete()
+        return
+    model.objects.update_or_create(**lookup, defaults={k: v if v is not None else ZERO for k, v in fila.items()})
+
+
+def _mes_expr(fecha_field: str, created_field: str):
+    return TruncMonth(Coalesce(fecha_field, Cast(created_field, DateField())), output_field=DateField())
+
+
+@transaction.atomic
+def rebuild(batch_size: int = 1000) -> dict:
+    """
+    Borra y recalcula los dos resúmenes con dos consultas agregadas.
+    Devuelve cuántas filas quedaron en cada uno.
+    """
+    ResumenProveedorMes.objects.all().delete()
+    ResumenProductoMes.objects.all().delete()
+
+    proveedores = (
+        Factura.objects
+        .annotate(m=_mes_expr("fecha", "created_at"))
+        .values("proveedor_id", "m")
+        .annotate(
+            n=Count("id"),
+            sub=Sum("subtotal"),
+            imp=Sum("total_impuestos"),
+            tot=Sum("total"),
+        )
+        .order_by()
+    )
+    ResumenProveedorMes.objects.bulk_create(
+        (
+            ResumenProveedorMes(
+                proveedor_id=row["proveedor_id"], mes=row["m"], facturas=row["n"],
+                subtotal=row["sub"] or ZERO, total_impuestos=row["imp"] or ZERO, total=row["tot"] or ZERO,
+            )
+            for row in proveedores.iterator()
+        ),
+        batch_size=batch_size,
+    )
+
+    _crear_resumenes_producto(ItemFactura.objects.all(), batch_size)
+
+    return {
+        "proveedor_mes": ResumenProveedorMes.objects.count(),
+        "producto_mes": ResumenProductoMes.objects.count(),
+    }
+
+
+@transaction.atomic
+def recalcular_productos(producto_ids, batch_size: int = 1000):
+    """
+    Recalcula solo los resúmenes de esos productos (ej. después de fusionar duplicados).
+    """
+    ResumenProductoMes.objects.filter(producto_id__in=producto_ids).delete()
+    _crear_resumenes_producto(ItemFactura.objects.filter(producto_id__in=producto_ids), batch_size)
+
+
+def _crear_resumenes_producto(items, batch_size: int):
+    productos = (
+        items
+        .filter(tipo_item="producto", producto__isnull=False)
+        .annotate(m=_mes_expr("factura__fecha", "factura__created_at"))
+        .values("producto_id", "m")
+        .annotate(
+            n=Count("factura_id", distinct=True),
+            lineas=Count("id"),
+            cant=Sum("cantidad"),
+            imp=Sum("importe"),
+        )
+        .order_by()
+    )
+    ResumenProductoMes.objects.bulk_create(
+        (
+            ResumenProductoMes(
+                producto_id=row["producto_id"], mes=row["m"], facturas=row["n"], lineas=row["lineas"],
+                cantidad=row["cant"] or ZERO, importe=row["imp"] or ZERO,
+            )
+            for row in productos.iterator()
+        ),
+        batch_size=batch_size,
+    )
@@ -0,0 +1,160 @@
+"""
+search.py
+----------------------------------------
+Búsqueda de texto completo en los ítems de factura (descripción y código),
+sobre el índice que crea la migración 0006_itemfactura_fts:
+
+- SQLite: tabla FTS5 (mantenida por triggers), ranking bm25, sin acentos.
+- PostgreSQL: tsvector 'simple' con prefijos + trigramas (tolera errores de tipeo),
+  ranking ts_rank / similarity.
+- Otros motores (o índice ausente): icontains como antes, sin ranking.
+
+Cada palabra buscada se trata como prefijo y todas deben aparecer
+("coca 1.5" encuentra "Coca Cola 1.5L").
+"""
+
+import re
+
+from django.db import DatabaseError, connection
+from django.db.models import F, FloatField, Func, Min, OuterRef, Q, Subquery
+from django.db.models.expressions import RawSQL
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_fts_available = None
+
+# Misma expresión que el índice GIN de la migración 0006 (tiene que coincidir para que se use)
+_PG_TSVECTOR = "to_tsvector('simple', coalesce({descripcion}, '') || ' ' || coalesce({codigo}, ''))"
+
+
+def _tokens(q: str) -> list[str]:
+    return _TOKEN_RE.findall(q or "")[:10]
+
+
+def fts_available() -> bool:
+    """
+    True si existe el índice para el motor actual (se verifica una vez por proceso).
+    """
+    global _fts_available
+    if _fts_available is None:
+        if connection.vendor == "sqlite":
+            sql = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'invoices_itemfactura_fts'"
+        elif connection.vendor == "postgresql":
+            # el ranking usa similarity(): hace falta pg_trgm además del índice
+            sql = (
+                "SELECT 1 FROM pg_indexes WHERE indexname = 'invoices_itemfactura_tsv_idx' "
+                "AND EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')"
+            )
+        else:
+            sql = None
+        try:
+            if sql:
+                with connection.cursor() as cursor:
+                    cursor.execute(sql)
+                    _fts_available = cursor.fetchone() is not None
+            else:
+                _fts_available = False
+        except DatabaseError as ex:
+            print(f"⚠️ No se pudo verificar el índice de texto completo ({ex}); se usa icontains")
+            _fts_available = False
+    return _fts_available
+
+
+class _SqlRank(Func):
+    """
+    Fragmento SQL de ranking (menor = más relevante) sobre columnas de la fila:
+    {nombre} se reemplaza por la columna ya con el alias que le dio el ORM, así
+    sirve en el listado y dentro de subqueries (ej. la exportación).
+    """
+    output_field = FloatField()
+
+    def __init__(self, sql: str, params: list, **columnas):
+        super().__init__(*[F(c) for c in columnas.values()])
+        self.rank_sql, self.rank_params, self.nombres = sql, params, list(columnas)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        cols = [compiler.compile(expr)[0] for expr in self.get_source_expressions()]
+        return self.rank_sql.format(**dict(zip(self.nombres, cols))), list(self.rank_params)
+
+
+def _rank_sqlite(tokens):
+    """
+    (SQL de las facturas que coinciden, anotación item_rank para Factura).
+    """
+    # cada palabra entre comillas (sin operadores FTS del usuario) y como prefijo
+    match = " ".join('"{}"*'.format(t.replace('"', '""')) for t in tokens)
+    matching = """
+        SELECT i.factura_id
+        FROM invoices_itemfactura_fts JOIN invoices_itemfactura i ON i.id = invoices_itemfactura_fts.rowid
+        WHERE invoices_itemfactura_fts MATCH %s
+    """
+    # bm25 (columna 'rank' de FTS5, negativa: menor = mejor) no se puede agregar directo
+    # ni pedir ítem por ítem (sería un MATCH por fila): la tabla derivada no depende de
+    # la factura, así que SQLite la arma una sola vez y la cruza por factura_id
+    rank = """(
+        SELECT r.best FROM (
+            SELECT i.factura_id, MIN(m.rank) AS best
+            FROM (
+                SELECT rowid, rank FROM invoices_itemfactura_fts
+                WHERE invoices_itemfactura_fts MATCH %s
+            ) m
+            JOIN invoices_itemfactura i ON i.id = m.rowid
+            GROUP BY i.factura_id
+        ) r
+        WHERE r.factura_id = {pk}
+    )"""
+    return (matching, [match]), _SqlRank(rank, [match], pk="pk")
+
+
+def _rank_postgres(q, tokens):
+    """
+    (SQL de las facturas que coinciden, anotación item_rank para Factura).
+    """
+    from invoices.models import ItemFactura
+
+    # los tokens ya son solo \w: no pueden inyectar operadores de tsquery
+    tsquery = " & ".join(f"{t}:*" for t in tokens)
+    matching = f"""
+        SELECT factura_id FROM invoices_itemfactura
+        WHERE {_PG_TSVECTOR.format(descripcion="descripcion", codigo="codigo_producto")}
+              @@ to_tsquery('simple', %s)
+           OR descripcion %% %s
+    """
+    # por ítem de la factura (índice por factura_id); ts_rank es real: se pasa a double
+    # para que el valor que viaja en el cursor se compare exacto
+    rank = _SqlRank(
+        f"(-GREATEST(ts_rank({_PG_TSVECTOR}, to_tsquery('simple', %s)), "
+        "similarity({descripcion}, %s)))::double precision",
+        [tsquery, q],
+        descripcion="descripcion", codigo="codigo_producto",
+    )
+    best = (
+        ItemFactura.objects.filter(factura=OuterRef("pk"))
+        .values("factura")
+        .annotate(best=Min(rank))
+        .values("best")
+    )
+    return (matching, [tsquery, q]), Subquery(best, output_field=FloatField())
+
+
+def filter_by_items(qs, q: str):
+    """
+    Restringe un queryset de Factura a las que tienen ítems que coinciden con q.
+    Con índice, anota item_rank (menor = más relevante) para ordenar: la mejor
+    relevancia entre sus ítems, calculada en la misma consulta que los demás
+    filtros del listado (no hay tope de resultados).
+    Devuelve (qs, ranked: bool).
+    """
+    tokens = _tokens(q)
+    if not tokens or not fts_available():
+        # sin índice: comportamiento anterior
+        qs = qs.filter(
+            Q(items__descripcion__icontains=q) |
+            Q(items__codigo_producto__icontains=q)
+        ).distinct()
+        return qs, False
+
+    if connection.vendor == "sqlite":
+        (matching, params), rank = _rank_sqlite(tokens)
+    else:
+        (matching, params), rank = _rank_postgres(q, tokens)
+    return qs.filter(pk__in=RawSQL(matching, params)).annotate(item_rank=rank), True
@@ -0,0 +1,243 @@
+"""
+storage.py
+----------------------------------------
+Backends de almacenamiento para los originales de las facturas.
+
+- AzureBlobStorage: Azure Blob (usa las funciones de azure_blob).
+- LocalFileStorage: disco local con rutas direccionadas por contenido (sha256),
+  para desarrollo, modo simulación y pruebas de carga sin Azure.
+
+El backend por defecto se elige con INVOICE_STORAGE_BACKEND ('azure' | 'local').
+Las facturas guardan la URL devuelta por upload_stream; storage_for_url(url)
+devuelve el backend que sabe leerla.
+"""
+
+import hashlib
+import mimetypes
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+
+from django.conf import settings
+
+from . import azure_blob
+
+
+@dataclass
+class BlobInfo:
+    size: int
+    etag: str
+    content_type: str | None
+
+
+class StorageBackend:
+    """
+    Interfaz mínima que usan las vistas y el análisis con DI.
+    Los nombres ('name') son los que devuelve name_from_url().
+    """
+
+    def upload_stream(self, stream, filename: str, content_type: str) -> str:
+        """Guarda el contenido y devuelve la URL a persistir en Factura.url_blob."""
+        raise NotImplementedError
+
+    def download_stream(self, name: str, offset: int = 0, length: int | None = None):
+        """Iterador de bloques de bytes (todo el archivo o el rango pedido)."""
+        raise NotImplementedError
+
+    def properties(self, name: str) -> BlobInfo:
+        raise NotImplementedError
+
+    def signed_url(self, name: str):
+        """(url, vencimiento) para que el cliente descargue directo, o None si no aplica."""
+        return None
+
+    def exists(self, name: str) -> bool:
+        raise NotImplementedError
+
+    def delete(self, name: str) -> None:
+        raise NotImplementedError
+
+    def name_from_url(self, url: str) -> str:
+        raise NotImplementedError
+
+
+class AzureBlobStorage(StorageBackend):
+
+    def __init__(self, container: str | None = None):
+        self.container = container or settings.AZURE_BLOB_CONTAINER
+
+    def upload_stream(self, stream, filename, content_type):
+        return azure_blob.upload_bytes(self.container, stream, filename, content_type)
+
+    def download_stream(self, name, offset=0, length=None):
+        return azure_blob.iter_blob_chunks(self.container, name, offset=offset, length=length)
+
+    def properties(self, name):
+        props = azure_blob.get_blob_properties(self.container, name)
+        return BlobInfo(
+            size=props.size,
+            etag=props.etag,
+            content_type=getattr(props.content_settings, "content_type", None),
+        )
+
+    def signed_url(self, name):
+        return azure_blob.get_sas(self.container, name)
+
+    def exists(self, name):
+        return azure_blob.blob_exists(self.container, name)
+
+    def delete(self, name):
+        azure_blob.delete_blob(self.container, name)
+
+    def name_from_url(self, url):
+        return azure_blob.to_blob_name_from_url(url)
+
+
+class LocalFileStorage(StorageBackend):
+    """
+    Guarda cada archivo en <root>/<ab>/<cd>/<sha256>.<ext>.
+    Subir dos veces el mismo archivo no ocupa espacio extra, y el sha256
+    sirve directamente como ETag. Como varias facturas pueden compartir el
+    archivo, delete() solo lo borra si ya ninguna factura lo referencia.
+    """
+
+    scheme = "local://"
+
+    def __init__(self, root=None):
+        self.root = Path(root or settings.LOCAL_STORAGE_ROOT)
+
+    def _path(self, name: str) -> Path:
+        path = (self.root / name).resolve()
+        if self.root.resolve() not in path.parents:
+            raise ValueError(f"Nombre de archivo inválido: {name}")
+        return path
+
+    def upload_stream(self, stream, filename, content_type):
+        ext = Path(filename).suffix.lower()
+        chunk_size = azure_blob.stream_chunk_size()
+        tmp_dir = self.root / "tmp"
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+
+        # se escribe a un temporal mientras se calcula el hash, después se mueve
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                if isinstance(stream, (bytes, bytearray)):
+                    digest.update(stream)
+                    out.write(stream)
+                else:
+                    while chunk := stream.read(chunk_size):
+                        digest.update(chunk)
+                        out.write(chunk)
+            sha = digest.hexdigest()
+            name = f"{sha[:2]}/{sha[2:4]}/{sha}{ext}"
+            final = self._path(name)
+            if final.exists():
+                os.remove(tmp_path)
+            else:
+                final.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp_path, final)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return f"{self.scheme}{name}"
+
+    def download_stream(self, name, offset=0, length=None):
+        path = self._path(name)
+        chunk_size = azure_blob.stream_chunk_size()
+        remaining = path.stat().st_size - offset if length is None else length
+
+        def _chunks(fh, remaining):
+            with fh:
+                fh.seek(offset)
+                while remaining > 0:
+                    chunk = fh.read(min(chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+
+        # el archivo se abre ya: si no existe, falla acá y no a mitad de la respuesta
+        return _chunks(open(path, "rb"), remaining)
+
+    def properties(self, name):
+        path = self._path(name)
+        return BlobInfo(
+            size=path.stat().st_size,
+            etag=f'"{path.stem}"',
+            content_type=mimetypes.guess_type(path.name)[0],
+        )
+
+    def exists(self, name):
+        return self._path(name).exists()
+
+    def delete(self, name):
+        # el mismo contenido es el mismo archivo: no se borra si otra factura lo usa
+        from invoices.models import Factura
+
+        if Factura.objects.filter(url_blob=f"{self.scheme}{name}").exists():
+            print(f"📎 {name} lo usa otra factura: no se borra")
+            return
+        self._path(name).unlink(missing_ok=True)
+
+    def name_from_url(self, url):
+        return url[len(self.scheme):] if url.startswith(self.scheme) else url
+
+
+class UnavailableStorage(StorageBackend):
+    """
+    URLs que no apuntan a ningún archivo real: las que guardaba el modo
+    simulación antes de existir LocalFileStorage (https://simulacion.blob...)
+    o una URL vacía. Leerlas lanza FileNotFoundError (la vista responde 404).
+    """
+
+    prefixes = ("https://simulacion.blob.core.windows.net/",)
+
+    def _missing(self, name, *args, **kwargs):
+        raise FileNotFoundError(f"El original no está disponible: {name}")
+
+    download_stream = properties = delete = _missing
+
+    def exists(self, name):
+        return False
+
+    def name_from_url(self, url):
+        return url or ""
+
+
+_BACKENDS = {
+    "azure": AzureBlobStorage,
+    "local": LocalFileStorage,
+    "unavailable": UnavailableStorage,
+}
+_instances = {}
+
+
+def _backend(key: str) -> StorageBackend:
+    if key not in _instances:
+        if key not in _BACKENDS:
+            raise RuntimeError(f"INVOICE_STORAGE_BACKEND desconocido: {key}")
+        _instances[key] = _BACKENDS[key]()
+    return _instances[key]
+
+
+def get_storage() -> StorageBackend:
+    """
+    Backend donde se guardan las facturas nuevas.
+    """
+    return _backend(getattr(settings, "INVOICE_STORAGE_BACKEND", "azure"))
+
+
+def storage_for_url(url: str) -> StorageBackend:
+    """
+    Backend capaz de leer una URL ya guardada (las facturas viejas pueden
+    estar en otro backend que el actual).
+    """
+    if url and url.startswith(LocalFileStorage.scheme):
+        return _backend("local")
+    if not url or url.startswith(UnavailableStorage.prefixes):
+        return _backend("unavailable")
+    return _backend("azure")
@@ -1,3 +1,1095 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import email.utils
+import io
+import json
+import tempfile
+import time
+from dataclasses import fields as dc_fields
+from datetime import date, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from azure.core.exceptions import HttpResponseError, ResourceExistsError, ServiceRequestError
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from invoices.models import (
+    EstadisticaPrecio, Factura, ItemFactura, PlantillaFactura, ReglaClasificacion, ResumenProductoMes,
+    ResumenProveedorMes,
+)
+from invoices.services import (
+    azure_blob, azure_di_async, azure_http, clasificador, di_simulator, export, governor, pdf_text, precios,
+    preprocess, rollups, search, storage,
+)
+from invoices.services.azure_di import merge_di_results
+from invoices.services.di_simulator import FakeField
+from invoices.services.mapping import MappedHeader, MappedInvoice, MappedItem, map_invoice_result
+from invoices.services.pagination import OrderKey, decode_cursor, encode_cursor, paginate_keyset
+from productos.models import Producto, embeddings_suspendidos
+from proveedores.models import Proveedor
+
+
+def _resumenes():
+    proveedores = list(
+        ResumenProveedorMes.objects.order_by("proveedor_id", "mes")
+        .values_list("proveedor_id", "mes", "facturas", "subtotal", "total_impuestos", "total")
+    )
+    productos = list(
+        ResumenProductoMes.objects.order_by("producto_id", "mes")
+        .values_list("producto_id", "mes", "facturas", "lineas", "cantidad", "importe")
+    )
+    return proveedores, productos
+
+
+class PaginacionKeysetTests(TestCase):
+    # fecha desc (NULL al final), total asc (NULL al final), id desc: sentidos y nulos mezclados
+    KEYS = [
+        OrderKey("fecha", descending=True, nullable=True),
+        OrderKey("total", nullable=True),
+        OrderKey("id", descending=True),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        proveedor = Proveedor.objects.create(nombre="Distribuidora Norte")
+        fechas = [date(2025, 3, 1), date(2025, 3, 1), date(2025, 2, 10), None]
+        totales = [Decimal("100"), Decimal("50.5"), None, Decimal("100")]
+        Factura.objects.bulk_create(
+            Factura(proveedor=proveedor, numero=str(i), fecha=fechas[i % 4], total=totales[(i // 4) % 4])
+            for i in range(23)
+        )
+        facturas = list(Factura.objects.all())
+        facturas.sort(key=lambda f: (
+            f.fecha is None, -(f.fecha.toordinal() if f.fecha else 0),
+            f.total is None, f.total or 0,
+            -f.id,
+        ))
+        cls.esperado = [f.id for f in facturas]
+
+    def _paginas(self, cursor=None, atras=False, per_page=4):
+        paginas = []
+        while True:
+            page = paginate_keyset(Factura.objects.all(), self.KEYS, cursor=cursor, per_page=per_page)
+            paginas.append([f.id for f in page])
+            if not (page.has_previous if atras else page.has_next):
+                return paginas, page
+            cursor = page.previous_cursor if atras else page.next_cursor
+
+    def test_cursor_ida_y_vuelta(self):
+        cursor = encode_cursor([date(2025, 3, 1), Decimal("50.50"), 7], backwards=True)
+        self.assertEqual(
+            decode_cursor(cursor, Factura.objects.all(), self.KEYS),
+            ([date(2025, 3, 1), Decimal("50.50"), 7], True),
+        )
+        cursor = encode_cursor([None, None, 3])
+        self.assertEqual(decode_cursor(cursor, Factura.objects.all(), self.KEYS), ([None, None, 3], False))
+
+    def test_cursor_invalido(self):
+        qs = Factura.objects.all()
+        self.assertIsNone(decode_cursor("no-es-base64!", qs, self.KEYS))
+        self.assertIsNone(decode_cursor(encode_cursor([1, 2]), qs, self.KEYS))         # otra cantidad de claves
+        self.assertIsNone(decode_cursor(encode_cursor(["x", 1, 2]), qs, self.KEYS))    # fecha inválida
+        page = paginate_keyset(qs, self.KEYS, cursor="basura", per_page=4)
+        self.assertEqual([f.id for f in page], self.esperado[:4])  # → primera página
+
+    def test_hacia_adelante_recorre_todo_en_orden(self):
+        paginas, ultima = self._paginas()
+
+        self.assertEqual([pk for pagina in paginas for pk in pagina], self.esperado)
+        self.assertEqual([len(p) for p in paginas], [4, 4, 4, 4, 4, 3])
+        self.assertFalse(ultima.has_next)
+
+    def test_hacia_atras_devuelve_las_mismas_paginas(self):
+        adelante, ultima = self._paginas()
+
+        atras, primera = self._paginas(cursor=ultima.previous_cursor, atras=True)
+
+        self.assertEqual(list(reversed(atras)), adelante[:-1])
+        self.assertFalse(primera.has_previous)
+
+    def test_conteo_con_tope(self):
+        page = paginate_keyset(Factura.objects.all(), self.KEYS, per_page=4, count_cap=10)
+        self.assertEqual((page.count, page.count_capped), (10, True))
+        page = paginate_keyset(Factura.objects.all(), self.KEYS, per_page=4, count_cap=50)
+        self.assertEqual((page.count, page.count_capped), (23, False))
+
+
+class RollupsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.proveedor = Proveedor.objects.create(nombre="Distribuidora Norte")
+        cls.otro = Proveedor.objects.create(nombre="Bebidas Sur")
+        with embeddings_suspendidos():
+            cls.coca = Producto.objects.create(nombre="Coca Cola 1.5L")
+            cls.fernet = Producto.objects.create(nombre="Fernet 750ml")
+
+    def _confirmar(self, proveedor, fecha, lineas):
+        """Como confirm_invoice: crea la factura con sus ítems y la suma a los resúmenes."""
+        subtotal = sum((cant * precio for _, cant, precio in lineas), Decimal("0"))
+        with rollups.resumenes_suspendidos():
+            factura = Factura.objects.create(
+                proveedor=proveedor, fecha=fecha,
+                subtotal=subtotal, total_impuestos=subtotal * Decimal("0.21"), total=subtotal * Decimal("1.21"),
+            )
+            items = [
+                ItemFactura.objects.create(
+                    factura=factura, producto=producto, descripcion=producto.nombre if producto else "IVA",
+                    cantidad=cant, precio_unitario=precio, importe=cant * precio,
+                    tipo_item="producto" if producto else "impuesto",
+                )
+                for producto, cant, precio in lineas
+            ]
+        rollups.aplicar_factura(factura, items)
+        return factura
+
+    def test_incrementos_por_mes(self):
+        self._confirmar(self.proveedor, date(2025, 3, 5), [(self.coca, Decimal("6"), Decimal("1000"))])
+        self._confirmar(self.proveedor, date(2025, 3, 20), [
+            (self.coca, Decimal("12"), Decimal("1100")),
+            (self.coca, Decimal("1"), Decimal("1100")),
+            (None, Decimal("1"), Decimal("500")),
+        ])
+
+        fila = ResumenProveedorMes.objects.get(proveedor=self.proveedor, mes=date(2025, 3, 1))
+        self.assertEqual(fila.facturas, 2)
+        self.assertEqual(fila.subtotal, Decimal("20800.00"))
+
+        producto = ResumenProductoMes.objects.get(producto=self.coca, mes=date(2025, 3, 1))
+        self.assertEqual(producto.facturas, 2)  # la segunda repite el producto: cuenta una vez
+        self.assertEqual(producto.lineas, 3)
+        self.assertEqual(producto.cantidad, Decimal("19"))
+        self.assertEqual(producto.importe, Decimal("20300.00"))
+
+    def test_rebuild_coincide_con_los_incrementos(self):
+        self._confirmar(self.proveedor, date(2025, 3, 5), [(self.coca, Decimal("6"), Decimal("1000"))])
+        self._confirmar(self.proveedor, date(2025, 4, 2), [
+            (self.coca, Decimal("2"), Decimal("1050")), (self.fernet, Decimal("3"), Decimal("9000")),
+        ])
+        self._confirmar(self.otro, date(2025, 4, 9), [(self.fernet, Decimal("1"), Decimal("9500"))])
+        incrementales = _resumenes()
+
+        filas = rollups.rebuild()
+
+        self.assertEqual(filas, {"proveedor_mes": 3, "producto_mes": 3})
+        self.assertEqual(_resumenes(), incrementales)
+
+    def test_borrar_factura_la_descuenta(self):
+        self._confirmar(self.proveedor, date(2025, 4, 2), [(self.fernet, Decimal("3"), Decimal("9000"))])
+        borrada = self._confirmar(self.proveedor, date(2025, 4, 9), [
+            (self.fernet, Decimal("1"), Decimal("9500")), (self.coca, Decimal("2"), Decimal("1000")),
+        ])
+
+        borrada.delete()
+
+        fila = ResumenProveedorMes.objects.get(proveedor=self.proveedor, mes=date(2025, 4, 1))
+        self.assertEqual(fila.facturas, 1)
+        self.assertEqual(fila.subtotal, Decimal("27000.00"))
+        self.assertEqual(ResumenProductoMes.objects.get(producto=self.coca).facturas, 0)
+        descontados = _resumenes()
+        rollups.rebuild()
+        # rebuild no deja filas en cero; el resto tiene que coincidir
+        self.assertEqual([f for f in descontados[1] if f[2]], _resumenes()[1])
+        self.assertEqual(descontados[0], _resumenes()[0])
+
+    def test_borrar_proveedor_descuenta_sus_facturas(self):
+        self._confirmar(self.proveedor, date(2025, 4, 2), [(self.fernet, Decimal("3"), Decimal("9000"))])
+        self._confirmar(self.otro, date(2025, 4, 9), [(self.fernet, Decimal("1"), Decimal("9500"))])
+
+        otro_id = self.otro.pk
+        self.otro.delete()
+
+        self.assertFalse(ResumenProveedorMes.objects.filter(proveedor_id=otro_id).exists())
+        fernet = ResumenProductoMes.objects.get(producto=self.fernet)
+        self.assertEqual((fernet.facturas, fernet.lineas, fernet.importe), (1, 1, Decimal("27000.00")))
+
+    def test_borrar_sin_resumenes_no_falla(self):
+        with rollups.resumenes_suspendidos():  # p. ej. cargada antes de que existieran los resúmenes
+            factura = Factura.objects.create(proveedor=self.proveedor, fecha=date(2025, 5, 1), total=Decimal("10"))
+            ItemFactura.objects.create(factura=factura, producto=self.coca, cantidad=1, importe=10, tipo_item="producto")
+
+        factura.delete()  # nunca se sumó: no hay nada que restar
+
+        self.assertEqual(_resumenes(), ([], []))
+
+    def test_editar_factura_recalcula_sus_filas(self):
+        self._confirmar(self.proveedor, date(2025, 3, 5), [(self.coca, Decimal("6"), Decimal("1000"))])
+        factura = self._confirmar(self.proveedor, date(2025, 3, 20), [
+            (self.coca, Decimal("2"), Decimal("1000")), (self.fernet, Decimal("1"), Decimal("9000")),
+        ])
+
+        # como el admin: otro mes, otro proveedor y otro total
+        factura = Factura.objects.get(pk=factura.pk)
+        factura.fecha, factura.proveedor, factura.total = date(2025, 4, 2), self.otro, Decimal("15000")
+        factura.save()
+        editados = _resumenes()
+        rollups.rebuild()
+
+        self.assertEqual(editados, _resumenes())
+        self.assertEqual(
+            ResumenProveedorMes.objects.get(proveedor=self.otro).total, Decimal("15000.00"),
+        )
+        self.assertEqual(
+            list(ResumenProductoMes.objects.filter(producto=self.coca).values_list("mes", "facturas")),
+            [(date(2025, 4, 1), 1), (date(2025, 3, 1), 1)],
+        )
+
+    def test_editar_agregar_y_borrar_items(self):
+        factura = self._confirmar(self.proveedor, date(2025, 3, 5), [
+            (self.coca, Decimal("6"), Decimal("1000")), (self.coca, Decimal("1"), Decimal("1000")),
+        ])
+        primero, segundo = factura.items.all()
+
+        primero.cantidad, primero.importe = Decimal("12"), Decimal("12000")
+        primero.save()
+        segundo.producto = self.fernet
+        segundo.save()
+        ItemFactura.objects.create(factura=factura, producto=self.fernet, cantidad=2, importe=18000,
+                                   tipo_item="producto")
+        editados = _resumenes()
+        rollups.rebuild()
+        self.assertEqual(editados, _resumenes())
+        fernet = ResumenProductoMes.objects.get(producto=self.fernet)
+        self.assertEqual((fernet.facturas, fernet.lineas, fernet.cantidad), (1, 2, Decimal("3")))
+
+        primero.delete()
+        factura.items.filter(producto=self.fernet).delete()
+
+        self.assertEqual(_resumenes()[1], [])
+        self.assertEqual(ResumenProveedorMes.objects.get(proveedor=self.proveedor).facturas, 1)
+
+    def test_guardar_sin_cambios_no_recalcula(self):
+        factura = self._confirmar(self.proveedor, date(2025, 3, 5), [(self.coca, Decimal("6"), Decimal("1000"))])
+        factura = Factura.objects.get(pk=factura.pk)
+        item = factura.items.get()
+
+        factura.numero, item.descripcion = "0001-00000042", "Coca Cola 1,5 L"
+        with mock.patch("invoices.services.rollups.recalcular") as recalcular:
+            factura.save()
+            item.save()
+
+        recalcular.assert_not_called()
+
+
+@override_settings(PRECIO_VENTANA=20, PRECIO_ALERTA_MIN_MUESTRAS=3, PRECIO_ALERTA_Z=3.5,
+                   PRECIO_ALERTA_MIN_DESVIO=0.15)
+class PreciosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.proveedor = Proveedor.objects.create(nombre="Distribuidora Norte")
+        with embeddings_suspendidos():
+            cls.coca = Producto.objects.create(nombre="Coca Cola 1.5L")
+            cls.fernet = Producto.objects.create(nombre="Fernet 750ml")
+
+    def _comprar(self, producto, precios_unitarios, desde=1):
+        for dia, precio in enumerate(precios_unitarios, start=desde):
+            factura = Factura.objects.create(proveedor=self.proveedor, fecha=date(2025, 3, dia))
+            item = ItemFactura.objects.create(
+                factura=factura, producto=producto, cantidad=1,
+                precio_unitario=Decimal(str(precio)), importe=Decimal(str(precio)), tipo_item="producto",
+            )
+            precios.registrar_factura(factura, [item])
+
+    def _evaluar(self, producto, precio):
+        return precios.evaluar([MappedItem(description=producto.nombre, unit_price=precio)], [producto.pk])[0]
+
+    def test_mediana_y_mad(self):
+        self.assertEqual(
+            precios._mediana_mad([Decimal(p) for p in ("100", "102", "98", "101", "99", "130")]),
+            (Decimal("100.5000"), Decimal("1.5000")),
+        )
+
+    def test_registrar_factura_acumula_el_historial(self):
+        self._comprar(self.coca, [100, 102, 98, 101, 99])
+
+        stat = EstadisticaPrecio.objects.get(producto=self.coca)
+        self.assertEqual((stat.mediana, stat.mad, stat.muestras), (Decimal("100"), Decimal("1"), 5))
+        self.assertEqual((stat.ultimo_precio, stat.ultima_fecha), (Decimal("99"), date(2025, 3, 5)))
+
+    @override_settings(PRECIO_VENTANA=3)
+    def test_ventana_usa_los_ultimos_precios(self):
+        self._comprar(self.coca, [10, 10, 10, 100, 100, 100])
+
+        stat = EstadisticaPrecio.objects.get(producto=self.coca)
+        self.assertEqual((stat.mediana, stat.muestras, len(stat.ventana)), (Decimal("100"), 6, 3))
+
+    def test_alertas_por_desvio_robusto(self):
+        self._comprar(self.coca, [100, 102, 98, 101, 99])
+
+        self.assertIsNone(self._evaluar(self.coca, 103))           # dentro de lo habitual
+        alerta = self._evaluar(self.coca, 130)
+        self.assertEqual(alerta["desvio_pct"], Decimal("30.0"))
+        self.assertEqual(alerta["ultimo_proveedor"], "Distribuidora Norte")
+        self.assertEqual(self._evaluar(self.coca, 80)["desvio_pct"], Decimal("-20.0"))
+
+    def test_mad_cero_usa_solo_el_desvio_relativo(self):
+        self._comprar(self.fernet, [9000, 9000, 9000])
+
+        self.assertIsNone(self._evaluar(self.fernet, 10000))       # 11 % < 15 %
+        self.assertIsNotNone(self._evaluar(self.fernet, 10500))    # 16,7 %
+
+    def test_sin_muestras_suficientes_no_alerta(self):
+        self._comprar(self.fernet, [9000, 9000])
+
+        self.assertIsNone(self._evaluar(self.fernet, 20000))
+        self.assertEqual(
+            precios.evaluar([MappedItem(unit_price=20000), MappedItem(unit_price=None)], [None, self.fernet.pk]),
+            [None, None],
+        )
+
+    def test_rebuild_coincide_con_el_incremental(self):
+        self._comprar(self.coca, [100, 102, 98, 101, 99])
+        self._comprar(self.fernet, [9000, 9100], desde=10)
+        campos = ("producto_id", "ultimo_precio", "ultima_fecha", "mediana", "mad", "muestras", "ventana")
+        incrementales = list(EstadisticaPrecio.objects.order_by("producto_id").values_list(*campos))
+
+        self.assertEqual(precios.rebuild(), 2)
+        self.assertEqual(list(EstadisticaPrecio.objects.order_by("producto_id").values_list(*campos)), incrementales)
+
+
+class AlmacenamientoLocalTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.backend = storage.LocalFileStorage(root=tmp.name)
+        self.proveedor = Proveedor.objects.create(nombre="Distribuidora Norte")
+
+    def test_mismo_contenido_mismo_archivo(self):
+        url = self.backend.upload_stream(b"%PDF-1.7 factura", "Factura A.PDF", "application/pdf")
+        otra = self.backend.upload_stream(io.BytesIO(b"%PDF-1.7 factura"), "copia.pdf", "application/pdf")
+
+        self.assertEqual(url, otra)
+        self.assertTrue(url.startswith("local://") and url.endswith(".pdf"))
+        nombre = self.backend.name_from_url(url)
+        self.assertEqual(b"".join(self.backend.download_stream(nombre, offset=9, length=7)), b"factura")
+        self.assertIs(storage.storage_for_url(url).__class__, storage.LocalFileStorage)
+
+    def test_la_url_local_pasa_la_validacion_del_modelo(self):
+        url = self.backend.upload_stream(b"%PDF-1.7", "f.pdf", "application/pdf")
+        factura = Factura(proveedor=self.proveedor, url_blob=url)
+
+        factura.full_clean()  # el admin valida igual
+
+    def test_no_borra_un_archivo_que_usa_otra_factura(self):
+        url = self.backend.upload_stream(b"%PDF-1.7 compartida", "f.pdf", "application/pdf")
+        nombre = self.backend.name_from_url(url)
+        primera = Factura.objects.create(proveedor=self.proveedor, url_blob=url)
+        Factura.objects.create(proveedor=self.proveedor, url_blob=url)
+
+        primera.delete()
+        self.backend.delete(nombre)
+        self.assertTrue(self.backend.exists(nombre))
+
+        Factura.objects.all().delete()
+        self.backend.delete(nombre)
+        self.assertFalse(self.backend.exists(nombre))
+
+    def test_urls_sin_archivo(self):
+        for url in ("", None, "https://simulacion.blob.core.windows.net/facturas/x.pdf"):
+            backend = storage.storage_for_url(url)
+            self.assertFalse(backend.exists(backend.name_from_url(url)))
+            with self.assertRaises(FileNotFoundError):
+                backend.properties(backend.name_from_url(url))
+
+
+class VerOriginalTests(TestCase):
+    DATOS = b"%PDF-1.7\n" + b"0123456789" * 10  # 109 bytes
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        backend = storage.LocalFileStorage(root=tmp.name)
+        patcher = mock.patch.dict(storage._instances, {"local": backend})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        url_blob = backend.upload_stream(self.DATOS, "factura.pdf", "application/pdf")
+        self.etag = backend.properties(backend.name_from_url(url_blob)).etag
+        proveedor = Proveedor.objects.create(nombre="Distribuidora Norte")
+        self.factura = Factura.objects.create(proveedor=proveedor, url_blob=url_blob)
+        self.url = reverse("invoice_view_original", args=[self.factura.pk])
+        self.client.force_login(User.objects.create_user("cajero", password="x"))
+
+    def _get(self, **headers):
+        response = self.client.get(self.url, headers=headers)
+        contenido = b"".join(response.streaming_content) if response.streaming else response.content
+        return response, contenido
+
+    def test_archivo_completo(self):
+        response, contenido = self._get()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(contenido, self.DATOS)
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertEqual(response["Content-Length"], "109")
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(response["ETag"], self.etag)
+
+    def test_rangos(self):
+        casos = {
+            "bytes=9-18": (9, 18),
+            "bytes=100-": (100, 108),
+            "bytes=-5": (104, 108),
+            "bytes=100-5000": (100, 108),
+        }
+        for rango, (inicio, fin) in casos.items():
+            response, contenido = self._get(Range=rango)
+            self.assertEqual(response.status_code, 206, rango)
+            self.assertEqual(response["Content-Range"], f"bytes {inicio}-{fin}/109")
+            self.assertEqual(response["Content-Length"], str(fin - inicio + 1))
+            self.assertEqual(contenido, self.DATOS[inicio:fin + 1])
+
+    def test_rango_imposible(self):
+        for rango in ("bytes=109-", "bytes=-0", "bytes=20-10"):
+            response, _ = self._get(Range=rango)
+            self.assertEqual(response.status_code, 416, rango)
+            self.assertEqual(response["Content-Range"], "bytes */109")
+
+    def test_rango_ignorado(self):
+        # multi-rango, o If-Range con otra versión del archivo: se sirve completo
+        for headers in ({"Range": "bytes=0-1,5-6"}, {"Range": "bytes=0-9", "If-Range": '"otra"'}):
+            response, contenido = self._get(**headers)
+            self.assertEqual((response.status_code, contenido), (200, self.DATOS), headers)
+
+        response, contenido = self._get(Range="bytes=0-8", **{"If-Range": self.etag})
+        self.assertEqual((response.status_code, contenido), (206, b"%PDF-1.7\n"))
+
+    def test_no_modificado(self):
+        response, contenido = self._get(**{"If-None-Match": self.etag})
+
+        self.assertEqual((response.status_code, contenido), (304, b""))
+        self.assertEqual(response["ETag"], self.etag)
+
+    def test_sin_archivo(self):
+        Factura.objects.filter(pk=self.factura.pk).update(url_blob=None)
+
+        self.assertEqual(self._get()[0].status_code, 404)
+
+
+def _http_error(status, **headers):
+    return HttpResponseError(message="error", response=SimpleNamespace(status_code=status, reason="", headers=headers))
+
+
+class GovernorTests(SimpleTestCase):
+    def _governor(self, **kwargs):
+        opciones = dict(name="test", rate_per_sec=0, burst=1, max_in_flight=1,
+                        max_retries=3, base_delay=1.0, max_delay=10.0)
+        opciones.update(kwargs)
+        return governor.CallGovernor(**opciones)
+
+    def test_retry_after_en_segundos_y_milisegundos(self):
+        self.assertEqual(governor._retry_after_seconds(_http_error(429, **{"Retry-After": "7"})), 7.0)
+        self.assertEqual(governor._retry_after_seconds(_http_error(429, **{"retry-after-ms": "1500"})), 1.5)
+        self.assertEqual(governor._retry_after_seconds(_http_error(503, **{"x-ms-retry-after-ms": "250"})), 0.25)
+        self.assertIsNone(governor._retry_after_seconds(_http_error(503)))
+
+    def test_retry_after_con_fecha_http(self):
+        fecha = email.utils.formatdate(time.time() + 30, usegmt=True)
+
+        espera = governor._retry_after_seconds(_http_error(429, **{"Retry-After": fecha}))
+
+        self.assertAlmostEqual(espera, 30, delta=2)
+        pasada = email.utils.formatdate(time.time() - 60, usegmt=True)
+        self.assertEqual(governor._retry_after_seconds(_http_error(429, **{"Retry-After": pasada})), 0.0)
+
+    def test_retry_after_ilegible_usa_el_backoff_normal(self):
+        for valor in ("mañana", "Mon, 99 Foo 2025", "1,5"):
+            ex = _http_error(429, **{"Retry-After": valor, "retry-after-ms": "x"})
+            self.assertIsNone(governor._retry_after_seconds(ex), valor)
+            with mock.patch("invoices.services.governor.random.uniform", return_value=0.3) as uniform:
+                self.assertEqual(self._governor()._backoff(2, ex), 0.3)
+            uniform.assert_called_once_with(0, 4.0)
+
+    def test_backoff_con_jitter_y_tope(self):
+        gov = self._governor(base_delay=1.0, max_delay=10.0)
+        ex = ServiceRequestError("sin red")
+
+        for intento, techo in ((0, 1.0), (1, 2.0), (3, 8.0), (6, 10.0)):
+            esperas = [gov._backoff(intento, ex) for _ in range(50)]
+            self.assertTrue(all(0 <= e <= techo for e in esperas), intento)
+        # Retry-After manda, pero nunca por encima del máximo
+        self.assertEqual(gov._backoff(0, _http_error(429, **{"Retry-After": "3"})), 3.0)
+        self.assertEqual(gov._backoff(0, _http_error(429, **{"Retry-After": "120"})), 10.0)
+
+    def test_reintenta_errores_transitorios(self):
+        gov = self._governor()
+        fn = mock.Mock(side_effect=[_http_error(429, **{"Retry-After": "0"}), ServiceRequestError("sin red"), "ok"])
+
+        with mock.patch("invoices.services.governor.time.sleep"):
+            self.assertEqual(gov.call(fn, 1), "ok")
+
+        self.assertEqual(fn.call_count, 3)
+        self.assertEqual(gov.stats(), {"calls": 1, "throttled": 1, "retries": 2, "failures": 0})
+
+    def test_no_reintenta_errores_definitivos(self):
+        gov = self._governor()
+        for ex in (_http_error(400), _http_error(404), ValueError("bug")):
+            fn = mock.Mock(side_effect=ex)
+            with mock.patch("invoices.services.governor.time.sleep") as sleep, self.assertRaises(type(ex)):
+                gov.call(fn)
+            self.assertEqual(fn.call_count, 1)
+            sleep.assert_called_with(0.0)  # solo la espera del token bucket
+
+        self.assertEqual(gov.stats(), {"calls": 3, "throttled": 0, "retries": 0, "failures": 3})
+
+    def test_se_rinde_al_agotar_los_reintentos(self):
+        gov = self._governor(max_retries=2)
+        fn = mock.Mock(side_effect=_http_error(503))
+
+        with mock.patch("invoices.services.governor.time.sleep"), self.assertRaises(HttpResponseError):
+            gov.call(fn)
+
+        self.assertEqual(fn.call_count, 3)
+        self.assertEqual(gov.stats(), {"calls": 1, "throttled": 3, "retries": 2, "failures": 1})
+
+
+class MergeDITests(SimpleTestCase):
+    def _rango(self, confianza_items, items, **cabecera):
+        fields = {k: FakeField(value_string=v) for k, v in cabecera.items()}
+        fields["Items"] = SimpleNamespace(value_array=items, value_string=None, confidence=confianza_items)
+        return SimpleNamespace(documents=[SimpleNamespace(fields=fields)])
+
+    def test_une_los_rangos(self):
+        resultado = merge_di_results([
+            self._rango(0.9, ["i1", "i2"], VendorName="Distribuidora Norte"),
+            None,
+            self._rango(0.6, ["i3"], VendorName="Pie de página", InvoiceTotal="1000"),
+            self._rango(None, ["i4"]),
+        ])
+
+        fields = resultado.documents[0].fields
+        self.assertEqual(fields["VendorName"].value_string, "Distribuidora Norte")
+        self.assertEqual(fields["InvoiceTotal"].value_string, "1000")
+        items = fields["Items"]
+        self.assertEqual((items.value_array, items.value_string, items.confidence), (["i1", "i2", "i3", "i4"], None, 0.6))
+
+    def test_sin_items(self):
+        items = merge_di_results([self._rango(None, [])]).documents[0].fields["Items"]
+
+        self.assertEqual((items.value_array, items.confidence), ([], None))
+
+
+class ClasificadorTests(TestCase):
+    # las reglas base de la migración: "iva" (prioridad 10) → impuesto, "total" (20) → resumen
+
+    def setUp(self):
+        clasificador.invalidate_cache()
+
+    def test_gana_la_prioridad_y_no_la_posicion(self):
+        reglas = [(r"\bb\b", "primera"), (r"\ba\b", "segunda")]
+        for forzar_de_a_una in (False, True):
+            # una regla con referencia a grupo no puede ir en la unión: todo se evalúa de a una
+            extra = [(r"(z)\1", "otra")] if forzar_de_a_una else []
+            clasificar = clasificador._compile(reglas + extra)
+            self.assertEqual(clasificar.__name__, "de_a_una" if forzar_de_a_una else "por_union")
+            self.assertEqual(
+                [clasificar(t) for t in ("a b", "a", "b a", "c")],
+                ["primera", "segunda", "primera", None],
+            )
+
+    def test_reglas_base(self):
+        self.assertEqual(
+            clasificador.clasificar_items(["Total IVA 21%", "Coca Cola Totalmente", "SUBTOTAL", "Percepción IIBB", ""]),
+            ["impuesto", "producto", "resumen", "impuesto", "producto"],
+        )
+
+    def test_las_reglas_del_proveedor_van_primero(self):
+        proveedor = Proveedor.objects.create(nombre="Distribuidora Norte", id_fiscal="30-71234567-9")
+        ReglaClasificacion.objects.create(patron="total", tipo_item="producto", proveedor=proveedor, prioridad=100)
+
+        self.assertEqual(
+            clasificador.clasificar_items(["Total IVA 21%", "IVA 21%"], cuit="30712345679"),
+            ["producto", "impuesto"],
+        )
+        self.assertEqual(clasificador.clasificar_items(["Total IVA 21%"]), ["impuesto"])
+
+
+class PlantillaConfianzaTests(TestCase):
+    REGEX_ITEM = r"^(?P<description>.+?)\s+(?P<quantity>{num})\s+(?P<unit_price>{num})\s+(?P<amount>{num})$"
+    TEXTO = (
+        "Razón Social: DISTRIBUIDORA NORTE SRL   CUIT: 30712345678\n"
+        "Coca Cola 1.5L   12,00   1.500,00   18.000,00\n"
+        "Importe Total: $ 18.000,00\n"
+    )
+
+    def test_validar_rechaza_campos_de_confianza(self):
+        errores = pdf_text.validar_plantilla(
+            self.REGEX_ITEM, campos={"vendor_name": r"Social: (.+?)\s{2}", "vendor_name_confidence": r"(\d+)"},
+        )
+
+        self.assertEqual(list(errores), ["campos"])
+        self.assertIn("vendor_name_confidence", errores["campos"])
+        self.assertNotIn("vendor_name:", errores["campos"])
+
+    def test_plantilla_guardada_con_confianza_no_rompe_el_analisis(self):
+        # guardada sin pasar por clean() (p. ej. antes de que existiera la validación)
+        PlantillaFactura.objects.create(
+            nombre="Norte", cuit="30712345678", regex_item=self.REGEX_ITEM,
+            campos={"vendor_name": r"Social: (.+?)\s{2}", "invoice_total_confidence": r"Total: \$ ({num})"},
+        )
+
+        with mock.patch("invoices.services.pdf_text.extract_text", return_value=self.TEXTO):
+            resultado = pdf_text.analyze_local(b"%PDF-")
+
+        header = resultado.mapped.header
+        self.assertEqual(resultado.plantilla, "Norte")
+        self.assertEqual(header.vendor_name, "DISTRIBUIDORA NORTE SRL")
+        self.assertEqual(header.invoice_total_confidence, resultado.confidence)
+        self.assertEqual([it.amount for it in resultado.mapped.items], [18000.0])
+
+
+class FacturaEnSesionTests(SimpleTestCase):
+    def _factura(self, **header):
+        return MappedInvoice(
+            header=MappedHeader(
+                vendor_name="Distribuidora Norte", vendor_name_confidence=0.93, vendor_tax_id="30-71234567-9",
+                invoice_id="0003-00001234", invoice_date="2025-08-14", invoice_total=45980.0, **header,
+            ),
+            items=[
+                MappedItem(description="Coca Cola 1.5L", quantity=12.0, unit_price=1500.0, amount=18000.0,
+                           product_code="CC15", confidence=0.8),
+                MappedItem(description="IVA 21%", amount=7980.0, tipo_item="impuesto"),
+            ],
+            source="pdf_text",
+            confidence=0.8,
+        )
+
+    def test_ida_y_vuelta(self):
+        factura = self._factura()
+
+        # la sesión se guarda como JSON
+        data = json.loads(json.dumps(factura.to_session()))
+
+        self.assertEqual(MappedInvoice.from_session(data), factura)
+        # posicional: sin los nombres de campo de cada ítem
+        self.assertEqual(len(data["i"][0]), len(dc_fields(MappedItem)))
+
+    def test_decimales_y_fechas(self):
+        factura = self._factura(subtotal=Decimal("38000.50"), due_date=date(2025, 8, 24))
+
+        vuelta = MappedInvoice.from_session(json.loads(json.dumps(factura.to_session())))
+
+        self.assertEqual((vuelta.header.subtotal, vuelta.header.due_date), (38000.5, "2025-08-24"))
+
+    def test_sin_datos_o_de_otra_version(self):
+        data = self._factura().to_session()
+        data["v"] += 1
+
+        for vieja in (None, {}, data, {"header": {}, "items": []}):
+            self.assertIsNone(MappedInvoice.from_session(vieja))
+
+
+class BusquedaItemsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.norte = Proveedor.objects.create(nombre="Distribuidora Norte")
+        cls.sur = Proveedor.objects.create(nombre="Bebidas Sur")
+        lineas = {
+            "coca": (cls.norte, [("Coca Cola 1.5L", "CC15"), ("IVA 21%", None)]),
+            "coca_larga": (cls.norte, [("Gaseosa Coca Cola Zero 2.25L retornable pack x6 botella", "CCZ225")]),
+            "coca_sur": (cls.sur, [("Coca Cola 1.5L", None)]),
+            "fernet": (cls.sur, [("Fernet Branca 750ml", "FB750"), ("Café molido 1kg", "CAF1")]),
+        }
+        cls.facturas = {}
+        for nombre, (proveedor, items) in lineas.items():
+            factura = cls.facturas[nombre] = Factura.objects.create(proveedor=proveedor, fecha=date(2025, 3, 1))
+            for descripcion, codigo in items:
+                ItemFactura.objects.create(factura=factura, descripcion=descripcion, codigo_producto=codigo)
+
+    def _buscar(self, q, qs=None):
+        qs, ranked = search.filter_by_items(qs if qs is not None else Factura.objects.all(), q)
+        return ranked, sorted(self._nombres(qs))
+
+    def _nombres(self, facturas):
+        ids = {f.pk: n for n, f in self.facturas.items()}
+        return [ids[f.pk] for f in facturas]
+
+    def test_prefijos_sin_acentos_y_codigos(self):
+        self.assertTrue(search.fts_available())
+        casos = {
+            "coca 1.5": ["coca", "coca_sur"],
+            "COCA": ["coca", "coca_larga", "coca_sur"],
+            "cafe": ["fernet"],
+            "ferne bran": ["fernet"],
+            "cc1": ["coca"],
+            "coca fernet": [],
+            '"coca" OR fernet*': [],  # sin operadores FTS del usuario: son palabras
+        }
+        for q, esperadas in casos.items():
+            self.assertEqual(self._buscar(q), (True, esperadas), q)
+
+    def test_con_los_demas_filtros(self):
+        self.assertEqual(self._buscar("coca", Factura.objects.filter(proveedor=self.sur)), (True, ["coca_sur"]))
+
+    def test_orden_por_relevancia(self):
+        qs, _ = search.filter_by_items(Factura.objects.all(), "coca cola")
+        keys = [OrderKey("item_rank"), OrderKey("fecha", descending=True, nullable=True),
+                OrderKey("id", descending=True)]
+
+        primera = paginate_keyset(qs, keys, per_page=2)
+        segunda = paginate_keyset(qs, keys, cursor=primera.next_cursor, per_page=2)
+
+        ranks = [f.item_rank for f in list(primera) + list(segunda)]
+        self.assertEqual(ranks, sorted(ranks))
+        # la descripción corta es más relevante que la larga
+        self.assertEqual(self._nombres(segunda), ["coca_larga"])
+
+    def test_sin_indice_usa_icontains(self):
+        with mock.patch("invoices.services.search.fts_available", return_value=False):
+            self.assertEqual(self._buscar("Coca Cola 1.5"), (False, ["coca", "coca_sur"]))
+
+    def test_listado(self):
+        self.client.force_login(User.objects.create_user("cajero", password="x"))
+
+        response = self.client.get(reverse("list_invoices"), {"item": "coca", "supplier": "norte"})
+
+        self.assertTrue(response.context["item_ranked"])
+        self.assertEqual(self._nombres(response.context["page_obj"]), ["coca", "coca_larga"])
+
+
+@override_settings(AZURE_STORAGE_ACCOUNT="cuenta", AZURE_STORAGE_KEY=base64.b64encode(b"k" * 32).decode(),
+                   AZURE_SAS_MINUTES=15, AZURE_SAS_REFRESH_SECONDS=120, AZURE_SAS_CACHE_MAX=4)
+class SasTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(azure_blob._sas_cache, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reutiliza_el_sas_mientras_este_vigente(self):
+        url, vence = azure_blob.get_sas("facturas", "a.pdf")
+
+        self.assertTrue(url.startswith("https://cuenta.blob.core.windows.net/facturas/a.pdf?"))
+        self.assertIn("rscc=private", url)  # el navegador cachea el documento mientras dure el SAS
+        self.assertEqual(azure_blob.get_sas("facturas", "a.pdf"), (url, vence))
+        self.assertNotEqual(azure_blob.get_sas("facturas", "b.pdf")[0], url)
+
+    def test_renueva_cerca_del_vencimiento(self):
+        url, _ = azure_blob.get_sas("facturas", "a.pdf")
+        por_vencer = timezone.now() + timedelta(seconds=60)  # dentro del margen de 120 s
+        azure_blob._sas_cache[("facturas", "a.pdf")] = (url, por_vencer)
+
+        _, vence = azure_blob.get_sas("facturas", "a.pdf")
+
+        self.assertGreater(vence, timezone.now() + timedelta(minutes=14))
+
+    def test_cache_acotado(self):
+        vencido = timezone.now() - timedelta(seconds=1)
+        azure_blob._sas_cache[("facturas", "viejo.pdf")] = ("url", vencido)
+        for n in range(10):
+            azure_blob.get_sas("facturas", f"{n}.pdf")
+
+        self.assertLessEqual(len(azure_blob._sas_cache), 4)
+        self.assertNotIn(("facturas", "viejo.pdf"), azure_blob._sas_cache)
+        self.assertIn(("facturas", "9.pdf"), azure_blob._sas_cache)
+
+    @override_settings(AZURE_STORAGE_KEY=None)
+    def test_sin_credenciales(self):
+        self.assertIsNone(azure_blob.get_sas("facturas", "a.pdf"))
+
+    def test_ver_original_redirige_con_cache(self):
+        proveedor = Proveedor.objects.create(nombre="Distribuidora Norte")
+        blob = f"{settings.AZURE_BLOB_CONTAINER}/factura_1a2b3c4d.pdf"
+        factura = Factura.objects.create(proveedor=proveedor, url_blob=f"https://cuenta.blob.core.windows.net/{blob}")
+        self.client.force_login(User.objects.create_user("cajero", password="x"))
+
+        url = reverse("invoice_view_original", args=[factura.pk])
+        primera, segunda = self.client.get(url), self.client.get(url)
+
+        self.assertEqual(primera.status_code, 302)
+        self.assertTrue(primera["Location"].startswith(f"https://cuenta.blob.core.windows.net/{blob}?"))
+        self.assertEqual(primera["Location"], segunda["Location"])
+        max_age = int(primera["Cache-Control"].rsplit("=", 1)[1])
+        self.assertTrue(15 * 60 - 120 - 5 <= max_age <= 15 * 60 - 120, max_age)
+
+
+class AnalisisAsyncTests(SimpleTestCase):
+    def test_muchos_documentos_en_orden_con_concurrencia_acotada(self):
+        en_vuelo = maximo = 0
+
+        async def analizar(data, blob_url, **kwargs):
+            nonlocal en_vuelo, maximo
+            en_vuelo += 1
+            maximo = max(maximo, en_vuelo)
+            await asyncio.sleep(0.01)
+            en_vuelo -= 1
+            if data == b"roto":
+                raise ValueError("PDF ilegible")
+            return data.decode()
+
+        documentos = [(b"a", "u1"), (b"roto", "u2"), (b"c", "u3"), (b"d", "u4"), (b"e", "u5")]
+        with mock.patch.object(azure_di_async, "analyze_invoice_auto_async", analizar):
+            results = asyncio.run(azure_di_async.analyze_many_async(documentos, concurrency=2))
+
+        self.assertEqual(maximo, 2)
+        self.assertEqual([r if isinstance(r, str) else type(r) for r in results], ["a", ValueError, "c", "d", "e"])
+
+    def test_simulacion(self):
+        results = asyncio.run(azure_di_async.analyze_many_async([(b"%PDF-1", ""), (b"%PDF-2", "")]))
+
+        self.assertTrue(all(r.documents[0].fields["Items"].value_array for r in results))
+
+    def test_timeout_abandona_el_polling(self):
+        async def begin_analyze_document(model_id, body, polling_interval):
+            return SimpleNamespace(result=lambda: asyncio.sleep(60))
+
+        cliente = SimpleNamespace(begin_analyze_document=begin_analyze_document)
+        with mock.patch.object(azure_di_async, "_di_client_async", mock.AsyncMock(return_value=cliente)):
+            inicio = time.monotonic()
+            with self.assertRaises(asyncio.TimeoutError):
+                asyncio.run(azure_di_async._analyze_async(b"pdf", polling_interval=None, timeout=0.05))
+
+        self.assertLess(time.monotonic() - inicio, 5)
+
+    @override_settings(AZ_DOCINT_ENDPOINT="https://di.example.com/", AZ_DOCINT_KEY="clave")
+    def test_un_cliente_por_loop(self):
+        async def clientes():
+            primero, mismo = await azure_di_async._di_client_async(), await azure_di_async._di_client_async()
+            _, sesion = azure_di_async._clients[asyncio.get_running_loop()]
+            await azure_di_async.close_async_clients()
+            return primero, mismo, sesion
+
+        primero, mismo, sesion = asyncio.run(clientes())
+        segundo, _, _ = asyncio.run(clientes())
+
+        self.assertIs(primero, mismo)
+        self.assertIsNot(primero, segundo)
+        self.assertTrue(sesion.closed)
+
+    @override_settings(AZ_DOCINT_ENDPOINT=None)
+    def test_sin_credenciales(self):
+        with self.assertRaisesMessage(RuntimeError, "AZ_DOCINT_ENDPOINT"):
+            asyncio.run(azure_di_async._di_client_async())
+
+
+class ContenedorBlobTests(SimpleTestCase):
+    def setUp(self):
+        for patcher in (
+            mock.patch.object(azure_blob, "_containers_ready", set()),
+            # sin reintentos: el regulador se prueba en GovernorTests
+            mock.patch.object(azure_blob, "get_governor", return_value=SimpleNamespace(call=lambda fn, *a: fn(*a))),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _svc(self, *errores):
+        svc = mock.Mock()
+        svc.create_container.side_effect = list(errores) or None
+        return mock.patch.object(azure_blob, "_svc", return_value=svc), svc
+
+    def test_se_verifica_una_sola_vez(self):
+        patch, svc = self._svc(None, None)
+        with patch:
+            azure_blob.ensure_container("facturas")
+            azure_blob.ensure_container("facturas")
+
+        svc.create_container.assert_called_once_with("facturas")
+
+    def test_existente_o_sin_permiso_queda_memorizado(self):
+        patch, svc = self._svc(ResourceExistsError("existe"), _http_error(403))
+        with patch:
+            for nombre in ("facturas", "facturas", "logos", "logos"):
+                azure_blob.ensure_container(nombre)
+
+        self.assertEqual(svc.create_container.call_count, 2)
+        self.assertEqual(azure_blob._containers_ready, {"facturas", "logos"})
+
+    def test_error_transitorio_se_reintenta_en_la_proxima_llamada(self):
+        patch, svc = self._svc(_http_error(503), None)
+        with patch:
+            azure_blob.ensure_container("facturas")
+            azure_blob.ensure_container("facturas")
+            azure_blob.ensure_container("facturas")
+
+        self.assertEqual(svc.create_container.call_count, 2)
+
+    def test_sesion_http_compartida(self):
+        with mock.patch.object(azure_http, "_session", None), override_settings(AZURE_HTTP_POOL_SIZE=3):
+            sesion = azure_http.shared_session()
+            transporte = azure_http.shared_transport()
+
+            self.assertIs(azure_http.shared_session(), sesion)
+            self.assertIs(transporte.session, sesion)
+            self.assertFalse(transporte._session_owner)  # cerrar un cliente no cierra el pool
+            self.assertEqual(sesion.get_adapter("https://x")._pool_maxsize, 3)
+
+
+class ExportacionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        norte = Proveedor.objects.create(nombre="Distribuidora Norte", id_fiscal="30712345679")
+        sur = Proveedor.objects.create(nombre="Bebidas Sur")
+        with embeddings_suspendidos():
+            coca = Producto.objects.create(nombre="Coca Cola 1.5L")
+        with rollups.resumenes_suspendidos():
+            for proveedor, numero, fecha in ((norte, "1", date(2025, 3, 1)), (norte, "2", date(2025, 4, 1)),
+                                             (sur, "3", date(2025, 3, 15))):
+                factura = Factura.objects.create(proveedor=proveedor, numero=numero, fecha=fecha, total=Decimal("121"))
+                ItemFactura.objects.create(factura=factura, producto=coca, descripcion="Coca Cola", cantidad=1,
+                                           importe=100)
+                ItemFactura.objects.create(factura=factura, descripcion="IVA 21% ñ", importe=21, tipo_item="impuesto")
+        cls.user = User.objects.create_user("cajero", password="x")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def _get(self, **params):
+        response = self.client.get(reverse("export_invoices"), params)
+        return response, b"".join(response.streaming_content)
+
+    def test_csv_cabeceras_con_los_filtros_del_listado(self):
+        response, contenido = self._get(supplier="norte")
+
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertTrue(contenido.startswith("\ufeff".encode("utf-8")))
+        filas = list(csv.reader(io.StringIO(contenido.decode("utf-8-sig"))))
+        self.assertEqual(filas[0], [t for t, _ in export.HEADER_COLUMNS])
+        self.assertEqual([(f[1], f[5], f[6]) for f in filas[1:]],
+                         [("Distribuidora Norte", "2", "2025-04-01"), ("Distribuidora Norte", "1", "2025-03-01")])
+
+    def test_csv_detalle_en_bloques(self):
+        with mock.patch.object(export, "CSV_BLOCK_ROWS", 2):
+            response = self.client.get(reverse("export_invoices"), {"detalle": "1"})
+            bloques = list(response.streaming_content)
+
+        self.assertEqual(len(bloques), 4)  # 6 ítems de a 2 + el último bloque vacío
+        filas = list(csv.reader(io.StringIO(b"".join(bloques).decode("utf-8-sig"))))
+        self.assertEqual(len(filas), 7)
+        self.assertEqual([(f[5], f[-6], f[-5]) for f in filas[1:3]], [("2", "Coca Cola", "Coca Cola 1.5L"),
+                                                                      ("2", "IVA 21% ñ", "")])
+
+    def test_xlsx_sigue_en_otra_hoja(self):
+        import openpyxl
+
+        with mock.patch.object(export, "XLSX_MAX_ROWS", 3):
+            response, contenido = self._get(formato="xlsx", detalle="1")
+
+        self.assertTrue(response["Content-Disposition"].startswith("attachment; filename=\"facturas_items_"))
+        libro = openpyxl.load_workbook(io.BytesIO(contenido), read_only=True)
+        hojas = [list(hoja.values) for hoja in libro.worksheets]
+        self.assertEqual([len(h) for h in hojas], [3, 3, 3])
+        self.assertTrue(all(h[0][0] == "Id" for h in hojas))
+        self.assertEqual(sum(1 for h in hojas for fila in h[1:] if fila[-1] == 21), 3)
+
+    def test_xlsx_sin_xlsxwriter_exporta_csv(self):
+        with mock.patch.object(export, "xlsxwriter", None):
+            response, contenido = self._get(formato="xlsx")
+
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertEqual(len(contenido.decode("utf-8-sig").splitlines()), 4)
+
+
+@override_settings(DI_SIM_LINES_MIN=2, DI_SIM_LINES_MAX=5, DI_SIM_SUPPLIERS=3, DI_SIM_CONFIDENCE_MIN=0.7,
+                   DI_SIM_CONFIDENCE_MAX=0.8, DI_SIM_LATENCY_MS=0, DI_SIM_ERROR_RATE=0)
+class SimuladorDITests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(di_simulator, "_rng", None)  # la secuencia se arma de nuevo en cada test
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_factura_coherente(self):
+        for seed in range(20):
+            factura = map_invoice_result(di_simulator.build_invoice(seed))
+            productos = [it for it in factura.items if it.tipo_item == "producto"]
+            confianzas = [it.confidence for it in factura.items] + [factura.header.vendor_name_confidence]
+
+            self.assertTrue(2 <= len(productos) <= 5, seed)
+            self.assertAlmostEqual(sum(it.amount for it in productos), factura.header.subtotal, places=2)
+            self.assertAlmostEqual(factura.header.subtotal + factura.header.total_tax,
+                                   factura.header.invoice_total, places=2)
+            self.assertTrue(all(0.7 <= c <= 0.8 for c in confianzas), seed)
+
+    def test_misma_semilla_misma_factura(self):
+        self.assertEqual(map_invoice_result(di_simulator.build_invoice(42)),
+                         map_invoice_result(di_simulator.build_invoice(42)))
+        proveedores = {map_invoice_result(di_simulator.build_invoice(s)).header.vendor_tax_id for s in range(50)}
+        self.assertLessEqual(len(proveedores), 3)
+
+    @override_settings(DI_SIM_SEED="7")
+    def test_secuencia_reproducible(self):
+        primera = [map_invoice_result(di_simulator.analyze()) for _ in range(3)]
+        di_simulator._rng = None
+
+        segunda = [map_invoice_result(asyncio.run(di_simulator.analyze_async())) for _ in range(3)]
+
+        self.assertEqual(primera, segunda)
+        self.assertNotEqual(primera[0], primera[1])
+
+    @override_settings(DI_SIM_ERROR_RATE=1, DI_SIM_ERROR_STATUS="429")
+    def test_errores_simulados_se_reintentan(self):
+        with self.assertRaises(di_simulator.SimulatedDIError) as ctx:
+            di_simulator.analyze()
+
+        self.assertEqual((ctx.exception.status_code, ctx.exception.retry_after), (429, 1.0))
+        self.assertTrue(governor._is_retryable(ctx.exception))
+
+
+def _imagen(ancho, alto, modo="RGB", formato="PNG", ruido=True):
+    img = Image.effect_noise((ancho, alto), 80).convert(modo) if ruido else Image.new(modo, (ancho, alto), "white")
+    out = io.BytesIO()
+    img.save(out, format=formato)
+    return out.getvalue()
+
+
+def _pdf(*paginas):
+    """PDF con una página por imagen (True = con contenido, False = en blanco)."""
+    imagenes = [
+        Image.effect_noise((200, 280), 80).convert("RGB") if contenido else Image.new("RGB", (200, 280), "white")
+        for contenido in paginas
+    ]
+    out = io.BytesIO()
+    imagenes[0].save(out, format="PDF", save_all=True, append_images=imagenes[1:])
+    return out.getvalue()
+
+
+@override_settings(DI_PREPROCESS_MAX_SIDE_PX=500, DI_PREPROCESS_MIN_BYTES=10_000)
+class PreprocesadoTests(SimpleTestCase):
+    def test_reduce_imagenes_grandes_a_jpeg(self):
+        original = _imagen(1200, 900)
+
+        result = preprocess.optimize_for_analysis(original, "image/png")
+
+        self.assertTrue(result.changed)
+        self.assertEqual(result.content_type, "image/jpeg")
+        self.assertEqual(Image.open(io.BytesIO(result.data)).size, (500, 375))
+        self.assertGreater(result.saved_bytes, 0)
+
+    def test_transparencia_sobre_fondo_blanco(self):
+        result = preprocess.optimize_for_analysis(_imagen(1200, 900, modo="RGBA"), "image/png")
+
+        self.assertEqual(Image.open(io.BytesIO(result.data)).mode, "RGB")
+
+    def test_imagen_chica_o_archivo_desconocido_queda_igual(self):
+        chica = _imagen(40, 30)
+        for data, content_type in ((chica, "image/png"), (b"no es una imagen" * 1000, "image/heic")):
+            result = preprocess.optimize_for_analysis(data, content_type)
+            self.assertFalse(result.changed)
+            self.assertEqual((result.data, result.content_type), (data, content_type))
+
+    def test_quita_paginas_en_blanco_del_pdf(self):
+        import pypdf
+
+        result = preprocess.optimize_for_analysis(_pdf(True, False, True, False), "application/pdf")
+
+        self.assertEqual(result.pages_dropped, 2)
+        self.assertEqual(len(pypdf.PdfReader(io.BytesIO(result.data)).pages), 2)
+
+    def test_pdf_sin_paginas_en_blanco_o_todo_en_blanco_queda_igual(self):
+        for paginas in ((True, True), (False, False)):
+            data = _pdf(*paginas)
+            result = preprocess.optimize_for_analysis(data, "application/pdf")
+            self.assertFalse(result.changed)
+            self.assertEqual(result.data, data)
+
+    def test_pdf_roto_se_analiza_el_original(self):
+        data = b"%PDF-1.7 roto"
+
+        result = preprocess.optimize_for_analysis(data, "application/pdf")
+
+        self.assertFalse(result.changed)
+        self.assertEqual(result.data, data)
@@ -1,24 +1,31 @@
+import re
+import time
 from datetime import date, datetime
 from decimal import Decimal, InvalidOperation
 
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
 from django.contrib import messages
 from django.db import transaction
-from django.db.models import Q
+from django.db.models import Q, Sum
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.utils import timezone
 from django.utils.dateparse import parse_date
 from django.utils.http import urlencode
 
 from .forms import UploadInvoiceForm, PreviewInvoiceForm
-from .models import Factura, ItemFactura, TipoComprobante
+from .models import Factura, ItemFactura, ResumenProductoMes, ResumenProveedorMes, TipoComprobante
 from productos.models import Producto
+from productos.services import codigos
 from proveedores.models import Proveedor 
-from .services import azure_blob
+from .services import export, precios, rollups, search, storage
 from .services.azure_blob import normalize_filename
 from .services.azure_di import analyze_invoice_auto, debug_invoice_fields
-from .services.mapping import map_invoice_result
+from .services.mapping import MappedInvoice, map_invoice_result
+from .services.pagination import OrderKey, paginate_keyset
+from .services.pdf_text import analyze_local
+from .services.preprocess import optimize_for_analysis, record_analysis
 from .services.ia_helper import get_ia_helper
 def _d(s):  # parsea ISO a date o None
     if not s:
@@ -27,18 +34,6 @@ def _d(s):  # parsea ISO a date o None
         return s
     return parse_date(str(s))
 
-# Conversión a tipos seguros para JSON (floats y strings)
-def convert_to_json_safe(obj):
-    if isinstance(obj, dict):
-        return {k: convert_to_json_safe(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_to_json_safe(v) for v in obj]
-    elif isinstance(obj, Decimal):
-        return float(obj)
-    elif isinstance(obj, (date, datetime)):
-        return obj.isoformat()
-    return obj
-
             
 @login_required
 def upload_invoice(request):
@@ -56,37 +51,66 @@ def upload_invoice(request):
             filename = upfile.name
             content_type = getattr(upfile, "content_type", "application/octet-stream")
 
-            # 1) Subir a Blob (conservar original)
+            # 1) Subir al storage (conservar original)
             try:
                 
                 safe_filename = normalize_filename(filename)
 
-                blob_url = azure_blob.upload_bytes(
-                    settings.AZURE_BLOB_CONTAINER, data, safe_filename, content_type
-                )
+                upfile.seek(0)
+                blob_url = storage.get_storage().upload_stream(upfile, safe_filename, content_type)
             except Exception as ex:
                 return render(request, "invoices/preview.html", {
                     "error": f"Upload a Blob falló: {ex}",
                 })
 
-            # 2) Analizar con DI (automático: SAS preferente + fallback a bytes)
-            try:
-                di_result = analyze_invoice_auto(data, blob_url)
-                # opcional para inspección en consola
-                debug_invoice_fields(di_result)
-            except Exception as ex:
-                return render(request, "invoices/preview.html", {
-                    "error": f"Análisis falló: {ex}",
-                    "blob_url": blob_url
-                })
-
-            # 2.5) Mapear a estructura liviana (solo tipos JSON-friendly)
-            mapped = map_invoice_result(di_result)
-            mapped_safe = convert_to_json_safe(mapped)
-
-            # Guardar resultados en sesión (modo simulación o Azure indistinto)
+            # 2) PDFs digitales (con capa de texto): lectura local sin DI si la confianza alcanza
+            mapped = None
+            if getattr(settings, "PDF_TEXT_ENABLED", True):
+                try:
+                    local = analyze_local(data)
+                except Exception as ex:  # ej. plantilla con una regex que no compila o sin sus grupos
+                    print(f"⚠️ Falló la lectura local ({ex}) → DI")
+                    local = None
+                if local:
+                    min_conf = float(getattr(settings, "PDF_TEXT_MIN_CONFIDENCE", 0.85))
+                    if local.confidence >= min_conf:
+                        print(f"📄 Lectura local ({local.plantilla}): confianza {local.confidence:.2f}, "
+                              f"{len(local.mapped.items)} ítems → se omite DI")
+                        mapped = local.mapped
+                    else:
+                        print(f"📄 Lectura local insuficiente ({local.confidence:.2f} < {min_conf:.2f}): "
+                              f"{'; '.join(local.motivos)} → DI")
+
+            # 3) Analizar con DI (automático: SAS preferente + fallback a bytes)
+            if mapped is None:
+                try:
+                    # opcional: achicar fotos / quitar páginas en blanco (el original ya quedó archivado)
+                    prep = None
+                    if getattr(settings, "DI_PREPROCESS_ENABLED", False):
+                        prep = optimize_for_analysis(data, content_type)
+
+                    t0 = time.perf_counter()
+                    if prep and prep.changed:
+                        # se analiza el contenido optimizado → bytes, no el SAS del original
+                        di_result = analyze_invoice_auto(prep.data, None)
+                    else:
+                        di_result = analyze_invoice_auto(data, blob_url)
+                    if prep:
+                        record_analysis(prep, time.perf_counter() - t0)
+                    # opcional para inspección en consola
+                    debug_invoice_fields(di_result)
+                except Exception as ex:
+                    return render(request, "invoices/preview.html", {
+                        "error": f"Análisis falló: {ex}",
+                        "blob_url": blob_url
+                    })
+
+                # 3.5) Mapear a la representación tipada (MappedInvoice)
+                mapped = map_invoice_result(di_result)
+
+            # Guardar resultados en sesión (forma compacta; modo simulación o Azure indistinto)
             request.session["preview_blob_url"] = blob_url
-            request.session["preview_data"] = mapped_safe
+            request.session["preview_data"] = mapped.to_session()
 
             return redirect("preview_invoice")
 
@@ -108,7 +132,7 @@ def preview_invoice(request):
       - Confirmación manual si algún producto no fue identificado
     """
     blob_url = request.session.get("preview_blob_url")
-    mapped = request.session.get("preview_data")
+    mapped = MappedInvoice.from_session(request.session.get("preview_data"))
 
     # Si no hay datos cargados → vuelve a la pantalla de carga
     if not mapped:
@@ -116,19 +140,20 @@ def preview_invoice(request):
             "error": "No hay resultados para mostrar. Subí una factura nuevamente.",
         })
 
-    header = mapped.get("header", {}) or {}
-    items = mapped.get("items", []) or []
+    header = mapped.header
+    items = mapped.items
 
     # Diccionario de avisos para la vista
     avisos = {
         "proveedor_nuevo": False,
         "factura_duplicada": False,
         "productos_sin_match": [],  # [(idx, descripción)]
+        "precios_anomalos": [],     # descripciones con precio fuera de lo habitual
     }
 
     # --- 1️⃣ Validar proveedor ---
-    prov_name = (header.get("vendor_name") or "").strip()
-    prov_cuit = (header.get("vendor_tax_id") or "").replace("-", "").strip()
+    prov_name = (header.vendor_name or "").strip()
+    prov_cuit = header.cuit_normalizado
 
     proveedor = Proveedor.objects.filter(
         Q(nombre__iexact=prov_name) | Q(id_fiscal__iexact=prov_cuit)
@@ -137,9 +162,9 @@ def preview_invoice(request):
         avisos["proveedor_nuevo"] = True
 
     # --- 2️⃣ Validar duplicado con los datos del OCR (solo informativo, no bloqueante aún) ---
-    tipo_codigo = header.get("tipo_comprobante")
-    pto_vta = (header.get("punto_venta") or "").zfill(4)
-    nro = header.get("invoice_id") or header.get("numero")
+    tipo_codigo = header.tipo_comprobante
+    pto_vta = header.punto_venta_normalizado
+    nro = header.invoice_id
 
     tipo_comprobante = None
     if tipo_codigo:
@@ -158,17 +183,26 @@ def preview_invoice(request):
     productos_existentes = Producto.objects.filter(activo=True).order_by("nombre")
     auto_products = []
     ia = get_ia_helper()
-    
-    for it in items:
-        desc = (it.get("description") or "").strip()
-        code = (it.get("product_code") or "").strip()
+
+    # códigos de toda la factura de una vez: primero los del proveedor (una consulta),
+    # después el índice en memoria (interno, proveedor o barras)
+    codigos_factura = [it.product_code for it in items]
+    ids_por_codigo = [
+        pid_prov or pid
+        for pid_prov, pid in zip(
+            codigos.resolver_proveedor(proveedor.id if proveedor else None, codigos_factura),
+            codigos.resolver(codigos_factura),
+        )
+    ]
+    por_codigo = Producto.objects.in_bulk([pid for pid in ids_por_codigo if pid])
+
+    for it, pid_codigo in zip(items, ids_por_codigo):
+        desc = (it.description or "").strip()
 
         prod = None
-        #intentar por cód interno o proveedor (exacto)
-        if code:
-            prod = Producto.objects.filter(
-                Q(codigo_interno__iexact=code) | Q(codigo_proveedor__iexact=code)
-            ).first()
+        #intentar por código (del proveedor, interno o de barras; normalizado)
+        if pid_codigo:
+            prod = por_codigo.get(pid_codigo)
 
         #intentar por nombre (exacto)
         if not prod and desc:
@@ -188,6 +222,15 @@ def preview_invoice(request):
             auto_products.append(None)
             avisos["productos_sin_match"].append(desc)
 
+    # --- 3️⃣b Precios fuera de lo habitual (una consulta para toda la factura) ---
+    alertas_precio = precios.evaluar(
+        items, [pid if it.tipo_item == "producto" else None for it, pid in zip(items, auto_products)]
+    )
+    for it, alerta in zip(items, alertas_precio):
+        if alerta:
+            avisos["precios_anomalos"].append(it.description)
+            print(f"💲 Precio inusual en '{it.description}': {alerta['desvio_pct']}% vs mediana {alerta['mediana']}")
+
     # --- 4️⃣ Procesar envío del formulario (POST) ---
     if request.method == "POST":
         form = PreviewInvoiceForm(request.POST)
@@ -202,27 +245,25 @@ def preview_invoice(request):
 
         if form.is_valid():
             # Actualiza los valores de cabecera editados por el usuario
-            header["vendor_name"] = form.cleaned_data["proveedor"]
-            header["invoice_id"] = form.cleaned_data["numero"]
-            header["invoice_date"] = (
+            header.vendor_name = form.cleaned_data["proveedor"]
+            header.invoice_id = form.cleaned_data["numero"]
+            header.invoice_date = (
                 form.cleaned_data["fecha"].isoformat() if form.cleaned_data["fecha"] else None
             )
-            header["subtotal"] = form.cleaned_data["subtotal"]
-            header["total_tax"] = form.cleaned_data["total_impuestos"]
-            header["invoice_total"] = form.cleaned_data["total"]
-
-            # Guarda el mapeo actualizado en sesión (en formato JSON-safe)
-            mapped["header"] = header
-            mapped_safe = convert_to_json_safe(mapped)
-            request.session["preview_data"] = mapped_safe
+            header.subtotal = form.cleaned_data["subtotal"]
+            header.total_tax = form.cleaned_data["total_impuestos"]
+            header.invoice_total = form.cleaned_data["total"]
+
+            # Guarda el mapeo actualizado en sesión
+            request.session["preview_data"] = mapped.to_session()
             
             # revalidar duplicado con los datos actualizados del formulario
-            tipo_codigo = header.get("tipo_comprobante")
-            pto_vta = (header.get("punto_venta") or "").zfill(4)
-            nro = header.get("invoice_id") or header.get("numero")
+            tipo_codigo = header.tipo_comprobante
+            pto_vta = header.punto_venta_normalizado
+            nro = header.invoice_id
             
-            prov_name = (header.get("vendor_name") or "").strip()
-            prov_cuit = (header.get("vendor_tax_id") or "").replace("-", "").strip()
+            prov_name = (header.vendor_name or "").strip()
+            prov_cuit = header.cuit_normalizado
             
             print("=== REVALIDANDO DUPLICADO CON DATOS ACTUALIZADOS ===")
             print("Proveedor:", prov_name)
@@ -255,23 +296,24 @@ def preview_invoice(request):
     else:
         # --- 5️⃣ Inicializa el formulario en modo lectura ---
         form = PreviewInvoiceForm(initial={
-            "proveedor": header.get("vendor_name"),
-            "numero": header.get("invoice_id"),
-            "fecha": header.get("invoice_date"),
-            "subtotal": header.get("subtotal"),
-            "total_impuestos": header.get("total_tax"),
-            "total": header.get("invoice_total"),
+            "proveedor": header.vendor_name,
+            "numero": header.invoice_id,
+            "fecha": header.invoice_date,
+            "subtotal": header.subtotal,
+            "total_impuestos": header.total_tax,
+            "total": header.invoice_total,
         })
 
-    # --- 6️⃣ Combina ítems con su producto (si ya fue reconocido) ---
+    # --- 6️⃣ Combina ítems con su producto (si ya fue reconocido; una sola consulta) ---
+    reconocidos = Producto.objects.in_bulk({pid for pid in auto_products if pid})
     paired_items = []
     for idx, it in enumerate(items):
         prod_id = auto_products[idx]
-        prod_obj = Producto.objects.filter(id=prod_id).first() if prod_id else None
         paired_items.append({
             "data": it,
-            "producto": prod_obj,
+            "producto": reconocidos.get(prod_id) if prod_id else None,
             "index": idx,
+            "alerta_precio": alertas_precio[idx],
         })
 
     # --- 7️⃣ Render final ---
@@ -298,26 +340,26 @@ def confirm_invoice(request):
 
     # Recupera de sesión los datos procesados por Azure o simulación
     blob_url = request.session.get("preview_blob_url")
-    mapped = request.session.get("preview_data")
+    mapped = MappedInvoice.from_session(request.session.get("preview_data"))
 
     # Si no hay datos previos en sesión → redirige a carga
     if not mapped:
         return redirect("upload_invoice")
 
     # Separa cabecera e ítems
-    header = mapped.get("header", {})
-    items = mapped.get("items", [])
+    header = mapped.header
+    items = mapped.items
 
     # --- 1️⃣ Buscar o crear proveedor ---
     proveedor, _ = Proveedor.objects.get_or_create(
-        nombre=header.get("vendor_name") or "SIN PROVEEDOR",
-        id_fiscal=header.get("vendor_tax_id") or None,
+        nombre=header.vendor_name or "SIN PROVEEDOR",
+        id_fiscal=header.vendor_tax_id or None,
     )
 
     # --- 2️⃣ Datos básicos para validar duplicado ---
-    tipo_codigo = header.get("tipo_comprobante")       # ej: "B"
-    pto_vta = (header.get("punto_venta") or "").zfill(4)  # ej: "0002"
-    nro = header.get("invoice_id") or header.get("numero")
+    tipo_codigo = header.tipo_comprobante           # ej: "B"
+    pto_vta = header.punto_venta_normalizado        # ej: "0002"
+    nro = header.invoice_id
 
     print("=== DEBUG FACTURA DUPLICADA ===")
     print("Proveedor:", proveedor.nombre)
@@ -347,22 +389,24 @@ def confirm_invoice(request):
             return redirect("preview_invoice")
 
     # --- 4️⃣ Crear la factura (dentro de una transacción atómica) ---
-    with transaction.atomic():
+    # los resúmenes se suman de una vez en el paso 6, no ítem por ítem desde las señales
+    with transaction.atomic(), rollups.resumenes_suspendidos():
         factura = Factura.objects.create(
             proveedor=proveedor,
             tipo_comprobante=tipo_comprobante,
             punto_venta=pto_vta,
-            numero=header.get("invoice_id") or "SIN NÚMERO",
-            fecha=parse_date(header.get("invoice_date")) if header.get("invoice_date") else None,
-            subtotal=header.get("subtotal") or 0,
-            total_impuestos=header.get("total_tax") or 0,
-            total=header.get("invoice_total") or 0,
+            numero=header.invoice_id or "SIN NÚMERO",
+            fecha=parse_date(header.invoice_date) if header.invoice_date else None,
+            subtotal=header.subtotal or 0,
+            total_impuestos=header.total_tax or 0,
+            total=header.invoice_total or 0,
             url_blob=blob_url,
         )
 
         # --- 5️⃣ Asignar productos a los ítems ---
         selected_products = request.session.get("preview_selected_products", [])
 
+        creados = []
         for idx, it in enumerate(items):
             prod_id = selected_products[idx] if idx < len(selected_products) else None
             try:
@@ -373,23 +417,31 @@ def confirm_invoice(request):
             prod = Producto.objects.filter(id=prod_id).first() if prod_id else None
 
             # Crear ítem de factura (producto, impuesto o resumen)
-            ItemFactura.objects.create(
+            creados.append(ItemFactura.objects.create(
                 factura=factura,
-                producto=prod if it.get("tipo_item") == "producto" else None,
-                descripcion=it.get("description"),
-                cantidad=it.get("quantity") or 0,
-                unidad=it.get("unit"),
-                precio_unitario=it.get("unit_price") or 0,
-                importe=it.get("amount") or 0,
-                codigo_producto=it.get("product_code"),
-                tipo_item=it.get("tipo_item", "producto"),
-            )
+                producto=prod if it.tipo_item == "producto" else None,
+                descripcion=it.description,
+                cantidad=it.quantity or 0,
+                unidad=it.unit,
+                precio_unitario=it.unit_price or 0,
+                importe=it.amount or 0,
+                codigo_producto=it.product_code,
+                tipo_item=it.tipo_item,
+            ))
+
+        # --- 6️⃣ Sumar a los resúmenes mensuales y al historial de precios (misma transacción) ---
+        rollups.aplicar_factura(factura, creados)
+        precios.registrar_factura(factura, creados)
+        codigos.registrar_codigos(
+            factura.proveedor_id,
+            [(it.codigo_producto, it.producto_id) for it in creados if it.tipo_item == "producto"],
+        )
 
-    # --- 6️⃣ Limpieza de sesión (para evitar reenvíos) ---
+    # --- 7️⃣ Limpieza de sesión (para evitar reenvíos) ---
     for key in ["preview_data", "preview_blob_url", "preview_selected_products"]:
         request.session.pop(key, None)
 
-    # --- 7️⃣ Confirmación visual ---
+    # --- 8️⃣ Confirmación visual ---
     messages.success(request, "✅ Factura registrada correctamente.")
     return redirect("invoice_detail", pk=factura.pk)
 
@@ -418,9 +470,11 @@ def _parse_decimal(s):
         return None
 
 
-# --- nuevo: listado ---
-@login_required
-def list_invoices(request):
+def _filtered_invoices(request):
+    """
+    Facturas que corresponden a los filtros del listado (GET).
+    Devuelve (qs, ranked): ranked=True si qs trae item_rank de la búsqueda por ítems.
+    """
     # params de filtro
     supplier_q = (request.GET.get("supplier") or "").strip()
     number_q   = (request.GET.get("number") or "").strip()
@@ -447,55 +501,203 @@ def list_invoices(request):
     if total_max is not None:
         qs = qs.filter(total__lte=total_max)
 
-    # 🔎 búsqueda por ítems (descripción / código)
+    # 🔎 búsqueda por ítems (descripción / código) con índice de texto completo
+    ranked = False
     if item_q:
-        qs = qs.filter(
-            Q(items__descripcion__icontains=item_q) |
-            Q(items__codigo_producto__icontains=item_q)
-        ).distinct()
+        qs, ranked = search.filter_by_items(qs, item_q)
+    return qs, ranked
+
+
+# --- nuevo: listado ---
+@login_required
+def list_invoices(request):
+    qs, ranked = _filtered_invoices(request)
 
-    qs = qs.order_by("-fecha", "-id")
+    # orden: -fecha, -id (con búsqueda por ítems, primero la relevancia)
+    keys = [OrderKey("fecha", descending=True, nullable=True), OrderKey("id", descending=True)]
+    if ranked:
+        keys.insert(0, OrderKey("item_rank"))
 
     # proveedores para selector
     suppliers = Proveedor.objects.order_by("nombre").values_list("nombre", flat=True).distinct()
 
-    # paginación
-    page_number = request.GET.get("page") or 1
-    paginator = Paginator(qs, 15)  # 15 filas por página
-    page_obj = paginator.get_page(page_number)
+    # paginación por cursor (sin OFFSET ni COUNT completo)
+    page_obj = paginate_keyset(
+        qs, keys,
+        cursor=request.GET.get("cursor"),
+        per_page=15,  # 15 filas por página
+        count_cap=getattr(settings, "INVOICE_LIST_COUNT_CAP", 1000),
+    )
 
-    # conservar los parámetros sin "page" para la paginación
-    params_without_page = request.GET.dict()
-    params_without_page.pop("page", None)
-    base_qs = urlencode(params_without_page)
+    # conservar los parámetros sin "cursor" para la paginación
+    params_without_cursor = request.GET.dict()
+    params_without_cursor.pop("cursor", None)
+    params_without_cursor.pop("page", None)
+    base_qs = urlencode(params_without_cursor)
 
     ctx = {
         "page_obj": page_obj,
-        "paginator": paginator,
         "current_params": request.GET,
         "base_qs": f"&{base_qs}" if base_qs else "",
         "suppliers": suppliers,
+        "item_ranked": ranked,
     }
     return render(request, "invoices/list.html", ctx)
 
+# --- exportación (mismos filtros que el listado) ---
+@login_required
+def export_invoices(request):
+    """
+    ?formato=csv|xlsx  &detalle=1 (una fila por ítem)  + los filtros del listado.
+    Las filas se leen y se escriben de a bloques: la memoria no crece con la cantidad.
+    """
+    qs, _ = _filtered_invoices(request)
+    detalle = request.GET.get("detalle") == "1"
+    formato = request.GET.get("formato", "csv")
+    titles, rows = export.export_rows(qs, detalle=detalle)
+    nombre = f"facturas{'_items' if detalle else ''}_{timezone.localdate():%Y%m%d}"
+
+    if formato == "xlsx":
+        if export.xlsx_available():
+            print(f"📤 Exportando XLSX ({'ítems' if detalle else 'cabeceras'})")
+            return FileResponse(
+                export.write_xlsx(titles, rows),
+                as_attachment=True,
+                filename=f"{nombre}.xlsx",
+                content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            )
+        print("⚠️ xlsxwriter no está instalado; se exporta CSV")
+
+    print(f"📤 Exportando CSV ({'ítems' if detalle else 'cabeceras'})")
+    resp = StreamingHttpResponse(export.stream_csv(titles, rows), content_type="text/csv; charset=utf-8")
+    resp["Content-Disposition"] = f'attachment; filename="{nombre}.csv"'
+    return resp
+
+# --- resumen mensual (lee solo las tablas de resúmenes, no recorre facturas) ---
+@login_required
+def spend_dashboard(request):
+    meses = list(
+        ResumenProveedorMes.objects.values_list("mes", flat=True).distinct().order_by("-mes")[:12]
+    )
+    mes = _parse_date(request.GET.get("mes"))
+    mes = mes.replace(day=1) if mes else (meses[0] if meses else timezone.localdate().replace(day=1))
+
+    # evolución de los últimos 12 meses con datos
+    evolucion = (
+        ResumenProveedorMes.objects.filter(mes__in=meses)
+        .values("mes")
+        .annotate(facturas=Sum("facturas"), total=Sum("total"))
+        .order_by("mes")
+    )
+    del_mes = ResumenProveedorMes.objects.filter(mes=mes).aggregate(
+        facturas=Sum("facturas"), subtotal=Sum("subtotal"),
+        total_impuestos=Sum("total_impuestos"), total=Sum("total"),
+    )
+
+    ctx = {
+        "mes": mes,
+        "meses": meses,
+        "totales": del_mes,
+        "evolucion": evolucion,
+        "top_proveedores": ResumenProveedorMes.objects.filter(mes=mes).select_related("proveedor").order_by("-total")[:10],
+        "top_productos": ResumenProductoMes.objects.filter(mes=mes).select_related("producto").order_by("-importe")[:10],
+    }
+    return render(request, "invoices/dashboard.html", ctx)
+
 # --- nuevo: detalle ---
 @login_required
 def invoice_detail(request, pk: int):
     inv = get_object_or_404(Factura.objects.select_related('proveedor').prefetch_related('items'), pk=pk)
     return render(request, "invoices/detail.html", {"inv": inv})
 
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _parse_range(header, size: int):
+    """
+    Interpreta un header Range de un solo rango ("bytes=0-1023", "bytes=500-", "bytes=-500").
+    Devuelve (start, end) inclusivo, None si no aplica (se sirve completo)
+    o False si el rango no se puede satisfacer (416).
+    """
+    if not header:
+        return None
+    m = _RANGE_RE.match(header.strip())
+    if not m:
+        # multi-rango u otro formato: se ignora y se sirve el archivo completo
+        return None
+    first, last = m.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # sufijo: últimos N bytes
+        n = int(last)
+        if n == 0:
+            return False
+        return max(size - n, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
 # --- nuevo: ver original (SAS redirect) ---
 @login_required
 def invoice_view_original(request, pk: int):
     inv = get_object_or_404(Factura, pk=pk)
-    blob_name = azure_blob.to_blob_name_from_url(inv.url_blob)
-    sas = azure_blob.make_sas_url(settings.AZURE_BLOB_CONTAINER, blob_name, minutes=10)
-    if not sas:
-        # Fallback: servir desde Django (no ideal para archivos grandes)
-        data = azure_blob.download_bytes(settings.AZURE_BLOB_CONTAINER, blob_name)
-        from django.http import StreamingHttpResponse
+    backend = storage.storage_for_url(inv.url_blob)
+    blob_name = backend.name_from_url(inv.url_blob)
+    sas = backend.signed_url(blob_name)
+    if sas:
+        # mismo SAS mientras esté vigente → el redirect también se puede cachear
+        url, expiry = sas
+        resp = redirect(url)
+        ttl = int((expiry - timezone.now()).total_seconds()) - int(getattr(settings, "AZURE_SAS_REFRESH_SECONDS", 120))
+        if ttl > 0:
+            resp["Cache-Control"] = f"private, max-age={ttl}"
+        return resp
+
+    # Fallback: servir desde Django en bloques (memoria constante, soporta Range)
+    try:
+        info = backend.properties(blob_name)
+    except FileNotFoundError:
+        raise Http404("El archivo original de esta factura no está disponible.")
+    size = info.size
+    etag = info.etag if info.etag.startswith('"') else f'"{info.etag}"'
+
+    if etag in request.headers.get("If-None-Match", ""):
+        resp = HttpResponse(status=304)
+        resp["ETag"] = etag
+        return resp
+
+    ct = info.content_type
+    if not ct or ct == "application/octet-stream":
         ct = "application/pdf" if inv.url_blob.lower().endswith(".pdf") else "application/octet-stream"
-        resp = StreamingHttpResponse(iter([data]), content_type=ct)
-        resp["Content-Disposition"] = f'inline; filename="{blob_name}"'
+
+    rng = _parse_range(request.headers.get("Range"), size)
+    if_range = request.headers.get("If-Range")
+    if rng and if_range and if_range != etag:
+        # el archivo cambió desde que el cliente pidió el rango → completo
+        rng = None
+
+    if rng is False:
+        resp = HttpResponse(status=416)
+        resp["Content-Range"] = f"bytes */{size}"
         return resp
-    return redirect(sas)
\ No newline at end of file
+
+    if rng:
+        start, end = rng
+        length = end - start + 1
+        chunks = backend.download_stream(blob_name, offset=start, length=length)
+        resp = StreamingHttpResponse(chunks, status=206, content_type=ct)
+        resp["Content-Range"] = f"bytes {start}-{end}/{size}"
+    else:
+        length = size
+        chunks = backend.download_stream(blob_name)
+        resp = StreamingHttpResponse(chunks, content_type=ct)
+
+    resp["Content-Length"] = str(length)
+    resp["Accept-Ranges"] = "bytes"
+    resp["ETag"] = etag
+    resp["Content-Disposition"] = f'inline; filename="{blob_name.rsplit("/", 1)[-1]}"'
+    return resp
@@ -2,7 +2,7 @@ from django.contrib import admin
 
 # Register your models here.
 
-from productos.models import Producto, ProductoEmbedding
+from productos.models import CodigoProveedorProducto, Producto, ProductoEmbedding
 
 @admin.register(Producto)
 class ProductoAdmin(admin.ModelAdmin):
@@ -13,4 +13,12 @@ class ProductoAdmin(admin.ModelAdmin):
     
 @admin.register(ProductoEmbedding)
 class ProductoEmbeddingAdmin(admin.ModelAdmin):
-    list_display = ('producto', 'vector', 'modelo', 'actualizado')
\ No newline at end of file
+    list_display = ('producto', 'vector', 'modelo', 'actualizado')
+
+
+@admin.register(CodigoProveedorProducto)
+class CodigoProveedorProductoAdmin(admin.ModelAdmin):
+    list_display = ('codigo', 'proveedor', 'producto', 'actualizado')
+    list_filter = ('proveedor',)
+    search_fields = ('codigo', 'codigo_norm', 'producto__nombre', 'proveedor__nombre')
+    raw_id_fields = ('producto',)
@@ -0,0 +1,22 @@
+from django import forms
+from proveedores.models import Proveedor
+
+class ImportarProductosForm(forms.Form):
+    archivo = forms.FileField(
+        label="Lista de productos (CSV/XLSX)",
+        allow_empty_file=False,
+        help_text="Columnas: nombre, codigo_interno (o sku) y opcionalmente codigo_proveedor, "
+                  "codigo_barras, categoria, marca, unidad_base, activo.",
+    )
+    proveedor = forms.ModelChoiceField(
+        queryset=Proveedor.objects.all(),
+        required=False,
+        label="Proveedor de la lista (opcional)",
+        help_text="Si se indica, los códigos de la columna codigo_proveedor se guardan como códigos de este proveedor.",
+    )
+
+    def clean_archivo(self):
+        archivo = self.cleaned_data["archivo"]
+        if not archivo.name.lower().endswith((".csv", ".xlsx")):
+            raise forms.ValidationError("El archivo tiene que ser .csv o .xlsx")
+        return archivo
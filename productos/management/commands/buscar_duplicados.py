@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from productos.models import Producto
+from productos.services.duplicados import buscar_duplicados
+
+class Command(BaseCommand):
+    help = "Lista grupos de productos casi duplicados según sus embeddings guardados."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--umbral", type=float, default=None, help="Similitud mínima (default DUPLICADOS_UMBRAL)")
+        parser.add_argument("--memoria-mb", type=int, default=None, help="Memoria para cada bloque de similitudes (default DUPLICADOS_MEMORIA_MB)")
+        parser.add_argument("--incluir-inactivos", action="store_true", help="Comparar también los productos inactivos")
+        parser.add_argument("--limite", type=int, default=50, help="Cuántos grupos mostrar (default 50)")
+
+    def handle(self, *args, **options):
+        grupos = buscar_duplicados(
+            umbral=options["umbral"],
+            memoria_mb=options["memoria_mb"],
+            incluir_inactivos=options["incluir_inactivos"],
+        )
+        mostrados = grupos[:options["limite"]]
+        productos = Producto.objects.in_bulk([pid for g in mostrados for pid in g.ids])
+        for g in mostrados:
+            self.stdout.write(f"similitud {g.similitud:.3f}")
+            for pid in g.ids:
+                p = productos.get(pid)
+                if p:
+                    self.stdout.write(f"   #{p.id} {p.nombre} [{p.codigo_interno or '-'}]")
+        self.stdout.write(self.style.SUCCESS(f"{len(grupos)} grupos de posibles duplicados"))
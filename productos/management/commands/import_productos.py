@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from productos.services.importer import importar_catalogo
+from proveedores.models import Proveedor
+
+class Command(BaseCommand):
+    help = "Importa (inserta o actualiza por código interno) productos desde un CSV o XLSX."
+
+    def add_arguments(self, parser):
+        parser.add_argument("archivo", help="Ruta al .csv o .xlsx")
+        parser.add_argument("--batch-size", type=int, default=500, help="Filas por bloque (default 500)")
+        parser.add_argument("--sin-embeddings", action="store_true", help="No generar embeddings al terminar")
+        parser.add_argument("--proveedor", help="Id o CUIT del proveedor de la lista (guarda sus códigos)")
+
+    def handle(self, *args, **options):
+        proveedor = None
+        if options["proveedor"]:
+            valor = options["proveedor"]
+            proveedor = (
+                Proveedor.objects.filter(pk=valor).first() if valor.isdigit() else None
+            ) or Proveedor.objects.filter(id_fiscal=valor).first()
+            if proveedor is None:
+                raise CommandError(f"No existe el proveedor '{valor}'")
+
+        try:
+            with open(options["archivo"], "rb") as fh:
+                resultado = importar_catalogo(
+                    fh, options["archivo"],
+                    batch_size=options["batch_size"],
+                    generar_embeddings=not options["sin_embeddings"],
+                    proveedor=proveedor,
+                )
+        except (OSError, ValueError) as ex:
+            raise CommandError(str(ex))
+
+        for fila, motivo in resultado.errores:
+            self.stdout.write(self.style.WARNING(f"Fila {fila}: {motivo}"))
+        self.stdout.write(self.style.SUCCESS(f"Importación terminada: {resultado.resumen()}"))
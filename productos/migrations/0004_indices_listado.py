@@ -0,0 +1,69 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:16
+# + índices para la búsqueda del listado de productos (dependen del motor):
+#   SQLite → códigos con COLLATE NOCASE (sirven para LIKE 'abc%', que no distingue mayúsculas);
+#   PostgreSQL → trigramas sobre UPPER(nombre) (icontains) y text_pattern_ops sobre
+#   UPPER(código) (istartswith); misma expresión que genera Django: UPPER(col::text) LIKE UPPER(%s).
+
+from django.db import migrations, models
+
+CODIGOS = ["codigo_interno", "codigo_proveedor", "codigo_barras"]
+
+SQLITE_CREATE = [
+    f"CREATE INDEX IF NOT EXISTS productos_producto_{c}_nocase ON productos_producto ({c} COLLATE NOCASE)"
+    for c in CODIGOS
+]
+SQLITE_DROP = [f"DROP INDEX IF EXISTS productos_producto_{c}_nocase" for c in CODIGOS]
+
+POSTGRES_CREATE = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    CREATE INDEX IF NOT EXISTS productos_producto_nombre_trgm
+    ON productos_producto USING GIN (UPPER(nombre::text) gin_trgm_ops)
+    """,
+] + [
+    f"CREATE INDEX IF NOT EXISTS productos_producto_{c}_upper ON productos_producto (UPPER({c}::text) text_pattern_ops)"
+    for c in CODIGOS
+]
+POSTGRES_DROP = ["DROP INDEX IF EXISTS productos_producto_nombre_trgm"] + [
+    f"DROP INDEX IF EXISTS productos_producto_{c}_upper" for c in CODIGOS
+]
+
+
+def _run(schema_editor, statements):
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def crear_indices(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        _run(schema_editor, SQLITE_CREATE)
+    elif vendor == "postgresql":
+        _run(schema_editor, POSTGRES_CREATE)
+
+
+def borrar_indices(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        _run(schema_editor, SQLITE_DROP)
+    elif vendor == "postgresql":
+        _run(schema_editor, POSTGRES_DROP)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0003_alter_productoembedding_vector'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='producto',
+            name='productos_p_nombre_456643_idx',
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['nombre', 'id'], name='productos_p_nombre_0876a0_idx'),
+        ),
+        migrations.RunPython(crear_indices, borrar_indices),
+    ]
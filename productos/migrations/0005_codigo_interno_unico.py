@@ -0,0 +1,43 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:19
+
+# Antes de la restricción única: códigos vacíos → NULL y, si hay códigos repetidos,
+# se conserva el del producto más antiguo y a los demás se les agrega "#<id>".
+
+import sys
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def normalizar_codigos(apps, schema_editor):
+    Producto = apps.get_model("productos", "Producto")
+    Producto.objects.filter(codigo_interno="").update(codigo_interno=None)
+    repetidos = (
+        Producto.objects.exclude(codigo_interno=None)
+        .values("codigo_interno").annotate(n=Count("id")).filter(n__gt=1)
+        .values_list("codigo_interno", flat=True)
+    )
+    for codigo in list(repetidos):
+        for p in Producto.objects.filter(codigo_interno=codigo).order_by("id")[1:]:
+            # se recorta el código, no el sufijo: si no, dos códigos largos podrían volver a chocar
+            sfx = f"#{p.id}"
+            p.codigo_interno = f"{codigo[:64 - len(sfx)]}{sfx}"
+            p.save(update_fields=["codigo_interno"])
+            sys.stdout.write(
+                f"\n  Código interno repetido '{codigo}': el producto {p.id} pasa a '{p.codigo_interno}'"
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0004_indices_listado'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalizar_codigos, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='producto',
+            constraint=models.UniqueConstraint(fields=('codigo_interno',), name='producto_codigo_interno_unico'),
+        ),
+    ]
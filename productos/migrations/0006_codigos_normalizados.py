@@ -0,0 +1,76 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:28
+
+# Completa los códigos normalizados de los productos existentes
+# (misma regla que productos.services.codigos.normalizar_codigo).
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+
+def _normalizar(codigo):
+    if codigo is None:
+        return None
+    texto = unicodedata.normalize("NFKD", str(codigo)).encode("ascii", "ignore").decode()
+    texto = re.sub(r"[^0-9A-Z]", "", texto.upper())
+    return (texto.lstrip("0") or "0") if texto else None
+
+
+def completar_normalizados(apps, schema_editor):
+    Producto = apps.get_model("productos", "Producto")
+    campos = ["codigo_interno", "codigo_proveedor", "codigo_barras"]
+    pendientes = []
+    for p in Producto.objects.exclude(
+        codigo_interno=None, codigo_proveedor=None, codigo_barras=None
+    ).only("id", *campos).iterator(chunk_size=2000):
+        for campo in campos:
+            setattr(p, f"{campo}_norm", _normalizar(getattr(p, campo)))
+        pendientes.append(p)
+        if len(pendientes) >= 2000:
+            Producto.objects.bulk_update(pendientes, [f"{c}_norm" for c in campos])
+            pendientes = []
+    Producto.objects.bulk_update(pendientes, [f"{c}_norm" for c in campos])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0005_codigo_interno_unico'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='actualizado',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='codigo_barras_norm',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='codigo_interno_norm',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='codigo_proveedor_norm',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.RunPython(completar_normalizados, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['codigo_interno_norm'], name='productos_p_codigo__cd6503_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['codigo_proveedor_norm'], name='productos_p_codigo__5f66f5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['codigo_barras_norm'], name='productos_p_codigo__2d2134_idx'),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:30
+
+# La tabla se completa con los códigos de las facturas ya confirmadas
+# (si un proveedor usó el mismo código para varios productos, queda el último).
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def _normalizar(codigo):
+    if codigo is None:
+        return None
+    texto = unicodedata.normalize("NFKD", str(codigo)).encode("ascii", "ignore").decode()
+    texto = re.sub(r"[^0-9A-Z]", "", texto.upper())
+    return (texto.lstrip("0") or "0") if texto else None
+
+
+def cargar_desde_facturas(apps, schema_editor):
+    ItemFactura = apps.get_model("invoices", "ItemFactura")
+    CodigoProveedorProducto = apps.get_model("productos", "CodigoProveedorProducto")
+    filas = {}
+    items = (
+        ItemFactura.objects
+        .filter(tipo_item="producto", producto__isnull=False, codigo_producto__isnull=False)
+        .order_by("factura__created_at", "id")
+        .values_list("factura__proveedor_id", "codigo_producto", "producto_id")
+        .iterator(chunk_size=2000)
+    )
+    for proveedor_id, codigo, producto_id in items:
+        norm = _normalizar(codigo)
+        if norm:
+            filas[(proveedor_id, norm[:64])] = (codigo.strip()[:64], producto_id)
+    CodigoProveedorProducto.objects.bulk_create(
+        (
+            CodigoProveedorProducto(proveedor_id=prov, codigo_norm=norm, codigo=codigo, producto_id=prod)
+            for (prov, norm), (codigo, prod) in filas.items()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productos', '0006_codigos_normalizados'),
+        ('proveedores', '0002_indices_listado'),
+        ('invoices', '0008_estadisticaprecio'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CodigoProveedorProducto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codigo', models.CharField(max_length=64)),
+                ('codigo_norm', models.CharField(editable=False, max_length=64)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='codigos_proveedores', to='productos.producto')),
+                ('proveedor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='codigos_productos', to='proveedores.proveedor')),
+            ],
+            options={
+                'verbose_name': 'Código de proveedor',
+                'verbose_name_plural': 'Códigos de proveedores',
+                'constraints': [models.UniqueConstraint(fields=('proveedor', 'codigo_norm'), name='codigo_proveedor_producto_unico')],
+            },
+        ),
+        migrations.RunPython(cargar_desde_facturas, migrations.RunPython.noop),
+    ]
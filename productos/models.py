@@ -14,6 +14,12 @@ class Producto(models.Model):
     unidad_base = models.CharField(max_length=20, null=True, blank=True)      # ej: un, kg, lt
     activo = models.BooleanField(default=True)
 
+    # códigos normalizados (sin espacios / guiones / ceros a la izquierda): ver services/codigos.py
+    codigo_interno_norm = models.CharField(max_length=64, null=True, blank=True, editable=False)
+    codigo_proveedor_norm = models.CharField(max_length=64, null=True, blank=True, editable=False)
+    codigo_barras_norm = models.CharField(max_length=64, null=True, blank=True, editable=False)
+    actualizado = models.DateTimeField(auto_now=True, db_index=True)  # marca de agua del índice de códigos
+
     class Meta:
         verbose_name = "Producto"
         verbose_name_plural = "Productos"
@@ -21,12 +27,72 @@ class Producto(models.Model):
             models.Index(fields=["codigo_interno"]),
             models.Index(fields=["codigo_proveedor"]),
             models.Index(fields=["codigo_barras"]),
-            models.Index(fields=["nombre"]),
+            models.Index(fields=["nombre", "id"]),  # orden del listado (paginación por cursor)
+            models.Index(fields=["codigo_interno_norm"]),
+            models.Index(fields=["codigo_proveedor_norm"]),
+            models.Index(fields=["codigo_barras_norm"]),
+        ]
+        constraints = [
+            # clave de la importación masiva (varios NULL están permitidos)
+            models.UniqueConstraint(fields=["codigo_interno"], name="producto_codigo_interno_unico"),
         ]
         ordering = ["nombre"]
 
+    # campos cuyo valor original se guarda al leer de la base (para saber qué cambió)
+    CAMPOS_SEGUIDOS = ("nombre", "marca", "categoria", "activo")
+    CAMPOS_EMBEDDING = ("nombre", "marca", "categoria")  # los que forman el texto del embedding
+    CAMPOS_CODIGO = ("codigo_interno", "codigo_proveedor", "codigo_barras")
+
     def __str__(self):
         return self.nombre
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._guardar_estado()
+        return instance
+
+    def _guardar_estado(self):
+        # solo los campos cargados (con .only()/.defer() algunos pueden faltar)
+        cargados = self.__dict__
+        self._estado_original = {c: cargados[c] for c in self.CAMPOS_SEGUIDOS if c in cargados}
+
+    def campos_modificados(self) -> set:
+        """
+        Campos seguidos que cambiaron desde que se leyó el producto.
+        En un producto nuevo (o sin estado original) se consideran todos modificados.
+        """
+        original = getattr(self, "_estado_original", None)
+        if self._state.adding or original is None:
+            return set(self.CAMPOS_SEGUIDOS)
+        cargados = self.__dict__
+        return {
+            c for c in self.CAMPOS_SEGUIDOS
+            # un campo diferido que nadie asignó no cambió
+            if (c in cargados and c not in original) or (c in original and cargados.get(c) != original[c])
+        }
+
+    def normalizar_codigos(self):
+        """Completa codigo_*_norm a partir de los códigos (también lo usa la importación masiva)."""
+        from productos.services.codigos import normalizar_codigo
+
+        for campo in self.CAMPOS_CODIGO:
+            if campo in self.__dict__:  # un código diferido (.only()) no se lee ni cambia
+                setattr(self, f"{campo}_norm", normalizar_codigo(getattr(self, campo)))
+
+    def save(self, *args, **kwargs):
+        self.normalizar_codigos()
+        if kwargs.get("update_fields") is not None:
+            update_fields = set(kwargs["update_fields"])
+            update_fields |= {f"{c}_norm" for c in self.CAMPOS_CODIGO if c in update_fields}
+            kwargs["update_fields"] = update_fields | {"actualizado"}
+        # la señal post_save lee _cambios; después el estado guardado pasa a ser el original
+        cambios = self.campos_modificados()
+        if kwargs.get("update_fields") is not None:
+            cambios &= set(kwargs["update_fields"])
+        self._cambios = cambios
+        super().save(*args, **kwargs)
+        self._guardar_estado()
     
 
 # --- PRODUCTO EMBEDDING ---
@@ -56,18 +122,95 @@ class ProductoEmbedding(models.Model):
         return f"Embedding de {self.producto.nombre}"
     
     
+# --- CÓDIGOS DE CADA PROVEEDOR ---
+class CodigoProveedorProducto(models.Model):
+    """
+    Código con el que un proveedor factura un producto (cada distribuidor usa el suyo).
+    Se completa al confirmar facturas y al importar listas de un proveedor;
+    en la vista previa se busca acá primero. Ver services/codigos.py.
+    """
+    proveedor = models.ForeignKey("proveedores.Proveedor", on_delete=models.CASCADE, related_name="codigos_productos")
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name="codigos_proveedores")
+    codigo = models.CharField(max_length=64)        # tal como viene en la factura / lista
+    codigo_norm = models.CharField(max_length=64, editable=False)   # normalizado (clave de búsqueda)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Código de proveedor"
+        verbose_name_plural = "Códigos de proveedores"
+        constraints = [
+            models.UniqueConstraint(fields=["proveedor", "codigo_norm"], name="codigo_proveedor_producto_unico"),
+        ]
+
+    def save(self, *args, **kwargs):
+        from productos.services.codigos import normalizar_codigo
+
+        self.codigo_norm = normalizar_codigo(self.codigo) or ""
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.codigo} → {self.producto.nombre}"
+
+
 # --- SEÑAL POST SAVE ---
 # (se define DESPUÉS de los modelos para evitar import circular)
-from django.db.models.signals import post_save 
+import threading
+from contextlib import contextmanager
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from productos.services.embedding_service import embedding_service
 
+_senal = threading.local()
+
+
+@contextmanager
+def embeddings_suspendidos():
+    """
+    Dentro del bloque, guardar un producto NO genera su embedding (ej. importación
+    masiva, que después los genera todos juntos con embedding_service.bulk_upsert).
+    """
+    anterior = getattr(_senal, "suspendida", False)
+    _senal.suspendida = True
+    try:
+        yield
+    finally:
+        _senal.suspendida = anterior
+
+
 @receiver(post_save, sender=Producto)
-def update_producto_embedding(sender, instance, **kwargs):
+def update_producto_embedding(sender, instance, created=False, **kwargs):
     """
-    Actualiza automáticamente el embedding cada vez que se crea o edita un producto.
+    Mantiene el embedding y el buscador en memoria al día, haciendo solo lo necesario:
+      - nombre / marca / categoría cambiaron (o producto nuevo) → se recalcula el embedding
+      - solo cambió activo → se agrega o se quita del buscador, sin recalcular nada
+      - otros campos (códigos, unidad) → nada
     """
+    if getattr(_senal, "suspendida", False):
+        return
+    from invoices.services.ia_helper import actualizar_en_buscador
+
+    cambios = getattr(instance, "_cambios", set(Producto.CAMPOS_SEGUIDOS))
+
     try:
-        embedding_service.ensure_embedding(instance)
+        if created or cambios & set(Producto.CAMPOS_EMBEDDING):
+            vector = embedding_service.ensure_embedding(instance)
+            actualizar_en_buscador([(instance, vector)])
+        elif "activo" in cambios:
+            actualizar_en_buscador([(instance, None)])
     except Exception as ex:
-        print(f"⚠️ No se pudo generar el embedding para {instance.nombre}: {ex}")
\ No newline at end of file
+        print(f"⚠️ No se pudo generar el embedding para {instance.nombre}: {ex}")
+
+
+@receiver(post_save, sender=Producto)
+def update_producto_codigos(sender, instance, **kwargs):
+    """Mantiene al día el índice de códigos en memoria de este proceso."""
+    from productos.services import codigos
+
+    codigos.actualizar_producto(instance)
+
+
+@receiver(post_delete, sender=Producto)
+def quitar_producto_codigos(sender, instance, **kwargs):
+    from productos.services import codigos
+
+    codigos.quitar_producto(instance.pk)
@@ -0,0 +1,216 @@
+"""
+codigos.py
+----------------------------------------
+Resolución de códigos de factura (interno, de proveedor o de barras) a productos.
+
+- Los tres códigos se comparan normalizados (normalizar_codigo): sin espacios,
+  guiones ni puntos, en mayúsculas y sin ceros a la izquierda, así
+  "00-123 45" y "12345" son el mismo código. Producto guarda la forma
+  normalizada en codigo_*_norm.
+- Se mantiene en memoria del proceso un diccionario código normalizado → id
+  por tipo de código, así resolver todos los códigos de una factura son unas
+  pocas búsquedas en diccionarios, sin consultas.
+- Los cambios hechos en este proceso se aplican al instante (señales de
+  Producto). Los de otros procesos se leen cada CODIGOS_REFRESCO_SEGUNDOS con
+  una consulta por Producto.actualizado (marca de agua), y cada
+  CODIGOS_RECARGA_SEGUNDOS se recarga todo (para soltar productos borrados).
+
+Si un código normalizado lo tienen varios productos, gana el de menor id.
+
+Además, cada proveedor puede tener sus propios códigos para un mismo producto
+(tabla CodigoProveedorProducto, única por proveedor + código normalizado):
+resolver_proveedor() la consulta con UNA búsqueda indexada por factura y
+registrar_codigos() la completa (al confirmar facturas y al importar listas).
+"""
+
+import re
+import threading
+import time
+import unicodedata
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import Q
+
+# en orden de prioridad al resolver
+TIPOS = ("codigo_interno", "codigo_proveedor", "codigo_barras")
+
+# solapamiento de la marca de agua (transacciones que confirman con un "actualizado" anterior)
+_MARGEN = timedelta(seconds=60)
+
+_lock = threading.Lock()
+_state = {
+    "cargado_en": 0.0,     # monotonic de la última carga completa
+    "revisado_en": 0.0,    # monotonic de la última lectura incremental
+    "marca": None,         # mayor Producto.actualizado leído
+    "indices": {t: {} for t in TIPOS},   # tipo → {código normalizado → id}
+    "por_producto": {},    # id → (código normalizado por tipo, en el orden de TIPOS)
+}
+
+
+def normalizar_codigo(codigo) -> str | None:
+    """
+    'ab-00123 ' -> 'AB00123'; '000123' -> '123'. None si no queda nada.
+    """
+    if codigo is None:
+        return None
+    texto = unicodedata.normalize("NFKD", str(codigo)).encode("ascii", "ignore").decode()
+    texto = re.sub(r"[^0-9A-Z]", "", texto.upper())
+    return (texto.lstrip("0") or "0") if texto else None
+
+
+def _quitar(producto_id):
+    anteriores = _state["por_producto"].pop(producto_id, None)
+    if not anteriores:
+        return
+    for tipo, norm in zip(TIPOS, anteriores):
+        if norm and _state["indices"][tipo].get(norm) == producto_id:
+            del _state["indices"][tipo][norm]
+
+
+def _poner(producto_id, normas):
+    _quitar(producto_id)
+    if not any(normas):
+        return
+    _state["por_producto"][producto_id] = normas
+    for tipo, norm in zip(TIPOS, normas):
+        if norm:
+            actual = _state["indices"][tipo].get(norm)
+            if actual is None or producto_id < actual:
+                _state["indices"][tipo][norm] = producto_id
+
+
+def _leer(desde=None):
+    """
+    Aplica los productos modificados desde la marca (todos si desde es None).
+    """
+    from productos.models import Producto
+
+    if desde is None:
+        qs = Producto.objects.filter(
+            Q(codigo_interno_norm__isnull=False) | Q(codigo_proveedor_norm__isnull=False) |
+            Q(codigo_barras_norm__isnull=False)
+        )
+    else:
+        # también los que perdieron su código (hay que sacarlos del índice)
+        qs = Producto.objects.filter(actualizado__gte=desde - _MARGEN)
+    n = 0
+    for pid, actualizado, *normas in qs.values_list(
+        "id", "actualizado", *[f"{t}_norm" for t in TIPOS]
+    ).iterator(chunk_size=5000):
+        _poner(pid, tuple(normas))
+        if actualizado and (_state["marca"] is None or actualizado > _state["marca"]):
+            _state["marca"] = actualizado
+        n += 1
+    return n
+
+
+def _refrescar():
+    ahora = time.monotonic()
+    recarga = float(getattr(settings, "CODIGOS_RECARGA_SEGUNDOS", 3600))
+    refresco = float(getattr(settings, "CODIGOS_REFRESCO_SEGUNDOS", 5))
+    try:
+        if not _state["cargado_en"] or ahora - _state["cargado_en"] > recarga:
+            _state.update(indices={t: {} for t in TIPOS}, por_producto={}, marca=None)
+            n = _leer()
+            _state.update(cargado_en=ahora, revisado_en=ahora)
+            print(f"🏷️ Índice de códigos cargado: {n} productos con código")
+        elif ahora - _state["revisado_en"] > refresco:
+            _leer(_state["marca"])
+            _state["revisado_en"] = ahora
+    except DatabaseError as ex:
+        print(f"⚠️ No se pudo leer el índice de códigos ({ex})")
+
+
+def resolver(codigos) -> list:
+    """
+    Para cada código (de una factura), el id del producto o None.
+    """
+    normas = [normalizar_codigo(c) for c in codigos]
+    with _lock:
+        _refrescar()
+        indices = [_state["indices"][t] for t in TIPOS]
+        resultado = []
+        for norm in normas:
+            pid = None
+            if norm:
+                pid = next((i[norm] for i in indices if norm in i), None)
+            resultado.append(pid)
+    return resultado
+
+
+def actualizar_producto(producto):
+    """
+    Aplica un producto recién guardado (si el índice ya está cargado).
+    """
+    campos = [f"{t}_norm" for t in TIPOS]
+    with _lock:
+        if not _state["cargado_en"]:
+            return
+        if all(c in producto.__dict__ for c in campos):
+            _poner(producto.pk, tuple(producto.__dict__[c] for c in campos))
+        else:
+            _state["revisado_en"] = 0.0  # guardado con campos diferidos: se relee de la base
+
+
+def quitar_producto(producto_id):
+    with _lock:
+        _quitar(producto_id)
+
+
+def marcar_pendiente():
+    """
+    Fuerza la lectura incremental en la próxima resolución (ej. después de una
+    importación masiva, que no dispara señales).
+    """
+    with _lock:
+        _state["revisado_en"] = 0.0
+
+
+# -----------------------------------------------------------
+# CÓDIGOS POR PROVEEDOR
+# -----------------------------------------------------------
+def resolver_proveedor(proveedor_id, codigos) -> list:
+    """
+    Para cada código, el id del producto según la tabla del proveedor (o None).
+    """
+    from productos.models import CodigoProveedorProducto
+
+    normas = [normalizar_codigo(c) for c in codigos]
+    buscados = {n for n in normas if n}
+    if not proveedor_id or not buscados:
+        return [None] * len(normas)
+    encontrados = dict(
+        CodigoProveedorProducto.objects
+        .filter(proveedor_id=proveedor_id, codigo_norm__in=buscados)
+        .values_list("codigo_norm", "producto_id")
+    )
+    return [encontrados.get(n) if n else None for n in normas]
+
+
+def registrar_codigos(proveedor_id, pares, batch_size: int = 500) -> int:
+    """
+    Guarda (código, producto_id) del proveedor: si el código ya estaba, pasa a
+    apuntar al último producto con el que se confirmó. Devuelve cuántos se escribieron.
+    """
+    from productos.models import CodigoProveedorProducto
+
+    if not proveedor_id:
+        return 0
+    filas = {}
+    for codigo, producto_id in pares:
+        norm = normalizar_codigo(codigo)
+        if norm and producto_id:
+            filas[norm] = CodigoProveedorProducto(
+                proveedor_id=proveedor_id, producto_id=producto_id,
+                codigo=str(codigo).strip()[:64], codigo_norm=norm[:64],
+            )
+    CodigoProveedorProducto.objects.bulk_create(
+        filas.values(),
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=["proveedor", "codigo_norm"],
+        update_fields=["producto", "codigo", "actualizado"],
+    )
+    return len(filas)
@@ -0,0 +1,231 @@
+"""
+duplicados.py
+----------------------------------------
+Detección de productos casi duplicados a partir de los embeddings ya guardados
+(ProductoEmbedding) y fusión de un grupo en un solo producto.
+
+- Los vectores se cargan de a bloques en una matriz float32 normalizada
+  (N × dim), así la similitud coseno es un producto punto.
+- Las similitudes se calculan por bloques de filas: cada bloque se compara
+  contra los productos que le siguen (triángulo superior) con un solo producto
+  de matrices de numpy. El tamaño del bloque sale de DUPLICADOS_MEMORIA_MB, de
+  modo que la matriz intermedia de similitudes no pasa ese presupuesto.
+- Los pares por encima del umbral se agrupan con union-find (si A≈B y B≈C,
+  los tres quedan en el mismo grupo).
+- grupos_cacheados(): lo mismo que buscar_duplicados() pero guarda el resultado
+  en memoria del proceso por umbral, mientras los embeddings no cambien (misma
+  cantidad y mismo último ProductoEmbedding.actualizado): el reporte no
+  recalcula todos los pares en cada visita.
+- fusionar(): repunta los ItemFactura (y los códigos de proveedor) de los
+  duplicados al producto elegido (un UPDATE cada uno), recalcula sus
+  resúmenes mensuales e historial de precios y borra los duplicados.
+"""
+
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+
+from invoices.models import ItemFactura
+from invoices.services import precios, rollups
+from invoices.services.ia_helper import actualizar_en_buscador
+from productos.models import CodigoProveedorProducto, Producto, ProductoEmbedding
+
+# códigos que el producto elegido toma de un duplicado si él no los tiene
+CAMPOS_COMPLETAR = ("codigo_proveedor", "codigo_barras")
+
+# umbrales distintos que se guardan a la vez en grupos_cacheados()
+_CACHE_MAX = 8
+
+_lock = threading.Lock()
+_cache = {}  # (umbral, memoria_mb, incluir_inactivos) → (firma de los embeddings, grupos)
+
+
+@dataclass
+class Grupo:
+    ids: list          # ids de producto, ordenados
+    similitud: float   # similitud más alta entre dos productos del grupo
+
+
+def _umbral() -> float:
+    return float(getattr(settings, "DUPLICADOS_UMBRAL", 0.92))
+
+
+def _memoria_mb() -> int:
+    return int(getattr(settings, "DUPLICADOS_MEMORIA_MB", 256))
+
+
+def _embeddings(incluir_inactivos: bool):
+    qs = ProductoEmbedding.objects.filter(vector__isnull=False)
+    if not incluir_inactivos:
+        qs = qs.filter(producto__activo=True)
+    return qs
+
+
+def cargar_vectores(incluir_inactivos: bool = False, chunk_size: int = 2000):
+    """
+    (ids, matriz) con los embeddings guardados: ids es un array de ids de producto
+    y cada fila de la matriz es el vector normalizado (float32) de ese producto.
+    """
+    qs = _embeddings(incluir_inactivos)
+    total = qs.count()
+
+    ids = np.empty(total, dtype=np.int64)
+    matriz, dim, n = None, None, 0
+    for producto_id, vector in qs.order_by("producto_id").values_list("producto_id", "vector").iterator(chunk_size=chunk_size):
+        if not vector:
+            continue
+        if matriz is None:
+            dim = len(vector)
+            matriz = np.empty((total, dim), dtype=np.float32)
+        if len(vector) != dim or n >= total:
+            continue
+        matriz[n] = vector
+        ids[n] = producto_id
+        n += 1
+
+    if matriz is None:
+        return ids[:0], np.empty((0, 0), dtype=np.float32)
+    matriz = matriz[:n]
+    normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+    normas[normas == 0] = 1
+    matriz /= normas
+    return ids[:n], matriz
+
+
+def _filas_por_bloque(n: int, memoria_mb: int) -> int:
+    # por fila del bloque: n similitudes float32 + n booleanos de la máscara
+    return max(1, min(n, (memoria_mb * 1024 * 1024) // max(1, n * 5)))
+
+
+def buscar_pares(matriz, umbral: float, memoria_mb: int):
+    """
+    Itera (i, j, similitud) con i < j para cada par de filas con similitud >= umbral.
+    """
+    n = len(matriz)
+    bloque = _filas_por_bloque(n, memoria_mb)
+    for inicio in range(0, n, bloque):
+        fin = min(n, inicio + bloque)
+        sims = matriz[inicio:fin] @ matriz[inicio:].T
+        filas, cols = np.nonzero(sims >= umbral)
+        arriba = cols > filas  # descarta la diagonal y los pares ya vistos
+        filas, cols = filas[arriba], cols[arriba]
+        for f, c, s in zip(filas.tolist(), cols.tolist(), sims[filas, cols].tolist()):
+            yield inicio + f, inicio + c, s
+
+
+def buscar_duplicados(umbral: float | None = None, memoria_mb: int | None = None,
+                      incluir_inactivos: bool = False) -> list[Grupo]:
+    """
+    Grupos de productos casi duplicados, de mayor a menor similitud.
+    """
+    umbral = _umbral() if umbral is None else umbral
+    memoria_mb = _memoria_mb() if memoria_mb is None else memoria_mb
+    ids, matriz = cargar_vectores(incluir_inactivos)
+
+    # union-find sobre los índices de la matriz
+    padre = {}
+
+    def raiz(i):
+        while padre[i] != i:
+            padre[i] = padre[padre[i]]
+            i = padre[i]
+        return i
+
+    pares = []
+    for i, j, s in buscar_pares(matriz, umbral, memoria_mb):
+        padre.setdefault(i, i)
+        padre.setdefault(j, j)
+        ri, rj = raiz(i), raiz(j)
+        if ri != rj:
+            padre[max(ri, rj)] = min(ri, rj)
+        pares.append((i, s))
+
+    miembros, mejor = {}, {}
+    for i in padre:
+        miembros.setdefault(raiz(i), []).append(int(ids[i]))
+    for i, s in pares:
+        r = raiz(i)
+        mejor[r] = max(mejor.get(r, 0.0), s)
+
+    grupos = [Grupo(ids=sorted(m), similitud=mejor[r]) for r, m in miembros.items()]
+    grupos.sort(key=lambda g: (-g.similitud, g.ids[0]))
+    print(f"🔎 Duplicados: {len(ids)} productos comparados, {len(grupos)} grupos (umbral={umbral:.2f})")
+    return grupos
+
+
+def _firma(incluir_inactivos: bool):
+    # cambia al generar o regenerar un embedding y al borrar o desactivar un producto
+    agg = _embeddings(incluir_inactivos).aggregate(n=Count("pk"), ultimo=Max("actualizado"))
+    return agg["n"], agg["ultimo"]
+
+
+def grupos_cacheados(umbral: float | None = None, memoria_mb: int | None = None,
+                     incluir_inactivos: bool = False) -> list[Grupo]:
+    """
+    buscar_duplicados() reusando el último resultado del proceso para ese umbral
+    si los embeddings no cambiaron desde entonces (una consulta agregada).
+    """
+    umbral = _umbral() if umbral is None else umbral
+    memoria_mb = _memoria_mb() if memoria_mb is None else memoria_mb
+    key = (umbral, memoria_mb, incluir_inactivos)
+    firma = _firma(incluir_inactivos)
+    with _lock:
+        cached = _cache.get(key)
+    if cached and cached[0] == firma:
+        return cached[1]
+
+    grupos = buscar_duplicados(umbral, memoria_mb, incluir_inactivos)
+    with _lock:
+        _cache.pop(key, None)
+        if len(_cache) >= _CACHE_MAX:
+            _cache.pop(next(iter(_cache)))  # el más viejo
+        _cache[key] = (firma, grupos)
+    return grupos
+
+
+def invalidar_cache():
+    with _lock:
+        _cache.clear()
+
+
+@transaction.atomic
+def fusionar(destino: Producto, duplicados) -> int:
+    """
+    Fusiona los duplicados en destino: sus ítems de factura pasan a destino, destino
+    completa los códigos que le falten y los duplicados se borran.
+    Devuelve la cantidad de ítems repuntados.
+    """
+    duplicados = [p for p in duplicados if p.pk != destino.pk]
+    ids = [p.pk for p in duplicados]
+    if not ids:
+        return 0
+
+    movidos = ItemFactura.objects.filter(producto_id__in=ids).update(producto=destino)
+    CodigoProveedorProducto.objects.filter(producto_id__in=ids).update(producto=destino)
+
+    completar = []
+    for campo in CAMPOS_COMPLETAR:
+        if not getattr(destino, campo):
+            valor = next((getattr(p, campo) for p in duplicados if getattr(p, campo)), None)
+            if valor:
+                setattr(destino, campo, valor)
+                completar.append(campo)
+
+    # los resúmenes, el historial y el embedding de los duplicados se borran en cascada
+    Producto.objects.filter(pk__in=ids).delete()
+    if completar:
+        destino.save(update_fields=completar)
+    rollups.recalcular_productos([destino.pk])
+    precios.rebuild(producto_ids=[destino.pk])
+
+    for p in duplicados:
+        p.activo = False  # el buscador en memoria quita los inactivos
+    transaction.on_commit(lambda: actualizar_en_buscador([(p, None) for p in duplicados]))
+    transaction.on_commit(invalidar_cache)
+
+    print(f"🔗 Fusionados {len(ids)} productos en '{destino.nombre}' ({movidos} ítems de factura)")
+    return movidos
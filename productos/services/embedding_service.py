@@ -25,12 +25,15 @@ class ProductEmbeddingService:
         clean_text = normalize_text(text)
         return self.model.encode([clean_text])[0]  # devuelve np.array
 
+    @staticmethod
+    def _texto(producto: Producto) -> str:
+        return f"{producto.nombre} {producto.marca or ''} {producto.categoria or ''}"
+
     def ensure_embedding(self, producto: Producto):
         """
-        Crea o actualiza el embedding para un producto.
+        Crea o actualiza el embedding para un producto. Devuelve el vector.
         """
-        text = f"{producto.nombre} {producto.marca or ''} {producto.categoria or ''}"
-        vec = self.generate_embedding(text)
+        vec = self.generate_embedding(self._texto(producto))
 
         emb, created = ProductoEmbedding.objects.get_or_create(producto=producto)
         emb.set_vector(vec)
@@ -38,6 +41,37 @@ class ProductEmbeddingService:
 
         status = "creado" if created else "actualizado"
         print(f"✅ Embedding {status} para '{producto.nombre}'")
+        return vec
+
+    def bulk_upsert(self, productos, batch_size: int = 256) -> int:
+        """
+        Genera los embeddings de muchos productos de a bloques: una llamada al
+        modelo y un INSERT ... ON CONFLICT por bloque (en vez de uno por producto).
+        Devuelve cuántos embeddings se guardaron.
+        """
+        from invoices.services.ia_helper import actualizar_en_buscador
+
+        productos = list(productos)
+        total = 0
+        for start in range(0, len(productos), batch_size):
+            bloque = productos[start:start + batch_size]
+            textos = [normalize_text(self._texto(p)) for p in bloque]
+            vectores = self.model.encode(textos, batch_size=batch_size)
+            embs = []
+            for p, vec in zip(bloque, vectores):
+                emb = ProductoEmbedding(producto=p)
+                emb.set_vector(np.asarray(vec))
+                embs.append(emb)
+            ProductoEmbedding.objects.bulk_create(
+                embs,
+                update_conflicts=True,
+                unique_fields=["producto"],
+                update_fields=["vector", "modelo", "actualizado"],
+            )
+            actualizar_en_buscador(list(zip(bloque, vectores)))
+            total += len(embs)
+        print(f"🧩 {total} embeddings generados en bloques de {batch_size}.")
+        return total
 
     def bulk_generate_all(self):
         """
@@ -45,9 +79,8 @@ class ProductEmbeddingService:
         Ideal para comando 'generate_product_embeddings'.
         """
         productos = Producto.objects.filter(activo=True)
-        for p in productos:
-            self.ensure_embedding(p)
-        print(f"🧩 Se actualizaron {productos.count()} embeddings de productos.")
+        n = self.bulk_upsert(productos)
+        print(f"🧩 Se actualizaron {n} embeddings de productos.")
 
 
 # Instancia global (singleton)
@@ -0,0 +1,284 @@
+"""
+importer.py
+----------------------------------------
+Importación masiva del catálogo de productos desde CSV o XLSX (listas de precios
+de proveedores). La clave es codigo_interno:
+
+- Las filas se leen en streaming y se procesan de a bloques: por bloque se leen
+  los productos existentes (una consulta) y se hace UN bulk_create con
+  update_conflicts (INSERT ... ON CONFLICT DO UPDATE). Las filas idénticas a lo
+  que ya está guardado no se escriben.
+- Durante la importación no se dispara el embedding por producto; al final se
+  generan juntos (embedding_service.bulk_upsert) solo para los productos nuevos o
+  cuyo nombre / marca / categoría cambió; si solo cambió activo, únicamente se
+  agrega o quita del buscador en memoria.
+
+Columnas reconocidas (sin importar mayúsculas ni acentos): nombre, codigo_interno
+(o sku / código), codigo_proveedor, codigo_barras (o ean), categoria, marca,
+unidad_base (o unidad), activo.
+
+Si se indica el proveedor de la lista, sus códigos se guardan además en
+CodigoProveedorProducto (ver services/codigos.py).
+"""
+
+import csv
+import io
+import time
+import unicodedata
+from dataclasses import dataclass, field
+
+from django.db import transaction
+
+from invoices.services.ia_helper import actualizar_en_buscador
+from productos.models import Producto, embeddings_suspendidos
+from productos.services import codigos
+from productos.services.embedding_service import embedding_service
+
+try:
+    import openpyxl
+except ImportError:  # pragma: no cover - dependencia opcional
+    openpyxl = None
+
+CAMPOS = ["nombre", "codigo_interno", "codigo_proveedor", "codigo_barras", "categoria", "marca", "unidad_base", "activo"]
+CAMPOS_EMBEDDING = ("nombre", "marca", "categoria")
+
+ALIAS = {
+    "nombre": "nombre", "descripcion": "nombre", "producto": "nombre",
+    "codigo_interno": "codigo_interno", "codigo": "codigo_interno", "sku": "codigo_interno",
+    "codigo_proveedor": "codigo_proveedor", "cod_proveedor": "codigo_proveedor",
+    "codigo_barras": "codigo_barras", "ean": "codigo_barras", "codigo_de_barras": "codigo_barras",
+    "categoria": "categoria", "rubro": "categoria",
+    "marca": "marca",
+    "unidad_base": "unidad_base", "unidad": "unidad_base",
+    "activo": "activo",
+}
+
+_VERDADERO = {"1", "si", "sí", "s", "true", "t", "x", "yes", "y"}
+_FALSO = {"0", "no", "n", "false", "f"}
+
+
+@dataclass
+class ResultadoImportacion:
+    insertados: int = 0
+    actualizados: int = 0
+    sin_cambios: int = 0
+    omitidos: int = 0
+    embeddings: int = 0
+    segundos: float = 0.0
+    errores: list = field(default_factory=list)  # [(fila, motivo)] (los primeros)
+
+    @property
+    def procesados(self) -> int:
+        return self.insertados + self.actualizados + self.sin_cambios + self.omitidos
+
+    @property
+    def filas_por_segundo(self) -> float:
+        return self.procesados / self.segundos if self.segundos else 0.0
+
+    def resumen(self) -> str:
+        return (
+            f"{self.insertados} insertados, {self.actualizados} actualizados, "
+            f"{self.sin_cambios} sin cambios, {self.omitidos} omitidos, "
+            f"{self.embeddings} embeddings — {self.segundos:.1f}s ({self.filas_por_segundo:.0f} filas/s)"
+        )
+
+    def _error(self, fila: int, motivo: str):
+        self.omitidos += 1
+        if len(self.errores) < 50:
+            self.errores.append((fila, motivo))
+
+
+# -----------------------------------------------------------
+# LECTURA
+# -----------------------------------------------------------
+def _clave(titulo) -> str:
+    t = unicodedata.normalize("NFKD", str(titulo or "")).encode("ascii", "ignore").decode()
+    return "_".join(t.lower().replace(".", " ").split())
+
+
+def _leer_csv(fh):
+    texto = io.TextIOWrapper(fh, encoding="utf-8-sig", newline="")
+    muestra = texto.read(4096)
+    texto.seek(0)
+    try:
+        dialecto = csv.Sniffer().sniff(muestra, delimiters=",;\t")
+    except csv.Error:
+        dialecto = csv.excel
+    yield from csv.reader(texto, dialecto)
+
+
+def _leer_xlsx(fh):
+    if openpyxl is None:
+        raise ValueError("Para importar XLSX hace falta instalar openpyxl.")
+    libro = openpyxl.load_workbook(fh, read_only=True, data_only=True)
+    try:
+        yield from libro.active.iter_rows(values_only=True)
+    finally:
+        libro.close()
+
+
+def leer_filas(fh, nombre_archivo: str):
+    """
+    Itera (numero_fila, dict campo → valor) del archivo. Los títulos se mapean con ALIAS.
+    """
+    filas = _leer_xlsx(fh) if nombre_archivo.lower().endswith(".xlsx") else _leer_csv(fh)
+    titulos = next(filas, None)
+    if not titulos:
+        return
+    columnas = [ALIAS.get(_clave(t)) for t in titulos]
+    if "nombre" not in columnas or "codigo_interno" not in columnas:
+        raise ValueError("El archivo necesita al menos las columnas 'nombre' y 'codigo_interno' (o 'sku').")
+    for n, valores in enumerate(filas, start=2):
+        fila = {}
+        for campo, valor in zip(columnas, valores):
+            if campo:
+                fila[campo] = valor
+        if any(v not in (None, "") for v in fila.values()):
+            yield n, fila
+
+
+# -----------------------------------------------------------
+# VALIDACIÓN
+# -----------------------------------------------------------
+def _limpiar(fila: dict) -> dict:
+    """
+    Devuelve los valores listos para Producto o lanza ValueError con el motivo.
+    """
+    datos = {}
+    for campo in CAMPOS:
+        if campo not in fila:
+            continue
+        valor = fila[campo]
+        if campo == "activo":
+            texto = str(valor).strip().lower() if valor is not None else ""
+            if texto in _VERDADERO or valor is True:
+                datos[campo] = True
+            elif texto in _FALSO or valor is False:
+                datos[campo] = False
+            elif texto:
+                raise ValueError(f"valor de 'activo' no reconocido: {valor!r}")
+            continue
+        if isinstance(valor, float) and valor.is_integer():
+            valor = int(valor)  # códigos numéricos leídos de Excel (ej. EAN)
+        texto = str(valor).strip() if valor is not None else ""
+        max_length = Producto._meta.get_field(campo).max_length
+        if len(texto) > max_length:
+            raise ValueError(f"'{campo}' supera {max_length} caracteres")
+        if texto:  # una celda vacía no borra lo que ya tiene el producto
+            datos[campo] = texto
+    if not datos.get("nombre"):
+        raise ValueError("sin nombre")
+    if not datos.get("codigo_interno"):
+        raise ValueError("sin código interno")
+    return datos
+
+
+# -----------------------------------------------------------
+# ESCRITURA
+# -----------------------------------------------------------
+def _escribir_bloque(bloque: dict, resultado: ResultadoImportacion) -> tuple[list, list]:
+    """
+    bloque: codigo_interno → datos.
+    Devuelve (códigos que necesitan embedding, productos en los que solo cambió activo).
+    """
+    existentes = Producto.objects.in_bulk(list(bloque), field_name="codigo_interno")
+    a_escribir, codigos_embedding, solo_activo = [], [], []
+    campos_actualizados = set()
+
+    for codigo, datos in bloque.items():
+        actual = existentes.get(codigo)
+        if actual is None:
+            resultado.insertados += 1
+            codigos_embedding.append(codigo)
+            a_escribir.append(Producto(**{"activo": True, **datos}))
+            continue
+        cambios = {c for c, v in datos.items() if getattr(actual, c) != v}
+        if not cambios:
+            resultado.sin_cambios += 1
+            continue
+        resultado.actualizados += 1
+        campos_actualizados |= cambios
+        if cambios & set(CAMPOS_EMBEDDING):
+            codigos_embedding.append(codigo)
+        elif "activo" in cambios:
+            solo_activo.append(actual)
+        for c, v in datos.items():
+            setattr(actual, c, v)
+        a_escribir.append(actual)
+
+    if a_escribir:
+        # ante un conflicto solo se pisan las columnas que cambiaron en el bloque
+        update_fields = sorted(campos_actualizados) or [c for c in CAMPOS if c != "codigo_interno"]
+        update_fields += [f"{c}_norm" for c in Producto.CAMPOS_CODIGO if c in update_fields]
+        filas = [Producto(**{c: getattr(p, c) for c in CAMPOS}) for p in a_escribir]
+        for p in filas:
+            p.normalizar_codigos()
+        Producto.objects.bulk_create(
+            filas,
+            update_conflicts=True,
+            unique_fields=["codigo_interno"],
+            update_fields=update_fields + ["actualizado"],
+        )
+    return codigos_embedding, solo_activo
+
+
+def _registrar_codigos_proveedor(bloque: dict, proveedor_id):
+    # (código de proveedor, producto) de cada fila, también las que no cambiaron
+    con_codigo = {c: d["codigo_proveedor"] for c, d in bloque.items() if d.get("codigo_proveedor")}
+    if not con_codigo:
+        return
+    ids = dict(
+        Producto.objects.filter(codigo_interno__in=list(con_codigo)).values_list("codigo_interno", "id")
+    )
+    codigos.registrar_codigos(proveedor_id, [(cod, ids.get(ci)) for ci, cod in con_codigo.items()])
+
+
+def importar_catalogo(fh, nombre_archivo: str, batch_size: int = 500,
+                      generar_embeddings: bool = True, proveedor=None) -> ResultadoImportacion:
+    """
+    Importa (inserta o actualiza por codigo_interno) los productos del archivo.
+    Cada bloque se guarda en su propia transacción.
+    proveedor: si la lista es de un proveedor, sus códigos (columna codigo_proveedor)
+    se guardan también en la tabla de códigos de ese proveedor.
+    """
+    resultado = ResultadoImportacion()
+    inicio = time.perf_counter()
+    codigos_embedding, solo_activo = [], []
+
+    def escribir(bloque):
+        with transaction.atomic():
+            codigos_bloque, activos = _escribir_bloque(bloque, resultado)
+            if proveedor is not None:
+                _registrar_codigos_proveedor(bloque, proveedor.pk)
+        codigos_embedding.extend(codigos_bloque)
+        solo_activo.extend(activos)
+
+    with embeddings_suspendidos():
+        bloque = {}
+        for n, fila in leer_filas(fh, nombre_archivo):
+            try:
+                datos = _limpiar(fila)
+            except ValueError as ex:
+                resultado._error(n, str(ex))
+                continue
+            if datos["codigo_interno"] in bloque:
+                resultado._error(n, f"código {datos['codigo_interno']} repetido en el archivo (se usa la última fila)")
+            bloque[datos["codigo_interno"]] = datos
+            if len(bloque) >= batch_size:
+                escribir(bloque)
+                bloque = {}
+        if bloque:
+            escribir(bloque)
+
+    if generar_embeddings and codigos_embedding:
+        productos = []
+        for start in range(0, len(codigos_embedding), batch_size):
+            productos += Producto.objects.filter(codigo_interno__in=codigos_embedding[start:start + batch_size])
+        resultado.embeddings = embedding_service.bulk_upsert(productos)
+    # activados / desactivados sin cambio de texto: solo el buscador en memoria
+    actualizar_en_buscador([(p, None) for p in solo_activo])
+    codigos.marcar_pendiente()  # bulk_create no dispara señales: el índice de códigos se relee
+
+    resultado.segundos = time.perf_counter() - inicio
+    print(f"📦 Importación de productos ({nombre_archivo}): {resultado.resumen()}")
+    return resultado
@@ -1,3 +1,393 @@
-from django.test import TestCase
+import io
+from datetime import date
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from invoices.models import EstadisticaPrecio, Factura, ItemFactura, ResumenProductoMes
+from invoices.services import precios, rollups
+from productos.models import CodigoProveedorProducto, Producto, ProductoEmbedding, embeddings_suspendidos
+from productos.services import codigos, duplicados
+from productos.services.importer import importar_catalogo
+from proveedores.models import Proveedor
+
+
+def _csv(texto: str):
+    return io.BytesIO(texto.encode("utf-8"))
+
+
+LISTA = """Código;Descripción;EAN;Cod. Proveedor;Rubro;Activo
+A-001;Coca Cola 1.5L;0779 0895;CC15;Gaseosas;si
+A-002;Fernet Branca 750ml;;FB750;Aperitivos;si
+A-003;Hielo 2kg;;;;no
+A-004;;;;;si
+A-002;Fernet Branca 750 ml;;FB750;Aperitivos;si
+"""
+
+
+class ImportarCatalogoTests(TestCase):
+    def _importar(self, texto, **kwargs):
+        kwargs.setdefault("generar_embeddings", False)
+        return importar_catalogo(_csv(texto), "lista.csv", batch_size=2, **kwargs)
+
+    def test_primera_importacion(self):
+        resultado = self._importar(LISTA)
+
+        self.assertEqual(
+            (resultado.insertados, resultado.actualizados, resultado.sin_cambios, resultado.omitidos),
+            (3, 1, 0, 1),  # fila sin nombre; A-002 se repite en el bloque siguiente: se actualiza
+        )
+        self.assertEqual(Producto.objects.get(codigo_interno="A-002").nombre, "Fernet Branca 750 ml")
+        coca = Producto.objects.get(codigo_interno="A-001")
+        self.assertEqual((coca.codigo_barras_norm, coca.categoria, coca.activo), ("7790895", "Gaseosas", True))
+        self.assertFalse(Producto.objects.get(codigo_interno="A-003").activo)
+        # la señal de embeddings no corre producto por producto
+        self.assertFalse(ProductoEmbedding.objects.exists())
+
+    def test_codigo_repetido_en_el_mismo_bloque(self):
+        resultado = importar_catalogo(_csv(LISTA), "lista.csv", generar_embeddings=False)
+
+        self.assertEqual((resultado.insertados, resultado.actualizados, resultado.omitidos), (3, 0, 2))
+        self.assertEqual([n for n, _ in resultado.errores], [5, 6])
+        self.assertEqual(Producto.objects.get(codigo_interno="A-002").nombre, "Fernet Branca 750 ml")
+
+    def test_reimportar_cuenta_cambios_y_sin_cambios(self):
+        self._importar(LISTA)
+        lista = (
+            "sku;nombre;activo\n"
+            "A-001;Coca Cola 1.5L;si\n"          # sin cambios
+            "A-002;Fernet Branca 1L;si\n"        # cambia el nombre → embedding
+            "A-003;Hielo 2kg;si\n"               # solo se activa
+            "A-005;Agua 2L;si\n"                 # nuevo
+        )
+        with mock.patch("productos.services.importer.embedding_service.bulk_upsert", return_value=2) as upsert:
+            resultado = self._importar(lista, generar_embeddings=True)
+
+        self.assertEqual(
+            (resultado.insertados, resultado.actualizados, resultado.sin_cambios, resultado.omitidos),
+            (1, 2, 1, 0),
+        )
+        self.assertEqual(sorted(p.codigo_interno for p in upsert.call_args.args[0]), ["A-002", "A-005"])
+        self.assertEqual(resultado.embeddings, 2)
+        self.assertTrue(Producto.objects.get(codigo_interno="A-003").activo)
+        self.assertEqual(Producto.objects.count(), 4)
+
+    def test_celdas_vacias_no_borran(self):
+        self._importar(LISTA)
+
+        resultado = self._importar("sku;nombre;ean\nA-001;Coca Cola 1.5L;\n")
+
+        self.assertEqual(resultado.sin_cambios, 1)
+        self.assertEqual(Producto.objects.get(codigo_interno="A-001").codigo_barras, "0779 0895")
+
+    def test_codigos_del_proveedor(self):
+        proveedor = Proveedor.objects.create(nombre="Distribuidora Norte")
+
+        self._importar(LISTA, proveedor=proveedor)
+
+        self.assertEqual(
+            dict(CodigoProveedorProducto.objects.filter(proveedor=proveedor)
+                 .values_list("codigo_norm", "producto__codigo_interno")),
+            {"CC15": "A-001", "FB750": "A-002"},
+        )
+
+    def test_faltan_columnas(self):
+        with self.assertRaises(ValueError):
+            self._importar("nombre;marca\nCoca;Coca-Cola\n")
+
+
+class CodigosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        with embeddings_suspendidos():
+            cls.coca = Producto.objects.create(
+                nombre="Coca Cola 1.5L", codigo_interno="A-001", codigo_barras="0779 0895",
+            )
+            cls.fernet = Producto.objects.create(
+                nombre="Fernet 750ml", codigo_interno="A-002", codigo_proveedor="fb.750",
+            )
+
+    def setUp(self):
+        codigos._state["cargado_en"] = 0.0  # el índice es del proceso: cada test lo carga de cero
+
+    def _crear(self, **campos):
+        with embeddings_suspendidos():
+            return Producto.objects.create(**campos)
+
+    def test_normalizar_codigo(self):
+        casos = {
+            "ab-00123 ": "AB00123",
+            "000123": "123",
+            "00-123 45": "12345",
+            "0000": "0",
+            "café.1": "CAFE1",
+            12345: "12345",
+            " - . ": None,
+            "": None,
+            None: None,
+        }
+        for codigo, esperado in casos.items():
+            self.assertEqual(codigos.normalizar_codigo(codigo), esperado, codigo)
+
+    def test_save_guarda_la_forma_normalizada(self):
+        self.assertEqual(
+            (self.coca.codigo_interno_norm, self.coca.codigo_barras_norm, self.coca.codigo_proveedor_norm),
+            ("A001", "7790895", None),
+        )
+
+    def test_resolver(self):
+        self.assertEqual(
+            codigos.resolver(["a001", "7790895", "FB-750", "000A-002", "nada", None, ""]),
+            [self.coca.pk, self.coca.pk, self.fernet.pk, self.fernet.pk, None, None, None],
+        )
+
+    def test_prioridad_y_empate(self):
+        # el mismo código como interno de uno y de barras de otro: gana el interno
+        self._crear(nombre="Otro", codigo_barras="A001")
+        # el mismo código de barras en dos productos: gana el de menor id
+        self._crear(nombre="Coca Cola 1.5L pack", codigo_barras="7790895")
+
+        self.assertEqual(codigos.resolver(["A001", "7790895"]), [self.coca.pk, self.coca.pk])
+
+    def test_cambios_del_proceso_se_ven_al_instante(self):
+        codigos.resolver(["A001"])  # carga el índice
+
+        nuevo = self._crear(nombre="Agua 2L", codigo_interno="A-005")
+        self.fernet.codigo_proveedor = "FB1000"
+        with embeddings_suspendidos():
+            self.fernet.save(update_fields=["codigo_proveedor"])
+        self.coca.delete()
+
+        self.assertEqual(
+            codigos.resolver(["A005", "FB1000", "FB750", "A001"]),
+            [nuevo.pk, self.fernet.pk, None, None],
+        )
+
+    def test_cambios_de_otros_procesos_por_marca_de_agua(self):
+        codigos.resolver(["A001"])
+        # UPDATE sin señales (como lo haría otro proceso o una importación masiva)
+        Producto.objects.filter(pk=self.fernet.pk).update(
+            codigo_barras="123", codigo_barras_norm="123", actualizado=timezone.now(),
+        )
+        Producto.objects.filter(pk=self.coca.pk).update(
+            codigo_interno=None, codigo_interno_norm=None, actualizado=timezone.now(),
+        )
+
+        with override_settings(CODIGOS_REFRESCO_SEGUNDOS=3600):
+            self.assertEqual(codigos.resolver(["123", "A001"]), [None, self.coca.pk])  # todavía no se releyó
+            codigos.marcar_pendiente()
+            self.assertEqual(codigos.resolver(["123", "A001"]), [self.fernet.pk, None])
+
+    @override_settings(CODIGOS_REFRESCO_SEGUNDOS=0)
+    def test_refresco_periodico(self):
+        codigos.resolver(["A001"])
+        Producto.objects.filter(pk=self.fernet.pk).update(
+            codigo_barras="456", codigo_barras_norm="456", actualizado=timezone.now(),
+        )
+
+        self.assertEqual(codigos.resolver(["456"]), [self.fernet.pk])
+
+
+class CodigosProveedorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.norte = Proveedor.objects.create(nombre="Distribuidora Norte")
+        cls.sur = Proveedor.objects.create(nombre="Bebidas Sur")
+        with embeddings_suspendidos():
+            cls.coca = Producto.objects.create(nombre="Coca Cola 1.5L")
+            cls.fernet = Producto.objects.create(nombre="Fernet 750ml")
+
+    def test_registrar_y_resolver_por_proveedor(self):
+        escritos = codigos.registrar_codigos(
+            self.norte.pk, [("cc-15", self.coca.pk), ("FB 750", self.fernet.pk), ("", self.coca.pk), ("X1", None)],
+        )
+        codigos.registrar_codigos(self.sur.pk, [("CC15", self.fernet.pk)])
+
+        self.assertEqual(escritos, 2)
+        self.assertEqual(
+            codigos.resolver_proveedor(self.norte.pk, ["CC15", "fb-750", "X1", None]),
+            [self.coca.pk, self.fernet.pk, None, None],
+        )
+        # el mismo código en otro proveedor es otro producto
+        self.assertEqual(codigos.resolver_proveedor(self.sur.pk, ["cc 15"]), [self.fernet.pk])
+        self.assertEqual(codigos.resolver_proveedor(None, ["CC15"]), [None])
+
+    def test_el_ultimo_producto_confirmado_gana(self):
+        codigos.registrar_codigos(self.norte.pk, [("CC15", self.coca.pk)])
+
+        codigos.registrar_codigos(self.norte.pk, [("cc-15", self.fernet.pk)])
+
+        fila = CodigoProveedorProducto.objects.get(proveedor=self.norte)
+        self.assertEqual((fila.producto_id, fila.codigo, fila.codigo_norm), (self.fernet.pk, "cc-15", "CC15"))
+
+
+@mock.patch("invoices.services.ia_helper.actualizar_en_buscador")
+@mock.patch("productos.models.embedding_service.ensure_embedding", return_value="vector")
+class EmbeddingSenalTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        with embeddings_suspendidos():
+            cls.coca = Producto.objects.create(nombre="Coca Cola 1.5L", marca="Coca-Cola", codigo_interno="A-001")
+
+    def _leer(self, *only):
+        qs = Producto.objects.only(*only) if only else Producto.objects
+        return qs.get(pk=self.coca.pk)
+
+    def test_producto_nuevo(self, ensure, buscador):
+        nuevo = Producto.objects.create(nombre="Fernet 750ml")
+
+        ensure.assert_called_once_with(nuevo)
+        buscador.assert_called_once_with([(nuevo, "vector")])
+
+    def test_cambio_de_texto(self, ensure, buscador):
+        producto = self._leer()
+        producto.marca = "Coca Cola"
+        producto.save()
+
+        self.assertEqual(producto._cambios, {"marca"})
+        ensure.assert_called_once_with(producto)
+
+    def test_solo_codigos_o_unidad_no_recalcula(self, ensure, buscador):
+        producto = self._leer()
+        producto.codigo_interno, producto.codigo_barras, producto.unidad_base = "A-100", "7790895", "un"
+        producto.save()
+
+        self.assertEqual(producto.campos_modificados(), set())
+        ensure.assert_not_called()
+        buscador.assert_not_called()
+
+    def test_solo_activo_actualiza_el_buscador(self, ensure, buscador):
+        producto = self._leer()
+        producto.activo = False
+        producto.save()
+
+        ensure.assert_not_called()
+        buscador.assert_called_once_with([(producto, None)])
+
+    def test_guardar_dos_veces(self, ensure, buscador):
+        producto = self._leer()
+        producto.nombre = "Coca Cola 1,5 L"
+        producto.save()
+        producto.save()  # el estado guardado pasó a ser el original
+
+        self.assertEqual(ensure.call_count, 1)
+
+    def test_update_fields_y_campos_diferidos(self, ensure, buscador):
+        producto = self._leer()
+        producto.nombre = "Coca Cola 2L"  # cambia en memoria pero no se guarda
+        producto.codigo_interno = "A-002"
+        producto.save(update_fields=["codigo_interno"])
+        ensure.assert_not_called()
+
+        diferido = self._leer("id", "codigo_barras")
+        self.assertEqual(diferido.campos_modificados(), set())
+        diferido.codigo_barras = "123"
+        diferido.save(update_fields=["codigo_barras"])
+
+        ensure.assert_not_called()
+        buscador.assert_not_called()
+        self.assertEqual(Producto.objects.get(pk=self.coca.pk).codigo_barras_norm, "123")
+
+
+class FusionarTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.norte = Proveedor.objects.create(nombre="Distribuidora Norte")
+        with embeddings_suspendidos():
+            cls.coca = Producto.objects.create(nombre="Coca Cola 1.5L", codigo_interno="A-001")
+            cls.copia = Producto.objects.create(nombre="Coca-Cola 1,5 L", codigo_barras="7790895")
+            cls.otra = Producto.objects.create(nombre="Coca 1.5", codigo_proveedor="CC15", codigo_barras="111")
+        with rollups.resumenes_suspendidos():
+            for fecha, producto, precio in (
+                (date(2025, 3, 5), cls.coca, 1000), (date(2025, 3, 20), cls.copia, 1100),
+                (date(2025, 3, 20), cls.otra, 1050), (date(2025, 4, 2), cls.copia, 1200),
+            ):
+                factura = Factura.objects.get_or_create(proveedor=cls.norte, fecha=fecha)[0]
+                ItemFactura.objects.create(factura=factura, producto=producto, cantidad=2, precio_unitario=precio,
+                                           importe=2 * precio, tipo_item="producto")
+        rollups.rebuild()
+        precios.rebuild()
+        codigos.registrar_codigos(cls.norte.pk, [("CC-15", cls.otra.pk)])
+
+    def test_fusionar(self):
+        with mock.patch("productos.services.duplicados.actualizar_en_buscador") as buscador, \
+                self.captureOnCommitCallbacks(execute=True):
+            movidos = duplicados.fusionar(self.coca, [self.coca, self.copia, self.otra])
+
+        self.assertEqual(movidos, 3)
+        self.assertEqual(set(ItemFactura.objects.values_list("producto_id", flat=True)), {self.coca.pk})
+        self.assertEqual(list(Producto.objects.values_list("pk", flat=True)), [self.coca.pk])
+        self.assertEqual(CodigoProveedorProducto.objects.get().producto_id, self.coca.pk)
+        # completa los códigos que le faltaban con el primer duplicado que los tiene
+        coca = Producto.objects.get(pk=self.coca.pk)
+        self.assertEqual((coca.codigo_interno, coca.codigo_proveedor, coca.codigo_barras), ("A-001", "CC15", "7790895"))
+        # los duplicados salen del buscador
+        self.assertEqual([(p.pk, p.activo, v) for p, v in buscador.call_args.args[0]],
+                         [(self.copia.pk, False, None), (self.otra.pk, False, None)])
+
+    def test_recalcula_resumenes_y_precios(self):
+        duplicados.fusionar(self.coca, [self.copia, self.otra])
+
+        self.assertEqual(
+            list(ResumenProductoMes.objects.order_by("mes")
+                 .values_list("producto_id", "mes", "facturas", "lineas", "importe")),
+            [(self.coca.pk, date(2025, 3, 1), 2, 3, Decimal("6300.00")),
+             (self.coca.pk, date(2025, 4, 1), 1, 1, Decimal("2400.00"))],
+        )
+        stats = EstadisticaPrecio.objects.get()
+        self.assertEqual((stats.producto_id, stats.muestras, stats.ultimo_precio), (self.coca.pk, 4, Decimal("1200")))
+        self.assertEqual(stats.mediana, Decimal("1075"))
+
+    def test_sin_duplicados(self):
+        self.assertEqual(duplicados.fusionar(self.coca, [self.coca]), 0)
+        self.assertEqual(Producto.objects.count(), 3)
+
+
+class ListadoProductosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        with embeddings_suspendidos():
+            Producto.objects.bulk_create(
+                [Producto(nombre=f"Producto {n:02d}", codigo_interno=f"P-{n:02d}") for n in range(28)]
+            )
+            cls.coca = Producto.objects.create(nombre="Coca Cola 1.5L", codigo_barras="7790895000010")
+            cls.agua = Producto.objects.create(nombre="Agua sin gas", codigo_proveedor="AG-2")
+        EstadisticaPrecio.objects.create(producto=cls.coca, ultimo_precio=Decimal("1500"),
+                                         ultima_fecha=date(2025, 3, 5), mediana=Decimal("1450"), muestras=4)
+        cls.user = User.objects.create_user("cajero", password="x")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def _pagina(self, **params):
+        response = self.client.get(reverse("productos_list"), params)
+        return response, [p.nombre for p in response.context["productos"]]
+
+    def test_paginas_por_nombre(self):
+        response, primera = self._pagina()
+        page = response.context["page_obj"]
+        siguiente, segunda = self._pagina(cursor=page.next_cursor)
+
+        self.assertEqual(len(primera), 25)
+        self.assertEqual(primera[:2], ["Agua sin gas", "Coca Cola 1.5L"])
+        self.assertEqual(segunda, [f"Producto {n:02d}" for n in range(23, 28)])
+        self.assertEqual(page.count, 30)
+        self.assertFalse(siguiente.context["page_obj"].has_next)
+
+    def test_busqueda_por_nombre_y_codigos(self):
+        casos = {"cola": ["Coca Cola 1.5L"], "779089": ["Coca Cola 1.5L"], "ag-": ["Agua sin gas"],
+                 "p-1": [f"Producto {n:02d}" for n in range(10, 20)], "0895": []}
+        for q, esperados in casos.items():
+            response, nombres = self._pagina(q=q)
+            self.assertEqual(nombres, esperados, q)
+            self.assertEqual(response.context["base_qs"], f"&q={q}")
+
+    def test_ultima_compra_del_historial(self):
+        response, _ = self._pagina(q="coca")
+
+        coca = response.context["productos"][0]
+        self.assertEqual((coca.ultima_compra, coca.ultimo_precio, coca.compras), (date(2025, 3, 5), Decimal("1500"), 4))
@@ -4,11 +4,15 @@ from .views import (
     ProductoCreateView,
     ProductoUpdateView,
     ProductoDeleteView,
+    ProductoImportView,
+    ProductoDuplicadosView,
 )
 
 urlpatterns = [
     path("", ProductoListView.as_view(), name="productos_list"),
     path("nuevo/", ProductoCreateView.as_view(), name="productos_create"),
+    path("importar/", ProductoImportView.as_view(), name="productos_import"),
+    path("duplicados/", ProductoDuplicadosView.as_view(), name="productos_duplicados"),
     path("<int:pk>/editar/", ProductoUpdateView.as_view(), name="productos_update"),
     path("<int:pk>/eliminar/", ProductoDeleteView.as_view(), name="productos_delete"),
 ]
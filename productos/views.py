@@ -1,13 +1,41 @@
-from django.views.generic import ListView, CreateView, UpdateView, DeleteView
-from django.urls import reverse_lazy
+from django.views.generic import ListView, CreateView, UpdateView, DeleteView, FormView, TemplateView
+from django.urls import reverse, reverse_lazy
+from django.shortcuts import redirect
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.conf import settings
+from django.db.models import Count, F, Q
+from invoices.services.pagination import KeysetListMixin, OrderKey
+from .forms import ImportarProductosForm
 from .models import Producto
+from .services.duplicados import fusionar, grupos_cacheados
+from .services.importer import importar_catalogo
 
-class ProductoListView(LoginRequiredMixin, ListView):
+class ProductoListView(LoginRequiredMixin, KeysetListMixin, ListView):
     model = Producto
     template_name = "productos/list.html"
     context_object_name = "productos"
+    paginate_by = 25
+    keyset_keys = [OrderKey("nombre"), OrderKey("id")]
+    count_cap = getattr(settings, "CATALOG_LIST_COUNT_CAP", 1000)
+
+    def get_queryset(self):
+        # última compra y precio salen del historial de precios (una fila por producto, un JOIN)
+        qs = Producto.objects.annotate(
+            ultima_compra=F("estadistica_precio__ultima_fecha"),
+            ultimo_precio=F("estadistica_precio__ultimo_precio"),
+            compras=F("estadistica_precio__muestras"),
+        )
+        q = (self.request.GET.get("q") or "").strip()
+        if q:
+            # nombre: contiene; códigos: empieza con (índices en la migración 0004)
+            qs = qs.filter(
+                Q(nombre__icontains=q) |
+                Q(codigo_interno__istartswith=q) |
+                Q(codigo_proveedor__istartswith=q) |
+                Q(codigo_barras__istartswith=q)
+            )
+        return qs
 
 class ProductoCreateView(LoginRequiredMixin,CreateView):
     model = Producto
@@ -52,3 +80,68 @@ class ProductoDeleteView(LoginRequiredMixin, DeleteView):
     def delete(self, request, *args, **kwargs):
         messages.success(request, "Producto eliminado correctamente.")
         return super().delete(request, *args, **kwargs)
+
+
+class ProductoImportView(LoginRequiredMixin, FormView):
+    form_class = ImportarProductosForm
+    template_name = "productos/import.html"
+
+    def form_valid(self, form):
+        archivo = form.cleaned_data["archivo"]
+        try:
+            resultado = importar_catalogo(archivo.file, archivo.name, proveedor=form.cleaned_data["proveedor"])
+        except ValueError as ex:
+            form.add_error("archivo", str(ex))
+            return self.form_invalid(form)
+        messages.success(self.request, f"Importación terminada: {resultado.resumen()}")
+        return self.render_to_response(self.get_context_data(form=self.form_class(), resultado=resultado))
+
+
+class ProductoDuplicadosView(LoginRequiredMixin, TemplateView):
+    """
+    Reporte de grupos de productos casi duplicados (por embeddings) y fusión de
+    un grupo: se elige el producto que queda y cuáles se fusionan en él.
+    """
+    template_name = "productos/duplicados.html"
+
+    def _umbral(self):
+        try:
+            return float(self.request.GET.get("umbral") or settings.DUPLICADOS_UMBRAL)
+        except ValueError:
+            return settings.DUPLICADOS_UMBRAL
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        umbral = self._umbral()
+        grupos = grupos_cacheados(umbral=umbral)
+        mostrados = grupos[:settings.DUPLICADOS_MAX_GRUPOS]
+
+        productos = Producto.objects.annotate(lineas=Count("itemfactura")).in_bulk(
+            [pid for g in mostrados for pid in g.ids]
+        )
+        filas = []
+        for g in mostrados:
+            miembros = [productos[pid] for pid in g.ids if pid in productos]
+            if len(miembros) < 2:
+                continue
+            # por defecto queda el más usado en facturas
+            destino = max(miembros, key=lambda p: (p.lineas, -p.id))
+            filas.append({"similitud": g.similitud, "productos": miembros, "destino": destino})
+
+        context.update(grupos=filas, total_grupos=len(grupos), umbral=umbral)
+        return context
+
+    def post(self, request, *args, **kwargs):
+        destino_id = request.POST.get("destino") or ""
+        destino = Producto.objects.filter(pk=int(destino_id)).first() if destino_id.isdigit() else None
+        ids = [int(i) for i in request.POST.getlist("duplicados") if i.isdigit()]
+        duplicados = list(Producto.objects.filter(pk__in=ids).exclude(pk=getattr(destino, "pk", None)))
+        if destino is None or not duplicados:
+            messages.error(request, "Elegí el producto que queda y al menos otro para fusionar.")
+        else:
+            movidos = fusionar(destino, duplicados)
+            messages.success(
+                request,
+                f"Se fusionaron {len(duplicados)} productos en '{destino.nombre}' ({movidos} ítems de factura).",
+            )
+        return redirect(f"{reverse('productos_duplicados')}?umbral={self._umbral()}")
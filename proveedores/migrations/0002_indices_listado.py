@@ -0,0 +1,65 @@
+# Generated by Django 5.2.5 on 2026-10-19 17:16
+# + índices para la búsqueda del listado de proveedores (dependen del motor):
+#   SQLite → id_fiscal con COLLATE NOCASE (LIKE 'abc%');
+#   PostgreSQL → trigramas sobre UPPER(nombre) (icontains) y text_pattern_ops sobre
+#   UPPER(id_fiscal) (istartswith).
+
+from django.db import migrations, models
+
+SQLITE_CREATE = [
+    "CREATE INDEX IF NOT EXISTS proveedores_proveedor_id_fiscal_nocase ON proveedores_proveedor (id_fiscal COLLATE NOCASE)",
+]
+SQLITE_DROP = ["DROP INDEX IF EXISTS proveedores_proveedor_id_fiscal_nocase"]
+
+POSTGRES_CREATE = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    CREATE INDEX IF NOT EXISTS proveedores_proveedor_nombre_trgm
+    ON proveedores_proveedor USING GIN (UPPER(nombre::text) gin_trgm_ops)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS proveedores_proveedor_id_fiscal_upper
+    ON proveedores_proveedor (UPPER(id_fiscal::text) text_pattern_ops)
+    """,
+]
+POSTGRES_DROP = [
+    "DROP INDEX IF EXISTS proveedores_proveedor_nombre_trgm",
+    "DROP INDEX IF EXISTS proveedores_proveedor_id_fiscal_upper",
+]
+
+
+def _run(schema_editor, statements):
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def crear_indices(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        _run(schema_editor, SQLITE_CREATE)
+    elif vendor == "postgresql":
+        _run(schema_editor, POSTGRES_CREATE)
+
+
+def borrar_indices(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        _run(schema_editor, SQLITE_DROP)
+    elif vendor == "postgresql":
+        _run(schema_editor, POSTGRES_DROP)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0008_estadisticaprecio'),
+        ('proveedores', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='proveedor',
+            index=models.Index(fields=['nombre', 'id'], name='proveedores_nombre_59d1f6_idx'),
+        ),
+        migrations.RunPython(crear_indices, borrar_indices),
+    ]
@@ -16,6 +16,9 @@ class Proveedor(models.Model):
         verbose_name_plural = "Proveedores"
         unique_together = [("nombre", "id_fiscal")]
         ordering = ["nombre"]
+        indexes = [
+            models.Index(fields=["nombre", "id"]),  # orden del listado (paginación por cursor)
+        ]
 
     def __str__(self):
         return f"{self.nombre} ({self.id_fiscal or 's/ID'})"
@@ -1,3 +1,45 @@
+from datetime import date
+
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.urls import reverse
+
+from invoices.models import Factura
+from proveedores.models import Proveedor
+
+
+class ListadoProveedoresTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Proveedor.objects.bulk_create([Proveedor(nombre=f"Proveedor {n:02d}") for n in range(26)])
+        cls.norte = Proveedor.objects.create(nombre="Distribuidora Norte", id_fiscal="30712345679")
+        for fecha in (date(2025, 3, 1), date(2025, 4, 2), None):
+            Factura.objects.create(proveedor=cls.norte, fecha=fecha)
+        cls.user = User.objects.create_user("cajero", password="x")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def _pagina(self, **params):
+        response = self.client.get(reverse("proveedores_list"), params)
+        return response, list(response.context["proveedores"])
+
+    def test_paginas_por_nombre(self):
+        response, primera = self._pagina()
+        _, segunda = self._pagina(cursor=response.context["page_obj"].next_cursor)
+
+        self.assertEqual([p.nombre for p in primera][:2], ["Distribuidora Norte", "Proveedor 00"])
+        self.assertEqual([p.nombre for p in segunda], ["Proveedor 24", "Proveedor 25"])
+        self.assertEqual(response.context["page_obj"].count, 27)
+
+    def test_facturas_y_ultima_fecha(self):
+        _, proveedores = self._pagina(q="norte")
+
+        norte, = proveedores
+        self.assertEqual((norte.cantidad_facturas, norte.ultima_factura), (3, date(2025, 4, 2)))
+        _, otros = self._pagina(q="proveedor 01")
+        self.assertEqual([(p.cantidad_facturas, p.ultima_factura) for p in otros], [(None, None)])
 
-# Create your tests here.
+    def test_busqueda_por_cuit(self):
+        self.assertEqual([p.pk for p in self._pagina(q="307123")[1]], [self.norte.pk])
+        self.assertEqual(self._pagina(q="712345")[1], [])
@@ -2,12 +2,31 @@ from django.views.generic import ListView, CreateView, UpdateView, DeleteView
 from django.urls import reverse_lazy
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
-from invoices.models import Proveedor
+from django.conf import settings
+from django.db.models import Count, Max, OuterRef, Q, Subquery
+from invoices.models import Factura, Proveedor
+from invoices.services.pagination import KeysetListMixin, OrderKey
 
-class ProveedorListView(LoginRequiredMixin, ListView):
+class ProveedorListView(LoginRequiredMixin, KeysetListMixin, ListView):
     model = Proveedor
     template_name = "proveedores/list.html"
     context_object_name = "proveedores"
+    paginate_by = 25
+    keyset_keys = [OrderKey("nombre"), OrderKey("id")]
+    count_cap = getattr(settings, "CATALOG_LIST_COUNT_CAP", 1000)
+
+    def get_queryset(self):
+        # subconsultas correlacionadas: se calculan solo para las filas de la página
+        por_proveedor = Factura.objects.filter(proveedor=OuterRef("pk")).order_by().values("proveedor")
+        qs = Proveedor.objects.select_related("condicion_iva").annotate(
+            cantidad_facturas=Subquery(por_proveedor.annotate(n=Count("id")).values("n")),
+            ultima_factura=Subquery(por_proveedor.annotate(f=Max("fecha")).values("f")),
+        )
+        q = (self.request.GET.get("q") or "").strip()
+        if q:
+            # nombre: contiene; CUIT: empieza con (índices en la migración 0002)
+            qs = qs.filter(Q(nombre__icontains=q) | Q(id_fiscal__istartswith=q))
+        return qs
 
 class ProveedorCreateView(LoginRequiredMixin, CreateView):
     model = Proveedor